@@ -0,0 +1,217 @@
+"""Route connections over multiple Bluetooth adapters."""
+
+from __future__ import annotations
+
+import asyncio
+import dataclasses
+import re
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Iterable
+
+from bleak.backends.device import BLEDevice
+
+from .const import (
+    DEFAULT_ADAPTER_FAILURE_PENALTY,
+    DEFAULT_ADAPTER_MAX_CONNECTIONS,
+    DEFAULT_RSSI_MAX_AGE,
+)
+
+# BlueZ device paths look like `/org/bluez/hci0/dev_AA_BB_CC_DD_EE_FF`
+_ADAPTER_PATH = re.compile(r"^/org/bluez/(?P<adapter>[^/]+)/")
+
+# Weight of the latest outcome in the failure rate
+_FAILURE_RATE_ALPHA = 0.3
+
+# Used when an adapter has seen the device, but the RSSI is unknown
+_UNKNOWN_RSSI = -127
+
+
+def adapter_from_device(ble_device: BLEDevice) -> str | None:
+    """Get the adapter a device was seen by, if known."""
+    details = ble_device.details
+    if isinstance(details, dict):
+        if isinstance(source := details.get("source"), str) and source:
+            return source
+        if isinstance(path := details.get("path"), str) and (
+            match := _ADAPTER_PATH.match(path)
+        ):
+            return match.group("adapter")
+    return None
+
+
+@dataclasses.dataclass
+class LinkState:
+    """What an adapter knows about a device."""
+
+    ble_device: BLEDevice
+    rssi: int = _UNKNOWN_RSSI
+    last_seen: float = 0.0
+    failure_rate: float = 0.0
+
+
+@dataclasses.dataclass
+class AdapterState:
+    """Connection state of an adapter."""
+
+    # Connections being made or kept open, including pooled connections
+    in_flight: int = 0
+    connections: int = 0
+    failures: int = 0
+    failure_rate: float = 0.0
+
+
+class AdapterBalancer:
+    """Route each connection to the best adapter that has a free slot.
+
+    The adapters report the devices they see with `observe`. A connection goes
+    to the adapter with the best score, which is the recent RSSI minus a
+    penalty for the failure rate of that link. Each adapter is limited to
+    `max_connections` connections at the same time.
+
+    `acquire` holds a slot for a single connection. A `ConnectionPool` holds
+    the slot of a pooled connection with `try_reserve` until it closes it.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = DEFAULT_ADAPTER_MAX_CONNECTIONS,
+        rssi_max_age: float = DEFAULT_RSSI_MAX_AGE,
+        failure_penalty: float = DEFAULT_ADAPTER_FAILURE_PENALTY,
+    ) -> None:
+        self.max_connections = max_connections
+        self.rssi_max_age = rssi_max_age
+        self.failure_penalty = failure_penalty
+        self.adapters: dict[str, AdapterState] = {}
+        self._links: dict[str, dict[str, LinkState]] = {}
+        self._slot_released = asyncio.Event()
+
+    def observe(
+        self, ble_device: BLEDevice, rssi: int | None, adapter: str | None = None
+    ) -> None:
+        """Record that an adapter has seen the device."""
+        if adapter is None and (adapter := adapter_from_device(ble_device)) is None:
+            return
+        self.adapters.setdefault(adapter, AdapterState())
+        links = self._links.setdefault(ble_device.address, {})
+        if (link := links.get(adapter)) is None:
+            link = links[adapter] = LinkState(ble_device=ble_device)
+        link.ble_device = ble_device
+        link.rssi = _UNKNOWN_RSSI if rssi is None else rssi
+        link.last_seen = time.monotonic()
+
+    def links(self, address: str) -> dict[str, LinkState]:
+        """Get the adapters that have recently seen the device."""
+        now = time.monotonic()
+        return {
+            adapter: link
+            for adapter, link in self._links.get(address, {}).items()
+            if now - link.last_seen <= self.rssi_max_age
+        }
+
+    def _score(self, link: LinkState) -> float:
+        return link.rssi - link.failure_rate * self.failure_penalty
+
+    def candidates(self, ble_device: BLEDevice) -> set[str]:
+        """Get the adapters the device can be routed to."""
+        if links := self.links(ble_device.address):
+            return set(links)
+        adapter = adapter_from_device(ble_device)
+        return set() if adapter is None else {adapter}
+
+    def _select(
+        self, ble_device: BLEDevice, held: str | None = None
+    ) -> tuple[str | None, BLEDevice] | None:
+        """Select the best adapter with a free slot, None if all are busy."""
+        candidates = sorted(
+            self.links(ble_device.address).items(),
+            key=lambda item: self._score(item[1]),
+            reverse=True,
+        )
+        if not candidates:
+            if (adapter := adapter_from_device(ble_device)) is None:
+                # Nothing is known about the adapters, connect as is
+                return None, ble_device
+            self.adapters.setdefault(adapter, AdapterState())
+            candidates = [(adapter, LinkState(ble_device=ble_device))]
+
+        for adapter, link in candidates:
+            if (
+                adapter == held
+                or self.adapters[adapter].in_flight < self.max_connections
+            ):
+                return adapter, link.ble_device
+        return None
+
+    def try_reserve(
+        self, ble_device: BLEDevice, held: str | None = None
+    ) -> tuple[str | None, BLEDevice] | None:
+        """Reserve a slot on the best adapter for the device, None if all are busy.
+
+        `held` is the adapter of a connection that is already open to the
+        device, which keeps its slot if that adapter is still the best. Returns
+        the adapter, None if unknown, and the BLEDevice as seen by it. The slot
+        must be given back with `release`.
+        """
+        if (selection := self._select(ble_device, held)) is None:
+            return None
+        adapter = selection[0]
+        if adapter is not None and adapter != held:
+            self.adapters[adapter].in_flight += 1
+        return selection
+
+    def release(self, adapter: str) -> None:
+        """Give back a slot reserved with `try_reserve`."""
+        self.adapters[adapter].in_flight -= 1
+        self._slot_released.set()
+        self._slot_released = asyncio.Event()
+
+    @property
+    def slot_released(self) -> asyncio.Event:
+        """Event that is set when a slot is released after this call."""
+        return self._slot_released
+
+    @asynccontextmanager
+    async def acquire(self, ble_device: BLEDevice) -> AsyncIterator[BLEDevice]:
+        """Reserve a slot on the best adapter for the device.
+
+        Yields the BLEDevice as seen by the selected adapter, and waits if all
+        adapters that see the device are busy.
+        """
+        while (selection := self.try_reserve(ble_device)) is None:
+            await self._slot_released.wait()
+        adapter, target = selection
+
+        failed = True
+        try:
+            yield target
+            failed = False
+        except asyncio.CancelledError:
+            failed = False
+            raise
+        finally:
+            if adapter is not None:
+                self.record(adapter, ble_device.address, failed)
+                self.release(adapter)
+
+    def record(self, adapter: str, address: str, failed: bool) -> None:
+        """Record the outcome of a connection."""
+        state = self.adapters[adapter]
+        state.connections += 1
+        outcome = 1.0 if failed else 0.0
+        if failed:
+            state.failures += 1
+        state.failure_rate += _FAILURE_RATE_ALPHA * (outcome - state.failure_rate)
+        if (link := self._links.get(address, {}).get(adapter)) is not None:
+            link.failure_rate += _FAILURE_RATE_ALPHA * (outcome - link.failure_rate)
+
+    def adapters_for(self, addresses: Iterable[str]) -> dict[str, str | None]:
+        """Get the adapter each device would currently be routed to."""
+        result: dict[str, str | None] = {}
+        for address in addresses:
+            scores = {
+                adapter: self._score(link)
+                for adapter, link in self.links(address).items()
+            }
+            result[address] = max(scores, key=scores.__getitem__, default=None)
+        return result
@@ -0,0 +1,166 @@
+"""Order and admit connections by signal strength and past success."""
+
+from __future__ import annotations
+
+import dataclasses
+import time
+from typing import Iterable, NamedTuple
+
+from bleak.backends.device import BLEDevice
+from bleak.backends.scanner import AdvertisementData
+
+from .const import (
+    DEFAULT_ADAPTER_FAILURE_PENALTY,
+    DEFAULT_ADMISSION_MAX_DEFERRAL,
+    DEFAULT_ADMISSION_MIN_RSSI,
+    DEFAULT_ADMISSION_MIN_SUCCESS_RATE,
+    DEFAULT_ADMISSION_RETRY_DELAY,
+    DEFAULT_RSSI_MAX_AGE,
+)
+
+# Weight of the latest outcome in the success rate and update duration
+_OUTCOME_ALPHA = 0.3
+
+# Used to order devices without a recent RSSI
+_UNKNOWN_RSSI = -127
+
+
+# pylint: disable=too-many-instance-attributes
+@dataclasses.dataclass
+class LinkRecord:
+    """What is known about the link to a device.
+
+    All times are monotonic.
+    """
+
+    rssi: int | None = None
+    rssi_time: float = 0.0
+    # Exponentially weighted, new devices are assumed to succeed
+    success_rate: float = 1.0
+    duration: float | None = None
+    attempts: int = 0
+    last_attempt: float | None = None
+    retry_at: float | None = None
+    retry_delay: float = 0.0
+
+
+class AdmissionPlan(NamedTuple):
+    """The devices to connect to in this cycle, best first, and the rest."""
+
+    admitted: list[str]
+    deferred: list[str]
+
+
+# pylint: disable=too-many-arguments,too-many-positional-arguments
+class ConnectionAdmission:
+    """Decide which devices are worth a connection, and in what order.
+
+    The RSSI of each device is reported with `observe`, and the outcome of
+    every update with `record`. A device with a recent RSSI below `min_rssi`
+    is deferred until its signal improves. A device whose success rate falls
+    below `min_success_rate` is deferred for a delay that doubles with every
+    failure, up to `max_deferral`. A weak device is still tried once every
+    `max_deferral` seconds, so it keeps its history up to date.
+
+    The admitted devices are ordered by RSSI minus a penalty for the failure
+    rate, so a queue of connections is not held up behind a bad link.
+    """
+
+    def __init__(
+        self,
+        min_rssi: float = DEFAULT_ADMISSION_MIN_RSSI,
+        min_success_rate: float = DEFAULT_ADMISSION_MIN_SUCCESS_RATE,
+        retry_delay: float = DEFAULT_ADMISSION_RETRY_DELAY,
+        max_deferral: float = DEFAULT_ADMISSION_MAX_DEFERRAL,
+        rssi_max_age: float = DEFAULT_RSSI_MAX_AGE,
+        failure_penalty: float = DEFAULT_ADAPTER_FAILURE_PENALTY,
+    ) -> None:
+        self.min_rssi = min_rssi
+        self.min_success_rate = min_success_rate
+        self.retry_delay = retry_delay
+        self.max_deferral = max_deferral
+        self.rssi_max_age = rssi_max_age
+        self.failure_penalty = failure_penalty
+        self.links: dict[str, LinkRecord] = {}
+
+    def _link(self, address: str) -> LinkRecord:
+        if (link := self.links.get(address)) is None:
+            link = self.links[address] = LinkRecord()
+        return link
+
+    def observe(self, address: str, rssi: int, now: float | None = None) -> None:
+        """Record the RSSI a device was seen with."""
+        link = self._link(address)
+        link.rssi = rssi
+        link.rssi_time = time.monotonic() if now is None else now
+
+    def observe_advertisement(
+        self, ble_device: BLEDevice, advertisement_data: AdvertisementData
+    ) -> None:
+        """Report an advertisement, usable as a BleakScanner detection callback."""
+        self.observe(ble_device.address, advertisement_data.rssi)
+
+    def record(
+        self,
+        address: str,
+        success: bool,
+        duration: float | None = None,
+        now: float | None = None,
+    ) -> None:
+        """Record the outcome of an update and how long it took."""
+        now = time.monotonic() if now is None else now
+        link = self._link(address)
+        link.attempts += 1
+        link.last_attempt = now
+        link.success_rate += _OUTCOME_ALPHA * (float(success) - link.success_rate)
+        if success and duration is not None:
+            link.duration = (
+                duration
+                if link.duration is None
+                else link.duration + _OUTCOME_ALPHA * (duration - link.duration)
+            )
+        if success or link.success_rate >= self.min_success_rate:
+            link.retry_at = None
+            link.retry_delay = 0.0
+            return
+        link.retry_delay = min(
+            self.max_deferral, max(self.retry_delay, link.retry_delay * 2)
+        )
+        link.retry_at = now + link.retry_delay
+
+    def _recent_rssi(self, link: LinkRecord, now: float) -> int | None:
+        if link.rssi is None or now - link.rssi_time > self.rssi_max_age:
+            return None
+        return link.rssi
+
+    def admit(self, address: str, now: float | None = None) -> bool:
+        """Check if a connection to the device is worth trying now."""
+        now = time.monotonic() if now is None else now
+        if (link := self.links.get(address)) is None:
+            return True
+        if link.retry_at is not None and now < link.retry_at:
+            return False
+        rssi = self._recent_rssi(link, now)
+        if rssi is None or rssi >= self.min_rssi:
+            return True
+        return link.last_attempt is None or now - link.last_attempt >= self.max_deferral
+
+    def score(self, address: str, now: float | None = None) -> float:
+        """Get the score the devices are ordered by, higher is better."""
+        now = time.monotonic() if now is None else now
+        if (link := self.links.get(address)) is None:
+            return _UNKNOWN_RSSI
+        rssi = self._recent_rssi(link, now)
+        return (_UNKNOWN_RSSI if rssi is None else rssi) - (
+            1 - link.success_rate
+        ) * self.failure_penalty
+
+    def plan(self, addresses: Iterable[str], now: float | None = None) -> AdmissionPlan:
+        """Split devices into the ones to connect to, best first, and the rest."""
+        now = time.monotonic() if now is None else now
+        admitted: list[str] = []
+        deferred: list[str] = []
+        for address in addresses:
+            (admitted if self.admit(address, now) else deferred).append(address)
+        admitted.sort(key=lambda x: self.score(x, now), reverse=True)
+        return AdmissionPlan(admitted, deferred)
@@ -0,0 +1,68 @@
+"""Identify Airthings devices from their BLE advertisements."""
+
+from __future__ import annotations
+
+import dataclasses
+import re
+from typing import Mapping
+
+from .const import MFCT_ID
+from .device_type import AirthingsDeviceType
+
+# Wave Gen 1 advertises names like `AT#123456-2900Radon`
+_NAME_PATTERN = re.compile(r"^AT#(?P<identifier>[0-9]{6})-(?P<model>[0-9]{4})")
+
+
+@dataclasses.dataclass(frozen=True)
+class AirthingsAdvertisement:
+    """Device information found in an advertisement, before connecting."""
+
+    model: AirthingsDeviceType
+    model_raw: str
+    identifier: str = ""
+    name: str = ""
+
+    @property
+    def is_supported(self) -> bool:
+        """Check if the advertised model is supported."""
+        return self.model != AirthingsDeviceType.UNKNOWN
+
+
+def _model_from_raw_value(value: str) -> AirthingsDeviceType:
+    # Avoid from_raw_value, it overwrites the raw value of the UNKNOWN member
+    try:
+        return AirthingsDeviceType(value)
+    except ValueError:
+        return AirthingsDeviceType.UNKNOWN
+
+
+def parse_advertisement(
+    name: str | None, manufacturer_data: Mapping[int, bytes] | None = None
+) -> AirthingsAdvertisement | None:
+    """Get the model and identifier from the advertised name or manufacturer data.
+
+    The Airthings manufacturer data starts with the serial number as a little
+    endian 32 bit integer, and the first four digits of the serial number are
+    the model number. Returns None if the model cannot be determined.
+    """
+    name = name or ""
+    if (match := _NAME_PATTERN.match(name)) is not None:
+        model_raw = match.group("model")
+        return AirthingsAdvertisement(
+            model=_model_from_raw_value(model_raw),
+            model_raw=model_raw,
+            identifier=match.group("identifier"),
+            name=name,
+        )
+
+    if manufacturer_data and len(data := manufacturer_data.get(MFCT_ID, b"")) >= 4:
+        serial_number = str(int.from_bytes(data[0:4], "little"))
+        if len(serial_number) == 10:
+            model_raw = serial_number[0:4]
+            return AirthingsAdvertisement(
+                model=_model_from_raw_value(model_raw),
+                model_raw=model_raw,
+                identifier=serial_number,
+            )
+
+    return None
@@ -0,0 +1,205 @@
+"""Rolling aggregates of the sensor values of each device."""
+
+from __future__ import annotations
+
+import dataclasses
+import math
+import time
+from array import array
+from collections import deque
+from typing import TYPE_CHECKING, Iterable
+
+from .const import (
+    CO2,
+    DEFAULT_AGGREGATE_CAPACITY,
+    DEFAULT_AGGREGATE_WINDOWS,
+    HUMIDITY,
+    TEMPERATURE,
+    VOC,
+)
+
+if TYPE_CHECKING:
+    from .parser import AirthingsDevice
+
+DEFAULT_AGGREGATE_SENSORS = (CO2, VOC, TEMPERATURE, HUMIDITY)
+
+
+@dataclasses.dataclass(frozen=True)
+class Aggregate:
+    """Aggregate of the values of a sensor in a window."""
+
+    minimum: float
+    maximum: float
+    mean: float
+    count: int
+
+
+# pylint: disable=too-few-public-methods
+class _Window:
+    """Running state of the values in one time window of a series.
+
+    The window holds the values with sequence numbers from `start` up to the
+    latest value. `minima` and `maxima` are monotonic queues of sequence
+    numbers, so the extremes are always at the front.
+    """
+
+    __slots__ = ("length", "start", "count", "total", "minima", "maxima")
+
+    def __init__(self, length: float) -> None:
+        self.length = length
+        self.start = 0
+        self.count = 0
+        self.total = 0.0
+        self.minima: deque[int] = deque()
+        self.maxima: deque[int] = deque()
+
+
+class SensorSeries:
+    """Ring buffer of the latest values of a sensor.
+
+    Appending a value and getting the aggregate of a window both take
+    amortized constant time. When the buffer is full, the oldest value is
+    dropped from all windows.
+    """
+
+    def __init__(self, windows: Iterable[float], capacity: int) -> None:
+        if capacity < 1:
+            raise ValueError("The capacity must be at least 1")
+        self.capacity = capacity
+        self._times = array("d", bytes(8 * capacity))
+        self._values = array("d", bytes(8 * capacity))
+        # Sequence number of the next value
+        self._next = 0
+        self._windows = {length: _Window(length) for length in windows}
+
+    def __len__(self) -> int:
+        return min(self._next, self.capacity)
+
+    def _value(self, seq: int) -> float:
+        return self._values[seq % self.capacity]
+
+    def append(self, timestamp: float, value: float) -> None:
+        """Add a value, which must not be older than the previous one."""
+        seq = self._next
+        if seq >= self.capacity:
+            # The slot of the oldest value is about to be overwritten
+            oldest = seq - self.capacity
+            for window in self._windows.values():
+                if window.count and window.start == oldest:
+                    self._remove_oldest(window)
+
+        slot = seq % self.capacity
+        self._times[slot] = timestamp
+        self._values[slot] = value
+        self._next = seq + 1
+
+        for window in self._windows.values():
+            window.count += 1
+            window.total += value
+            minima = window.minima
+            while minima and self._value(minima[-1]) >= value:
+                minima.pop()
+            minima.append(seq)
+            maxima = window.maxima
+            while maxima and self._value(maxima[-1]) <= value:
+                maxima.pop()
+            maxima.append(seq)
+        self._expire(timestamp)
+
+    def _remove_oldest(self, window: _Window) -> None:
+        seq = window.start
+        window.total -= self._value(seq)
+        window.count -= 1
+        window.start += 1
+        if window.minima and window.minima[0] == seq:
+            window.minima.popleft()
+        if window.maxima and window.maxima[0] == seq:
+            window.maxima.popleft()
+        if not window.count:
+            # Avoid drifting away from zero
+            window.total = 0.0
+
+    def _expire(self, now: float) -> None:
+        for window in self._windows.values():
+            cutoff = now - window.length
+            while window.count and self._times[window.start % self.capacity] <= cutoff:
+                self._remove_oldest(window)
+
+    def aggregate(self, window: float, now: float | None = None) -> Aggregate | None:
+        """Get the aggregate of the values in the window ending at `now`."""
+        self._expire(time.time() if now is None else now)
+        state = self._windows[window]
+        if not state.count:
+            return None
+        return Aggregate(
+            minimum=self._value(state.minima[0]),
+            maximum=self._value(state.maxima[0]),
+            mean=state.total / state.count,
+            count=state.count,
+        )
+
+
+class RollingAggregator:
+    """Minimum, maximum and mean of sensor values over rolling time windows.
+
+    Readings are added with `add`, which can be registered as a listener with
+    `AirthingsBluetoothDeviceData.add_listener`. Only numeric values of the
+    selected sensors are kept, in a fixed size buffer per sensor and device.
+    """
+
+    def __init__(
+        self,
+        sensors: Iterable[str] = DEFAULT_AGGREGATE_SENSORS,
+        windows: Iterable[float] = DEFAULT_AGGREGATE_WINDOWS,
+        capacity: int = DEFAULT_AGGREGATE_CAPACITY,
+    ) -> None:
+        self.sensors = tuple(sensors)
+        self.windows = tuple(windows)
+        self.capacity = capacity
+        self._series: dict[str, dict[str, SensorSeries]] = {}
+
+    def add(self, device: AirthingsDevice, timestamp: float | None = None) -> None:
+        """Add the sensor values of a reading."""
+        now = time.time() if timestamp is None else timestamp
+        series = self._series.setdefault(device.address, {})
+        for sensor in self.sensors:
+            value = device.sensors.get(sensor)
+            if (
+                not isinstance(value, (int, float))
+                or isinstance(value, bool)
+                or math.isnan(value)
+            ):
+                continue
+            if (sensor_series := series.get(sensor)) is None:
+                sensor_series = series[sensor] = SensorSeries(
+                    self.windows, self.capacity
+                )
+            sensor_series.append(now, float(value))
+
+    def aggregate(
+        self, address: str, sensor: str, window: float, now: float | None = None
+    ) -> Aggregate | None:
+        """Get the aggregate of a sensor of a device, None if there are no values."""
+        if (series := self._series.get(address, {}).get(sensor)) is None:
+            return None
+        return series.aggregate(window, now)
+
+    def aggregates(
+        self, address: str, now: float | None = None
+    ) -> dict[str, dict[float, Aggregate]]:
+        """Get the aggregates of all sensors and windows of a device."""
+        now = time.time() if now is None else now
+        result: dict[str, dict[float, Aggregate]] = {}
+        for sensor, series in self._series.get(address, {}).items():
+            windows = {
+                window: aggregate
+                for window in self.windows
+                if (aggregate := series.aggregate(window, now)) is not None
+            }
+            if windows:
+                result[sensor] = windows
+        return result
+
+    def remove(self, address: str) -> None:
+        """Forget the values of a device."""
+        self._series.pop(address, None)
@@ -0,0 +1,116 @@
+"""Account for the time and traffic spent on the connections to each device."""
+
+from __future__ import annotations
+
+import dataclasses
+from typing import Any, Callable, cast
+
+from bleak import BleakClient
+
+# Called with the UUID of the characteristic and the raw data of each read
+# and notification
+FrameListener = Callable[[str, bytes], None]
+
+
+def _uuid_of(char_specifier: Any) -> str:
+    return str(getattr(char_specifier, "uuid", char_specifier))
+
+
+# pylint: disable=too-many-instance-attributes
+@dataclasses.dataclass
+class AirtimeStats:
+    """Connection time and GATT traffic with a device.
+
+    `connections` counts the sessions with the device, including the ones that
+    reused a pooled connection, which take almost no setup time.
+    """
+
+    connections: int = 0
+    connect_seconds: float = 0.0
+    connected_seconds: float = 0.0
+    reads: int = 0
+    writes: int = 0
+    notifications: int = 0
+    bytes_read: int = 0
+    bytes_written: int = 0
+    bytes_notified: int = 0
+
+    @property
+    def payload_bytes(self) -> int:
+        """Bytes moved in both directions."""
+        return self.bytes_read + self.bytes_written + self.bytes_notified
+
+    def add(self, other: AirtimeStats) -> None:
+        """Add the values of another instance to this one."""
+        for field in dataclasses.fields(self):
+            setattr(
+                self, field.name, getattr(self, field.name) + getattr(other, field.name)
+            )
+
+
+class _MeteredClient:
+    """Forward calls to a client, counting the GATT traffic."""
+
+    def __init__(
+        self,
+        client: BleakClient,
+        stats: AirtimeStats,
+        frame_listener: FrameListener | None,
+    ) -> None:
+        self._client = client
+        self._stats = stats
+        self._frame_listener = frame_listener
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._client, name)
+
+    async def read_gatt_char(
+        self, char_specifier: Any, *args: Any, **kwargs: Any
+    ) -> bytearray:
+        """Read a characteristic."""
+        data = await self._client.read_gatt_char(char_specifier, *args, **kwargs)
+        self._stats.reads += 1
+        self._stats.bytes_read += len(data)
+        if self._frame_listener is not None:
+            self._frame_listener(_uuid_of(char_specifier), bytes(data))
+        return data
+
+    async def write_gatt_char(
+        self, char_specifier: Any, data: bytes | bytearray, *args: Any, **kwargs: Any
+    ) -> None:
+        """Write a characteristic."""
+        await self._client.write_gatt_char(char_specifier, data, *args, **kwargs)
+        self._stats.writes += 1
+        self._stats.bytes_written += len(data)
+
+    async def start_notify(
+        self,
+        char_specifier: Any,
+        callback: Callable[[Any, bytearray], None],
+        **kwargs: Any,
+    ) -> None:
+        """Start notifications, counting each one before calling `callback`."""
+        stats = self._stats
+        frame_listener = self._frame_listener
+        uuid = _uuid_of(char_specifier)
+
+        def _count(sender: Any, data: bytearray) -> None:
+            stats.notifications += 1
+            stats.bytes_notified += len(data)
+            if frame_listener is not None:
+                frame_listener(uuid, bytes(data))
+            callback(sender, data)
+
+        await self._client.start_notify(char_specifier, _count, **kwargs)
+
+
+def metered_client(
+    client: BleakClient,
+    stats: AirtimeStats,
+    frame_listener: FrameListener | None = None,
+) -> BleakClient:
+    """Wrap a client to count its reads, writes and notifications in `stats`.
+
+    `frame_listener` also gets the raw data of each read and notification.
+    """
+    return cast(BleakClient, _MeteredClient(client, stats, frame_listener))
@@ -0,0 +1,252 @@
+"""Export readings and raw frames as Apache Arrow record batches and Parquet files.
+
+Requires pyarrow, installed with the `arrow` extra.
+"""
+
+from __future__ import annotations
+
+import math
+import time
+from typing import TYPE_CHECKING, Any, Iterable, Iterator
+
+from .const import DEFAULT_EXPORT_CHUNK_SIZE, NUMERIC_SENSORS
+
+if TYPE_CHECKING:
+    from .parser import AirthingsDevice
+
+
+def _pyarrow() -> Any:
+    try:
+        # pylint: disable=import-outside-toplevel,import-error
+        import pyarrow
+    except ImportError as err:
+        raise ImportError(
+            "The Arrow export requires pyarrow, install airthings-ble[arrow]"
+        ) from err
+    return pyarrow
+
+
+def _parquet() -> Any:
+    _pyarrow()
+    # pylint: disable=import-outside-toplevel,import-error
+    import pyarrow.parquet
+
+    return pyarrow.parquet
+
+
+def _float_or_none(value: object) -> float | None:
+    if not isinstance(value, (int, float)) or isinstance(value, bool):
+        return None
+    return None if math.isnan(value) else float(value)
+
+
+def readings_schema(sensors: Iterable[str] = NUMERIC_SENSORS) -> Any:
+    """Get the schema of the readings: device columns, a timestamp and the sensors.
+
+    The address and model are dictionary encoded, so they are stored once per
+    chunk instead of once per row.
+    """
+    pa = _pyarrow()
+    device_type = pa.dictionary(pa.int32(), pa.string())
+    return pa.schema(
+        [
+            pa.field("address", device_type, nullable=False),
+            pa.field("model", device_type, nullable=False),
+            pa.field("timestamp", pa.timestamp("ms", tz="UTC"), nullable=False),
+            pa.field("partial", pa.bool_(), nullable=False),
+            *(pa.field(sensor, pa.float64()) for sensor in sensors),
+        ]
+    )
+
+
+class _ReadingColumns:
+    """Readings buffered as Python lists, one per column."""
+
+    def __init__(self, sensors: tuple[str, ...]) -> None:
+        self.sensors = sensors
+        self.addresses: list[str] = []
+        self.models: list[str] = []
+        self.timestamps: list[int] = []
+        self.partial: list[bool] = []
+        self.values: list[list[float | None]] = [[] for _ in sensors]
+
+    def __len__(self) -> int:
+        return len(self.addresses)
+
+    def add(self, device: AirthingsDevice, timestamp: float | None) -> None:
+        """Buffer a reading."""
+        self.addresses.append(device.address)
+        self.models.append(device.model.name)
+        if timestamp is None:
+            timestamp = device.read_time or time.time()
+        self.timestamps.append(round(timestamp * 1000))
+        self.partial.append(device.partial)
+        sensors = device.sensors
+        for sensor, column in zip(self.sensors, self.values):
+            column.append(_float_or_none(sensors.get(sensor)))
+
+    def to_record_batch(self, schema: Any) -> Any:
+        """Convert the buffered readings to a record batch."""
+        pa = _pyarrow()
+        arrays = [
+            pa.array(self.addresses, pa.string()).dictionary_encode(),
+            pa.array(self.models, pa.string()).dictionary_encode(),
+            pa.array(self.timestamps, pa.timestamp("ms", tz="UTC")),
+            pa.array(self.partial, pa.bool_()),
+            *(pa.array(column, pa.float64()) for column in self.values),
+        ]
+        return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def record_batches(
+    devices: Iterable[AirthingsDevice],
+    sensors: Iterable[str] = NUMERIC_SENSORS,
+    chunk_size: int = DEFAULT_EXPORT_CHUNK_SIZE,
+) -> Iterator[Any]:
+    """Convert readings to record batches of up to `chunk_size` rows.
+
+    The readings are consumed lazily, so only one chunk is held in memory.
+    Each reading is timestamped with the time its sensors were read.
+    """
+    sensors = tuple(sensors)
+    schema = readings_schema(sensors)
+    columns = _ReadingColumns(sensors)
+    for device in devices:
+        columns.add(device, None)
+        if len(columns) >= chunk_size:
+            yield columns.to_record_batch(schema)
+            columns = _ReadingColumns(sensors)
+    if len(columns) > 0:
+        yield columns.to_record_batch(schema)
+
+
+def write_parquet(
+    path: str,
+    devices: Iterable[AirthingsDevice],
+    sensors: Iterable[str] = NUMERIC_SENSORS,
+    chunk_size: int = DEFAULT_EXPORT_CHUNK_SIZE,
+) -> int:
+    """Write readings to a Parquet file, a row group per chunk.
+
+    Returns the number of rows written.
+    """
+    sensors = tuple(sensors)
+    rows = 0
+    with _parquet().ParquetWriter(path, readings_schema(sensors)) as writer:
+        for batch in record_batches(devices, sensors, chunk_size):
+            writer.write_batch(batch)
+            rows += batch.num_rows
+    return rows
+
+
+class ParquetSink:
+    """Write readings to a Parquet file as they arrive.
+
+    Readings are added with `add`, which can be registered as a listener with
+    `AirthingsBluetoothDeviceData.add_listener`. A row group is written every
+    `chunk_size` readings, and `close` writes the rest and the file footer.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        sensors: Iterable[str] = NUMERIC_SENSORS,
+        chunk_size: int = DEFAULT_EXPORT_CHUNK_SIZE,
+    ) -> None:
+        self.sensors = tuple(sensors)
+        self.chunk_size = chunk_size
+        self.rows = 0
+        self._schema = readings_schema(self.sensors)
+        self._writer = _parquet().ParquetWriter(path, self._schema)
+        self._columns = _ReadingColumns(self.sensors)
+
+    def add(self, device: AirthingsDevice, timestamp: float | None = None) -> None:
+        """Buffer a reading."""
+        self._columns.add(device, timestamp)
+        if len(self._columns) >= self.chunk_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """Write the buffered readings as a row group."""
+        if len(self._columns) == 0:
+            return
+        batch = self._columns.to_record_batch(self._schema)
+        self._columns = _ReadingColumns(self.sensors)
+        self._writer.write_batch(batch)
+        self.rows += batch.num_rows
+
+    def close(self) -> None:
+        """Write the buffered readings and finish the file."""
+        try:
+            self.flush()
+        finally:
+            self._writer.close()
+
+
+class FrameRecorder:
+    """Keep the raw data read from devices, to export it for analysis.
+
+    Frames are added with `add`, which can be registered with
+    `AirthingsBluetoothDeviceData.add_frame_listener`. The frames can be
+    decoded again later, for example with the decoders in SENSOR_DECODERS.
+    """
+
+    def __init__(self) -> None:
+        self._addresses: list[str] = []
+        self._characteristics: list[str] = []
+        self._timestamps: list[int] = []
+        self._data: list[bytes] = []
+
+    def clear(self) -> None:
+        """Forget the recorded frames."""
+        self._addresses.clear()
+        self._characteristics.clear()
+        self._timestamps.clear()
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def add(
+        self,
+        address: str,
+        characteristic: str,
+        data: bytes,
+        timestamp: float | None = None,
+    ) -> None:
+        """Record a frame."""
+        self._addresses.append(address)
+        self._characteristics.append(characteristic)
+        self._timestamps.append(
+            round((time.time() if timestamp is None else timestamp) * 1000)
+        )
+        self._data.append(bytes(data))
+
+    @staticmethod
+    def schema() -> Any:
+        """Get the schema of the recorded frames."""
+        pa = _pyarrow()
+        text_type = pa.dictionary(pa.int32(), pa.string())
+        return pa.schema(
+            [
+                pa.field("address", text_type, nullable=False),
+                pa.field("characteristic", text_type, nullable=False),
+                pa.field("timestamp", pa.timestamp("ms", tz="UTC"), nullable=False),
+                pa.field("data", pa.binary(), nullable=False),
+            ]
+        )
+
+    def to_record_batch(self) -> Any:
+        """Get the recorded frames as a record batch, and forget them."""
+        pa = _pyarrow()
+        batch = pa.RecordBatch.from_arrays(
+            [
+                pa.array(self._addresses, pa.string()).dictionary_encode(),
+                pa.array(self._characteristics, pa.string()).dictionary_encode(),
+                pa.array(self._timestamps, pa.timestamp("ms", tz="UTC")),
+                pa.array(self._data, pa.binary()),
+            ],
+            schema=self.schema(),
+        )
+        self.clear()
+        return batch
@@ -0,0 +1,136 @@
+"""Framing of Airthings BLE Atom responses received over notifications."""
+
+ATOM_RESPONSE_HEADER = bytes.fromhex("1001000345")
+# Response header followed by the two random bytes echoed from the request
+ATOM_RESPONSE_HEADER_LENGTH = len(ATOM_RESPONSE_HEADER) + 2
+
+_INDEFINITE = -1
+_BREAK = 0xFF
+
+
+class CborItemScanner:
+    """Find the end of a CBOR data item while its bytes are arriving.
+
+    The scanner only walks the CBOR headers, it does not decode any values. The
+    position is kept between calls, so every byte is only looked at once no
+    matter how many fragments the item is split into.
+    """
+
+    def __init__(self, offset: int = 0) -> None:
+        self.position = offset
+        self.complete = False
+        # Number of items left at each nesting level, -1 for indefinite length
+        self._remaining: list[int] = [1]
+
+    def feed(self, buffer: bytes | bytearray) -> bool:
+        """Scan the newly available bytes, returns True once the item is complete."""
+        length = len(buffer)
+        while not self.complete:
+            position = self.position
+            if position >= length:
+                return False
+
+            initial = buffer[position]
+            if initial == _BREAK:
+                if self._remaining[-1] != _INDEFINITE:
+                    raise ValueError("Unexpected CBOR break")
+                self.position += 1
+                self._remaining.pop()
+                self._item_done()
+                continue
+
+            major_type = initial >> 5
+            info = initial & 0x1F
+            argument: int | None
+            if info < 24:
+                argument, header_size = info, 1
+            elif info < 28:
+                size = 1 << (info - 24)
+                if position + 1 + size > length:
+                    return False
+                argument = int.from_bytes(buffer[position + 1 : position + 1 + size])
+                header_size = 1 + size
+            elif info == 31 and major_type in (2, 3, 4, 5):
+                argument, header_size = None, 1
+            else:
+                raise ValueError(f"Invalid CBOR initial byte {initial:#04x}")
+
+            if major_type in (2, 3):
+                if argument is None:
+                    # Indefinite length string, chunks follow until a break
+                    self.position += header_size
+                    self._remaining.append(_INDEFINITE)
+                    continue
+                if position + header_size + argument > length:
+                    return False
+                self.position += header_size + argument
+                self._item_done()
+            elif major_type in (4, 5):
+                self.position += header_size
+                if argument is None:
+                    self._remaining.append(_INDEFINITE)
+                elif argument == 0:
+                    self._item_done()
+                else:
+                    self._remaining.append(argument * (2 if major_type == 5 else 1))
+            elif major_type == 6:
+                # A tag is followed by the tagged item, which completes it
+                self.position += header_size
+            else:
+                self.position += header_size
+                self._item_done()
+        return True
+
+    def _item_done(self) -> None:
+        while self._remaining:
+            if self._remaining[-1] == _INDEFINITE:
+                return
+            self._remaining[-1] -= 1
+            if self._remaining[-1] > 0:
+                return
+            self._remaining.pop()
+        self.complete = True
+
+
+class AtomFrameAssembler:
+    """Reassemble an Atom response from notification fragments.
+
+    The response starts with a fixed header and the random bytes from the
+    request, followed by a single CBOR item. The frame is complete once that
+    item is complete.
+    """
+
+    def __init__(self) -> None:
+        self.buffer = bytearray()
+        self._scanner = CborItemScanner(offset=ATOM_RESPONSE_HEADER_LENGTH)
+        self._invalid = False
+
+    @property
+    def complete(self) -> bool:
+        """Return True if the full frame has been received."""
+        return self._invalid or self._scanner.complete
+
+    @property
+    def frame_length(self) -> int | None:
+        """Return the length of the frame, if it is complete."""
+        if self._scanner.complete:
+            return self._scanner.position
+        return None
+
+    def feed(self, data: bytes | bytearray) -> bool:
+        """Add a fragment, returns True once the frame is complete."""
+        if self.complete:
+            return True
+        self.buffer += data
+        if len(self.buffer) < len(ATOM_RESPONSE_HEADER):
+            return False
+        if not self.buffer.startswith(ATOM_RESPONSE_HEADER):
+            # Not an Atom response. Stop waiting, the response parser will
+            # report the invalid header.
+            self._invalid = True
+            return True
+        try:
+            return self._scanner.feed(self.buffer)
+        except ValueError:
+            self._invalid = True
+            return True
@@ -1,6 +1,7 @@
 from logging import Logger
 
 import cbor2
+from airthings_ble.atom.frame import ATOM_RESPONSE_HEADER
 from airthings_ble.atom.request import AtomRequestPath
 from airthings_ble.connectivity_mode import AirthingsConnectivityMode
 from airthings_ble.const import CONNECTIVITY_MODE
@@ -9,7 +10,7 @@ from airthings_ble.const import CONNECTIVITY_MODE
 class AtomResponse:
     """Response for Airthings BLE Atom API"""
 
-    _header = bytearray.fromhex("1001000345")
+    _header = ATOM_RESPONSE_HEADER
     response: bytes
     random_bytes: bytes
     path: AtomRequestPath
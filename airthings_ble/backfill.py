@@ -0,0 +1,291 @@
+"""Decode stored raw frames again, split over a pool of processes."""
+
+from __future__ import annotations
+
+import heapq
+import itertools
+import logging
+import math
+import multiprocessing
+import os
+import struct
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from logging import Logger
+from typing import Callable, Iterable, Mapping, NamedTuple
+
+from .atom.frame import AtomFrameAssembler
+from .command_decode import COMMAND_DECODERS
+from .const import (
+    COMMAND_UUID_ATOM_NOTIFY,
+    DEFAULT_BACKFILL_SESSION_GAP,
+    DEFAULT_BACKFILL_WINDOW,
+)
+from .device_type import AirthingsDeviceType
+from .parser import AirthingsBluetoothDeviceData, AirthingsDevice
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class StoredFrame(NamedTuple):
+    """Raw data read from, or notified by, a characteristic of a device."""
+
+    address: str
+    characteristic: str
+    data: bytes
+    timestamp: float
+
+
+class BackfillTask(NamedTuple):
+    """The readings of a device that start with `start <= timestamp < end`."""
+
+    address: str
+    start: float
+    end: float
+
+
+# Loads the frames of a task. It runs in the worker processes, so it must be
+# picklable, for example a function defined at module level.
+FrameLoader = Callable[[str, float, float], Iterable[StoredFrame]]
+# Receives the backfilled readings, with the time they were read.
+ReadingSink = Callable[[AirthingsDevice, float], None]
+
+
+def plan_backfill(
+    spans: Mapping[str, tuple[float, float]],
+    window: float = DEFAULT_BACKFILL_WINDOW,
+) -> list[BackfillTask]:
+    """Split the frames of each device into tasks of `window` seconds.
+
+    `spans` has the time of the first and last frame of each device. The
+    windows are aligned to multiples of `window`, so the tasks of different
+    devices cover the same time ranges. A reading belongs to the window its
+    first frame is in, even when its other frames are in the next one. The
+    tasks are ordered by time.
+    """
+    tasks: list[BackfillTask] = []
+    for address, (first, last) in spans.items():
+        start = math.floor(first / window) * window
+        while start <= last:
+            tasks.append(BackfillTask(address, start, start + window))
+            start += window
+    tasks.sort(key=lambda x: (x.start, x.address))
+    return tasks
+
+
+class _DeviceFrames:
+    """Reassembles the messages of a device into readings."""
+
+    def __init__(self, address: str, model: AirthingsDeviceType) -> None:
+        self.address = address
+        self.model = model
+        self.reading: AirthingsDevice | None = None
+        # The readings, with the time of their first frame
+        self.readings: list[tuple[float, AirthingsDevice]] = []
+        self.last_frame = -math.inf
+        self.commands: dict[str, bytearray] = {}
+        self.atom = AtomFrameAssembler()
+
+    def reading_for(self, timestamp: float, session_gap: float) -> AirthingsDevice:
+        """Get the reading a frame belongs to, a new one after a gap."""
+        if self.reading is None or timestamp - self.last_frame >= session_gap:
+            self.reading = AirthingsDevice(address=self.address, model=self.model)
+            self.readings.append((timestamp, self.reading))
+            # The fragments of the previous session can no longer be completed
+            self.commands.clear()
+            self.atom = AtomFrameAssembler()
+        self.last_frame = timestamp
+        return self.reading
+
+    def command_message(self, characteristic: str, data: bytes) -> bytearray | None:
+        """Add a command response fragment, returns the message once complete."""
+        message = self.commands.setdefault(characteristic, bytearray())
+        message += data
+        if len(message) < COMMAND_DECODERS[characteristic].message_size:
+            return None
+        return self.commands.pop(characteristic)
+
+    def atom_message(self, data: bytes) -> bytearray | None:
+        """Add an Atom response fragment, returns the message once complete."""
+        if not self.atom.feed(data):
+            return None
+        message = self.atom.buffer
+        self.atom = AtomFrameAssembler()
+        return message
+
+
+def _frame_message(state: _DeviceFrames, frame: StoredFrame) -> bytes | None:
+    """Add a frame to its message, returns the message once complete."""
+    characteristic = frame.characteristic
+    if characteristic in COMMAND_DECODERS:
+        message = state.command_message(characteristic, frame.data)
+    elif characteristic == str(COMMAND_UUID_ATOM_NOTIFY):
+        message = state.atom_message(frame.data)
+    else:
+        return frame.data
+    return None if message is None else bytes(message)
+
+
+def decode_frames(
+    frames: Iterable[StoredFrame],
+    models: Mapping[str, AirthingsDeviceType] | None = None,
+    is_metric: bool = True,
+    session_gap: float = DEFAULT_BACKFILL_SESSION_GAP,
+    logger: Logger = _LOGGER,
+) -> list[AirthingsDevice]:
+    """Decode frames into readings with the decoders of the parser.
+
+    The frames of a device less than `session_gap` seconds apart are one
+    reading, and each value is timestamped with the time of its frame. The
+    model of each device in `models` is used to convert the battery voltage.
+    Frames that cannot be decoded are logged and skipped. The readings are
+    ordered by the time they were read.
+    """
+    return [
+        device
+        for _, device in _decode_sessions(
+            frames, models or {}, is_metric, session_gap, logger
+        )
+    ]
+
+
+def _decode_sessions(
+    frames: Iterable[StoredFrame],
+    models: Mapping[str, AirthingsDeviceType],
+    is_metric: bool,
+    session_gap: float,
+    logger: Logger,
+) -> list[tuple[float, AirthingsDevice]]:
+    """Decode frames into readings, with the time of their first frame."""
+    parser = AirthingsBluetoothDeviceData(logger, is_metric=is_metric)
+    devices: dict[str, _DeviceFrames] = {}
+    for frame in sorted(frames, key=lambda x: x.timestamp):
+        if (state := devices.get(frame.address)) is None:
+            state = devices[frame.address] = _DeviceFrames(
+                frame.address, models.get(frame.address, AirthingsDeviceType.UNKNOWN)
+            )
+        device = state.reading_for(frame.timestamp, session_gap)
+        try:
+            if (message := _frame_message(state, frame)) is None:
+                continue
+            values = parser.decode_message(device, frame.characteristic, message)
+        except (ValueError, KeyError, IndexError, struct.error) as err:
+            logger.debug(
+                "Failed to decode frame of %s from %s: %s",
+                frame.characteristic,
+                frame.address,
+                err,
+            )
+            continue
+        device.sensors.update(values)
+        device.sensor_timestamps.update(dict.fromkeys(values, frame.timestamp))
+    readings = [x for state in devices.values() for x in state.readings if x[1].sensors]
+    readings.sort(key=lambda x: _reading_order(x[1]))
+    return readings
+
+
+def _reading_order(device: AirthingsDevice) -> tuple[float, str]:
+    return (device.read_time or 0.0, device.address)
+
+
+def _decode_task(
+    load_frames: FrameLoader,
+    task: BackfillTask,
+    model: AirthingsDeviceType,
+    is_metric: bool,
+    session_gap: float,
+) -> list[AirthingsDevice]:
+    """Load and decode the frames of a task, in a worker process."""
+    frames = _load_task_frames(load_frames, task, session_gap)
+    return [
+        device
+        for start, device in _decode_sessions(
+            frames, {task.address: model}, is_metric, session_gap, _LOGGER
+        )
+        if task.start <= start < task.end
+    ]
+
+
+def _load_task_frames(
+    load_frames: FrameLoader, task: BackfillTask, session_gap: float
+) -> list[StoredFrame]:
+    """Load the frames of the readings that start in the window of a task.
+
+    The frames up to `session_gap` before the window show if the first
+    reading started in the previous window. After the window, frames are
+    loaded until there is a gap, so the last reading is complete.
+    """
+    frames = list(load_frames(task.address, task.start - session_gap, task.end))
+    end = task.end
+    last = max((x.timestamp for x in frames), default=-math.inf)
+    while end - last < session_gap:
+        more = list(load_frames(task.address, end, end + session_gap))
+        end += session_gap
+        if not more:
+            break
+        frames.extend(more)
+        last = max(x.timestamp for x in more)
+    return frames
+
+
+def _drain(window: list[Future[list[AirthingsDevice]]], sink: ReadingSink) -> int:
+    """Pass the readings of a window to the sink, in time order."""
+    count = 0
+    for device in heapq.merge(*(x.result() for x in window), key=_reading_order):
+        sink(device, device.read_time or 0.0)
+        count += 1
+    return count
+
+
+# pylint: disable=too-many-arguments,too-many-positional-arguments
+def backfill(
+    load_frames: FrameLoader,
+    tasks: Iterable[BackfillTask],
+    sink: ReadingSink,
+    models: Mapping[str, AirthingsDeviceType] | None = None,
+    is_metric: bool = True,
+    workers: int | None = None,
+    session_gap: float = DEFAULT_BACKFILL_SESSION_GAP,
+) -> int:
+    """Decode the frames of the tasks in worker processes.
+
+    The tasks with the same start form a window. The windows are decoded in
+    parallel, a few ahead of the one being written, and the readings of each
+    window are merged into time order before they are passed to the sink.
+    The sink can be the `add` method of `SQLiteSink` or `ParquetSink`, so
+    the results of a decoder fix replace the stored readings.
+
+    Returns the number of readings passed to the sink.
+    """
+    models = models or {}
+    workers = workers or os.cpu_count() or 1
+    ordered = sorted(tasks, key=lambda x: (x.start, x.address))
+    pending: deque[list[Future[list[AirthingsDevice]]]] = deque()
+    in_flight = count = 0
+    executor = ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+    )
+    try:
+        for _, window_tasks in itertools.groupby(ordered, key=lambda x: x.start):
+            window = [
+                executor.submit(
+                    _decode_task,
+                    load_frames,
+                    task,
+                    models.get(task.address, AirthingsDeviceType.UNKNOWN),
+                    is_metric,
+                    session_gap,
+                )
+                for task in window_tasks
+            ]
+            pending.append(window)
+            in_flight += len(window)
+            # Keep the workers busy without holding every result in memory
+            while in_flight - len(pending[0]) >= 2 * workers:
+                in_flight -= len(pending[0])
+                count += _drain(pending.popleft(), sink)
+        while pending:
+            count += _drain(pending.popleft(), sink)
+    finally:
+        executor.shutdown(cancel_futures=True)
+    return count
@@ -0,0 +1,446 @@
+"""Poll many devices from several worker processes."""
+
+from __future__ import annotations
+
+import asyncio
+import dataclasses
+import logging
+import multiprocessing
+import os
+import struct
+import time
+import zlib
+from multiprocessing.connection import Connection
+from typing import TYPE_CHECKING, Any, Callable, Iterable, Mapping
+
+from .admission import ConnectionAdmission
+from .const import (
+    ACCELEROMETER,
+    CONNECTIVITY_MODE,
+    DEFAULT_ADAPTER_MAX_CONNECTIONS,
+    DEFAULT_ADMISSION_MIN_RSSI,
+    DEFAULT_COLLECT_INTERVAL,
+    DEFAULT_COLLECT_SCAN_TIMEOUT,
+    DEFAULT_RSSI_MAX_AGE,
+    DEFAULT_WORKER_MAX_RESTART_DELAY,
+    DEFAULT_WORKER_RESTART_DELAY,
+    NUMERIC_SENSORS,
+    RADON_1DAY_LEVEL,
+    RADON_LONGTERM_LEVEL,
+    RADON_MONTH_LEVEL,
+    RADON_WEEK_LEVEL,
+    RADON_YEAR_LEVEL,
+)
+from .scanner import AirthingsScanner, ScannedDevice
+
+if TYPE_CHECKING:
+    from .parser import AirthingsDevice
+
+_LOGGER = logging.getLogger(__name__)
+
+# Sensor names sent as a single byte, other names are sent in full. The order
+# is part of the wire format between the workers and the collector.
+_SENSOR_KEYS = NUMERIC_SENSORS + (
+    ACCELEROMETER,
+    CONNECTIVITY_MODE,
+    RADON_1DAY_LEVEL,
+    RADON_WEEK_LEVEL,
+    RADON_MONTH_LEVEL,
+    RADON_YEAR_LEVEL,
+    RADON_LONGTERM_LEVEL,
+)
+_SENSOR_INDEX = {name: index for index, name in enumerate(_SENSOR_KEYS)}
+_INLINE_KEY = 0xFF
+
+# Kind, timestamp and length of the address
+_RECORD_HEADER = struct.Struct("<BdB")
+_KIND_READING = 0
+_KIND_ERROR = 1
+
+_TYPE_FLOAT = 0
+_TYPE_STR = 1
+_TYPE_NONE = 2
+_DOUBLE = struct.Struct("<d")
+_UINT8 = struct.Struct("<B")
+_UINT16 = struct.Struct("<H")
+
+
+@dataclasses.dataclass(frozen=True)
+class CollectedReading:
+    """Reading, or error, received from a collector worker."""
+
+    address: str
+    timestamp: float
+    sensors: dict[str, str | float | None]
+    error: str | None = None
+    shard: int | None = None
+
+
+def _pack_str(value: str) -> bytes:
+    data = value.encode()
+    return _UINT16.pack(len(data)) + data
+
+
+def encode_reading(device: AirthingsDevice, timestamp: float) -> bytes:
+    """Encode the sensor values of a reading for the collector channel."""
+    parts = [
+        _RECORD_HEADER.pack(_KIND_READING, timestamp, len(device.address.encode())),
+        device.address.encode(),
+        struct.pack("<B", len(device.sensors)),
+    ]
+    for name, value in device.sensors.items():
+        if (key := _SENSOR_INDEX.get(name)) is not None:
+            parts.append(struct.pack("<B", key))
+        else:
+            parts.append(struct.pack("<B", _INLINE_KEY) + _pack_str(name))
+        if value is None:
+            parts.append(struct.pack("<B", _TYPE_NONE))
+        elif isinstance(value, str):
+            parts.append(struct.pack("<B", _TYPE_STR) + _pack_str(value))
+        else:
+            parts.append(struct.pack("<B", _TYPE_FLOAT) + _DOUBLE.pack(value))
+    return b"".join(parts)
+
+
+def encode_error(address: str, timestamp: float, error: str) -> bytes:
+    """Encode a failed update for the collector channel."""
+    return (
+        _RECORD_HEADER.pack(_KIND_ERROR, timestamp, len(address.encode()))
+        + address.encode()
+        + _pack_str(error)
+    )
+
+
+class _RecordReader:
+    """Read the fields of a record in order."""
+
+    def __init__(self, data: bytes) -> None:
+        self.data = data
+        self.offset = 0
+
+    def unpack(self, fmt: struct.Struct) -> tuple[Any, ...]:
+        """Unpack the next fields."""
+        values = fmt.unpack_from(self.data, self.offset)
+        self.offset += fmt.size
+        return values
+
+    def integer(self, fmt: struct.Struct = _UINT8) -> int:
+        """Read an unsigned integer."""
+        return int(self.unpack(fmt)[0])
+
+    def string(self) -> str:
+        """Read a string prefixed with its length."""
+        return self.raw_string(self.integer(_UINT16))
+
+    def raw_string(self, length: int) -> str:
+        """Read a string of `length` bytes."""
+        end = self.offset + length
+        if end > len(self.data):
+            raise IndexError("Record is truncated")
+        value = self.data[self.offset : end].decode()
+        self.offset = end
+        return value
+
+
+def decode_record(data: bytes, shard: int | None = None) -> CollectedReading:
+    """Decode a record sent by a collector worker."""
+    reader = _RecordReader(data)
+    kind, timestamp, address_length = reader.unpack(_RECORD_HEADER)
+    address = reader.raw_string(address_length)
+    if kind == _KIND_ERROR:
+        return CollectedReading(
+            address=address,
+            timestamp=timestamp,
+            sensors={},
+            error=reader.string(),
+            shard=shard,
+        )
+
+    sensors: dict[str, str | float | None] = {}
+    for _ in range(reader.integer()):
+        key = reader.integer()
+        name = reader.string() if key == _INLINE_KEY else _SENSOR_KEYS[key]
+        value_type = reader.integer()
+        if value_type == _TYPE_FLOAT:
+            sensors[name] = reader.unpack(_DOUBLE)[0]
+        elif value_type == _TYPE_STR:
+            sensors[name] = reader.string()
+        else:
+            sensors[name] = None
+    return CollectedReading(
+        address=address, timestamp=timestamp, sensors=sensors, shard=shard
+    )
+
+
+@dataclasses.dataclass(frozen=True)
+class ShardSpec:
+    """Devices polled by one worker process."""
+
+    index: int
+    addresses: tuple[str, ...]
+    adapter: str | None = None
+    # Devices seen with a weaker signal are deferred until it improves
+    min_rssi: float = DEFAULT_ADMISSION_MIN_RSSI
+
+
+def plan_shards(
+    devices: Mapping[str, str | None], shards: int | None = None
+) -> list[ShardSpec]:
+    """Split the devices over worker processes.
+
+    `devices` maps each address to the adapter that should poll it, if known.
+    Devices with an adapter get one worker per adapter, the other devices are
+    spread over `shards` workers by a hash of the address.
+    """
+    shards = shards or os.cpu_count() or 1
+    by_adapter: dict[str, list[str]] = {}
+    by_hash: dict[int, list[str]] = {}
+    for address, adapter in sorted(devices.items()):
+        if adapter is not None:
+            by_adapter.setdefault(adapter, []).append(address)
+        else:
+            bucket = zlib.crc32(address.upper().encode()) % shards
+            by_hash.setdefault(bucket, []).append(address)
+
+    groups: list[tuple[str | None, list[str]]] = [
+        *sorted(by_adapter.items()),
+        *((None, by_hash[bucket]) for bucket in sorted(by_hash)),
+    ]
+    return [
+        ShardSpec(index=index, addresses=tuple(addresses), adapter=adapter)
+        for index, (adapter, addresses) in enumerate(groups)
+    ]
+
+
+WorkerTarget = Callable[[ShardSpec, Connection, float, bool], None]
+
+
+def run_worker(
+    spec: ShardSpec, conn: Connection, interval: float, is_metric: bool
+) -> None:
+    """Poll the devices of a shard forever, in a worker process."""
+    asyncio.run(_poll_shard(spec, conn, interval, is_metric))
+
+
+# pylint: disable=too-many-locals
+async def _poll_shard(
+    spec: ShardSpec, conn: Connection, interval: float, is_metric: bool
+) -> None:
+    # pylint: disable=import-outside-toplevel
+    from .parser import AirthingsBluetoothDeviceData
+
+    logger = logging.getLogger(f"{__name__}.shard{spec.index}")
+    # The parser keeps the device information, so each device needs its own
+    devices = {
+        address: AirthingsBluetoothDeviceData(logger, is_metric=is_metric)
+        for address in spec.addresses
+    }
+    slots = asyncio.Semaphore(DEFAULT_ADAPTER_MAX_CONNECTIONS)
+    admission = ConnectionAdmission(min_rssi=spec.min_rssi)
+    # A single scanner finds all the devices of the shard, and records the
+    # RSSI they are seen with
+    scanner = AirthingsScanner()
+    addresses = {address.upper(): address for address in spec.addresses}
+    seen = {address: asyncio.Event() for address in spec.addresses}
+    # Entries of the scanner table, which keep the latest BLEDevice
+    found: dict[str, ScannedDevice] = {}
+
+    def _observe(scanned: ScannedDevice) -> None:
+        if (address := addresses.get(scanned.address.upper())) is not None:
+            admission.observe(address, scanned.last_rssi)
+            found[address] = scanned
+            seen[address].set()
+
+    async def _find(address: str) -> ScannedDevice | None:
+        try:
+            await asyncio.wait_for(seen[address].wait(), DEFAULT_COLLECT_SCAN_TIMEOUT)
+        except asyncio.TimeoutError:
+            return None
+        return found.get(address)
+
+    async def _poll(address: str, data: AirthingsBluetoothDeviceData) -> None:
+        async with slots:
+            started: float | None = None
+            try:
+                if (scanned := await _find(address)) is None:
+                    conn.send_bytes(encode_error(address, time.time(), "Not found"))
+                    return
+                if not admission.admit(address):
+                    conn.send_bytes(encode_error(address, time.time(), "Deferred"))
+                    return
+                started = time.monotonic()
+                device = await data.update_device(
+                    scanned.ble_device, scanned.advertisement_data
+                )
+            except Exception as err:  # pylint: disable=broad-exception-caught
+                if started is not None:
+                    admission.record(address, False)
+                conn.send_bytes(
+                    encode_error(address, time.time(), f"{type(err).__name__}: {err}")
+                )
+                return
+            admission.record(address, True, time.monotonic() - started)
+            conn.send_bytes(encode_reading(device, time.time()))
+
+    scanner.add_listener(_observe)
+    await scanner.start(**({} if spec.adapter is None else {"adapter": spec.adapter}))
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            started = loop.time()
+            # Devices that stopped advertising are looked for again
+            for scanned in scanner.prune(DEFAULT_RSSI_MAX_AGE):
+                if (address := addresses.get(scanned.address.upper())) is not None:
+                    found.pop(address, None)
+                    seen[address].clear()
+            # Connections are made in order, so the best links are not held up
+            # behind the weak ones
+            plan = admission.plan(devices)
+            for address in plan.deferred:
+                conn.send_bytes(encode_error(address, time.time(), "Deferred"))
+            await asyncio.gather(*(_poll(x, devices[x]) for x in plan.admitted))
+            await asyncio.sleep(max(0.0, interval - (loop.time() - started)))
+    finally:
+        await scanner.stop()
+
+
+@dataclasses.dataclass
+class _Worker:
+    spec: ShardSpec
+    process: multiprocessing.process.BaseProcess
+    conn: Connection
+    started: float
+    restarts: int = 0
+
+
+# pylint: disable=too-many-instance-attributes,too-many-arguments
+# pylint: disable=too-many-positional-arguments
+class ShardedCollector:
+    """Poll devices from worker processes, each with its own event loop.
+
+    The workers send every reading to this process over a pipe, in a compact
+    binary format, and the callback is called with each `CollectedReading`.
+    A worker that exits is restarted after a delay that doubles with every
+    crash in a row.
+
+    Each worker connects to the devices with the best links first, and skips
+    the devices seen with an RSSI below `min_rssi` or that keep failing, as
+    decided by a `ConnectionAdmission`. Skipped devices are reported with a
+    `Deferred` error.
+    """
+
+    def __init__(
+        self,
+        devices: Mapping[str, str | None] | Iterable[str],
+        callback: Callable[[CollectedReading], None],
+        shards: int | None = None,
+        interval: float = DEFAULT_COLLECT_INTERVAL,
+        is_metric: bool = True,
+        worker: WorkerTarget = run_worker,
+        restart_delay: float = DEFAULT_WORKER_RESTART_DELAY,
+        min_rssi: float = DEFAULT_ADMISSION_MIN_RSSI,
+    ) -> None:
+        if not isinstance(devices, Mapping):
+            devices = dict.fromkeys(devices)
+        self.shards = [
+            dataclasses.replace(x, min_rssi=min_rssi)
+            for x in plan_shards(devices, shards)
+        ]
+        self.interval = interval
+        self.is_metric = is_metric
+        self.restart_delay = restart_delay
+        self._callback = callback
+        self._worker_target = worker
+        self._context = multiprocessing.get_context("spawn")
+        self._workers: dict[int, _Worker] = {}
+        self._restart_tasks: set[asyncio.Task[None]] = set()
+        self._running = False
+
+    @property
+    def restarts(self) -> int:
+        """Number of times a worker was restarted."""
+        return sum(x.restarts for x in self._workers.values())
+
+    def start(self) -> None:
+        """Start a worker process for each shard."""
+        self._running = True
+        for spec in self.shards:
+            self._spawn(spec)
+
+    def _spawn(self, spec: ShardSpec, restarts: int = 0) -> None:
+        reader, writer = self._context.Pipe(duplex=False)
+        process = self._context.Process(
+            target=self._worker_target,
+            args=(spec, writer, self.interval, self.is_metric),
+            name=f"airthings-collector-{spec.index}",
+            daemon=True,
+        )
+        process.start()
+        # The worker holds the only write end, so its exit closes the pipe
+        writer.close()
+        self._workers[spec.index] = _Worker(
+            spec=spec,
+            process=process,
+            conn=reader,
+            started=time.monotonic(),
+            restarts=restarts,
+        )
+        asyncio.get_running_loop().add_reader(
+            reader.fileno(), self._handle_readable, spec.index
+        )
+
+    def _handle_readable(self, index: int) -> None:
+        worker = self._workers[index]
+        try:
+            while worker.conn.poll():
+                data = worker.conn.recv_bytes()
+                try:
+                    reading = decode_record(data, shard=index)
+                except (struct.error, UnicodeDecodeError, IndexError) as err:
+                    _LOGGER.warning("Invalid record from worker %s: %s", index, err)
+                    continue
+                self._callback(reading)
+        except (EOFError, OSError):
+            self._handle_exit(worker)
+
+    def _handle_exit(self, worker: _Worker) -> None:
+        loop = asyncio.get_running_loop()
+        loop.remove_reader(worker.conn.fileno())
+        worker.conn.close()
+        if not self._running:
+            return
+        # Crashes soon after a start back off, a long run resets the delay
+        crashes = 0
+        if time.monotonic() - worker.started < DEFAULT_WORKER_MAX_RESTART_DELAY:
+            crashes = worker.restarts
+        delay = min(
+            self.restart_delay * 2**crashes, float(DEFAULT_WORKER_MAX_RESTART_DELAY)
+        )
+        _LOGGER.warning(
+            "Collector worker %s exited, restarting in %s seconds",
+            worker.spec.index,
+            delay,
+        )
+        task = loop.create_task(self._restart(worker, delay))
+        self._restart_tasks.add(task)
+        task.add_done_callback(self._restart_tasks.discard)
+
+    async def _restart(self, worker: _Worker, delay: float) -> None:
+        await asyncio.get_running_loop().run_in_executor(None, worker.process.join)
+        await asyncio.sleep(delay)
+        if self._running:
+            self._spawn(worker.spec, worker.restarts + 1)
+
+    async def stop(self) -> None:
+        """Stop all worker processes."""
+        self._running = False
+        for task in list(self._restart_tasks):
+            task.cancel()
+        loop = asyncio.get_running_loop()
+        for worker in self._workers.values():
+            if not worker.conn.closed:
+                loop.remove_reader(worker.conn.fileno())
+                worker.conn.close()
+            if worker.process.is_alive():
+                worker.process.terminate()
+            await loop.run_in_executor(None, worker.process.join)
@@ -5,6 +5,13 @@ import struct
 from logging import Logger
 from typing import Any, Optional
 
+import cbor2
+
+from airthings_ble.atom.frame import (
+    ATOM_RESPONSE_HEADER,
+    ATOM_RESPONSE_HEADER_LENGTH,
+    AtomFrameAssembler,
+)
 from airthings_ble.atom.request import AtomRequest
 from airthings_ble.atom.request_path import AtomRequestPath
 from airthings_ble.atom.response import AtomResponse
@@ -14,6 +21,7 @@ from airthings_ble.const import (
     COMMAND_UUID_WAVE_MINI,
     COMMAND_UUID_WAVE_PLUS,
 )
+from airthings_ble.loop_monitor import PHASE_NOTIFY, loop_phase
 
 
 class CommandDecode:
@@ -22,6 +30,11 @@ class CommandDecode:
     cmd: bytes = b"\x6d"
     format_type: str
 
+    @property
+    def message_size(self) -> int:
+        """Size of a complete response, the values follow the command and a byte."""
+        return struct.calcsize(self.format_type) + 2
+
     def decode_data(
         self,
         logger: Logger,
@@ -60,7 +73,7 @@ class CommandDecode:
 
     def make_data_receiver(self) -> "NotificationReceiver":
         """Creates a notification receiver for the command."""
-        return NotificationReceiver(struct.calcsize(self.format_type))
+        return NotificationReceiver(self.message_size)
 
 
 class WaveRadonAndPlusCommandDecode(CommandDecode):
@@ -134,6 +147,31 @@ class AtomCommandDecode(CommandDecode):
             logger.error("Failed to decode command response: %s", err)
             return None
 
+    def make_data_receiver(self) -> "NotificationReceiver":
+        """Creates a notification receiver for the command."""
+        return AtomNotificationReceiver()
+
+
+def decode_atom_response(
+    logger: Logger, response: bytes
+) -> tuple[AtomRequestPath, dict[str, float | str | None] | None]:
+    """Decode an Atom response without the request it answers.
+
+    The request path is taken from the response, and the random bytes of the
+    request are checked against the response itself.
+    """
+    decoded = cbor2.loads(response[ATOM_RESPONSE_HEADER_LENGTH:])
+    if not isinstance(decoded, list) or not decoded or not isinstance(decoded[0], dict):
+        raise ValueError("Invalid response data type")
+    path = AtomRequestPath(str(decoded[0].get(0)))
+    values = AtomResponse(
+        logger=logger,
+        response=response,
+        random_bytes=response[len(ATOM_RESPONSE_HEADER) : ATOM_RESPONSE_HEADER_LENGTH],
+        path=path,
+    ).parse()
+    return path, values
+
 
 class NotificationReceiver:
     """Receiver for a single notification message.
@@ -154,12 +192,13 @@ class NotificationReceiver:
         return self.message is not None and len(self.message) >= self._message_size
 
     def __call__(self, _: Any, data: bytearray) -> None:
-        if self.message is None:
-            self.message = data
-        elif not self._full_message_received():
-            self.message += data
-        if self._full_message_received():
-            self._future.set_result(None)
+        with loop_phase(PHASE_NOTIFY):
+            if self.message is None:
+                self.message = data
+            elif not self._full_message_received():
+                self.message += data
+            if self._full_message_received() and not self._future.done():
+                self._future.set_result(None)
 
     def _on_timeout(self) -> None:
         if not self._future.done():
@@ -180,6 +219,30 @@ class NotificationReceiver:
                 timer_handle.cancel()
 
 
+class AtomNotificationReceiver(NotificationReceiver):
+    """Receiver for a single Atom response message.
+
+    The size of an Atom response is not known up front, so the fragments are
+    scanned as they arrive until the CBOR payload is complete.
+    """
+
+    def __init__(self) -> None:
+        super().__init__(message_size=0)
+        self._assembler = AtomFrameAssembler()
+
+    def _full_message_received(self) -> bool:
+        return self._assembler.complete
+
+    def __call__(self, _: Any, data: bytearray) -> None:
+        with loop_phase(PHASE_NOTIFY):
+            if self._assembler.complete:
+                return
+            complete = self._assembler.feed(data)
+            self.message = self._assembler.buffer
+            if complete and not self._future.done():
+                self._future.set_result(None)
+
+
 COMMAND_DECODERS: dict[str, CommandDecode] = {
     str(COMMAND_UUID_WAVE_2): WaveRadonAndPlusCommandDecode(),
     str(COMMAND_UUID_WAVE_PLUS): WaveRadonAndPlusCommandDecode(),
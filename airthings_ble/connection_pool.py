@@ -0,0 +1,280 @@
+"""Pool of BLE connections shared between Airthings devices."""
+
+from __future__ import annotations
+
+import asyncio
+import dataclasses
+import logging
+from collections import OrderedDict
+from functools import partial
+from typing import Awaitable, Callable
+
+from bleak.backends.device import BLEDevice
+from bleak_retry_connector import BleakClientWithServiceCache, establish_connection
+
+from .adapters import AdapterBalancer
+from .const import DEFAULT_POOL_MAX_CONNECTIONS
+
+_LOGGER = logging.getLogger(__name__)
+
+DisconnectedCallback = Callable[[BleakClientWithServiceCache], None]
+Connector = Callable[
+    [BLEDevice, DisconnectedCallback], Awaitable[BleakClientWithServiceCache]
+]
+
+
+async def _establish_connection(
+    ble_device: BLEDevice, disconnected_callback: DisconnectedCallback
+) -> BleakClientWithServiceCache:
+    client: BleakClientWithServiceCache = await establish_connection(
+        BleakClientWithServiceCache,
+        ble_device,
+        ble_device.address,
+        disconnected_callback=disconnected_callback,
+    )
+    return client
+
+
+@dataclasses.dataclass
+class PoolStats:
+    """Statistics for the connection pool."""
+
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    disconnects: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        """Share of acquired connections that were already connected."""
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+@dataclasses.dataclass
+class _PooledConnection:
+    client: BleakClientWithServiceCache | None = None
+    in_use: bool = True
+    disconnected_callback: DisconnectedCallback | None = None
+    # Adapter slot held by the connection, given back when it is removed
+    adapter: str | None = None
+    balancer: AdapterBalancer | None = None
+
+
+async def _wait_any(events: list[asyncio.Event]) -> None:
+    """Wait until one of the events is set."""
+    tasks = [asyncio.ensure_future(x.wait()) for x in events]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+class ConnectionPool:
+    """Keep up to `max_connections` devices connected between updates.
+
+    A device that is acquired while still connected reuses its connection.
+    When a new device needs a slot and the pool is full, the connection of the
+    least recently used idle device is closed.
+
+    With an `AdapterBalancer`, a pooled connection keeps its slot on the
+    adapter until it is closed, so it counts against the connection limit of
+    the adapter between updates too.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = DEFAULT_POOL_MAX_CONNECTIONS,
+        connector: Connector = _establish_connection,
+    ) -> None:
+        if max_connections < 1:
+            raise ValueError("The pool must allow at least one connection")
+        self.max_connections = max_connections
+        self.stats = PoolStats()
+        self._connector = connector
+        # Ordered from least to most recently used
+        self._connections: OrderedDict[str, _PooledConnection] = OrderedDict()
+        # Set and replaced whenever a connection is given back or removed
+        self._changed = asyncio.Event()
+
+    def __len__(self) -> int:
+        return len(self._connections)
+
+    def __contains__(self, address: object) -> bool:
+        return address in self._connections
+
+    def _notify(self) -> None:
+        """Wake up the tasks waiting for a connection."""
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def _remove(self, address: str) -> _PooledConnection:
+        """Remove a connection from the pool, giving back its adapter slot."""
+        entry = self._connections.pop(address)
+        if entry.balancer is not None and entry.adapter is not None:
+            entry.balancer.release(entry.adapter)
+        self._notify()
+        return entry
+
+    def _evict(
+        self, evicted: list[_PooledConnection], adapters: set[str] | None = None
+    ) -> bool:
+        """Remove the least recently used idle connection, on one of `adapters`."""
+        address = next(
+            (
+                address
+                for address, entry in self._connections.items()
+                if not entry.in_use and (adapters is None or entry.adapter in adapters)
+            ),
+            None,
+        )
+        if address is None:
+            return False
+        evicted.append(self._remove(address))
+        self.stats.evictions += 1
+        _LOGGER.debug("Evicting %s", address)
+        return True
+
+    def _try_acquire(
+        self,
+        ble_device: BLEDevice,
+        adapter_balancer: AdapterBalancer | None,
+        evicted: list[_PooledConnection],
+    ) -> tuple[_PooledConnection, BLEDevice] | None:
+        """Take the connection of the device, or a slot for a new one.
+
+        Returns None if the device has to wait. The connections closed to make
+        room are added to `evicted`, to be disconnected by the caller.
+        """
+        address = ble_device.address
+        entry = self._connections.get(address)
+        if entry is not None:
+            if entry.in_use:
+                return None
+            if entry.client is None or not entry.client.is_connected:
+                self._remove(address)
+                entry = None
+        if (
+            entry is None
+            and len(self._connections) >= self.max_connections
+            and all(x.in_use for x in self._connections.values())
+        ):
+            return None
+
+        adapter: str | None = None
+        target = ble_device
+        if adapter_balancer is not None:
+            held = None if entry is None else entry.adapter
+            while (selection := adapter_balancer.try_reserve(ble_device, held)) is None:
+                # Close idle connections that hold the slots this device needs
+                if not self._evict(evicted, adapter_balancer.candidates(ble_device)):
+                    return None
+            adapter, target = selection
+            if entry is not None and adapter != held:
+                # A better adapter has a free slot, move the connection there
+                evicted.append(self._remove(address))
+                entry = None
+
+        if entry is not None:
+            self.stats.hits += 1
+            entry.in_use = True
+            self._connections.move_to_end(address)
+            return entry, target
+
+        self.stats.misses += 1
+        if len(self._connections) >= self.max_connections:
+            self._evict(evicted)
+        entry = _PooledConnection(
+            adapter=adapter,
+            balancer=None if adapter is None else adapter_balancer,
+        )
+        self._connections[address] = entry
+        return entry, target
+
+    async def acquire(
+        self,
+        ble_device: BLEDevice,
+        disconnected_callback: DisconnectedCallback,
+        adapter_balancer: AdapterBalancer | None = None,
+    ) -> BleakClientWithServiceCache:
+        """Get a connected client for the device.
+
+        Waits if the device is in use, or if all connections are in use. With
+        an `adapter_balancer`, the connection is made over the best adapter
+        with a free slot, and idle connections are closed to free a slot. The
+        client must be given back with `release`.
+        """
+        address = ble_device.address
+        evicted: list[_PooledConnection] = []
+        while (
+            acquired := self._try_acquire(ble_device, adapter_balancer, evicted)
+        ) is None:
+            events = [self._changed]
+            if adapter_balancer is not None:
+                events.append(adapter_balancer.slot_released)
+            await self._disconnect(evicted)
+            await _wait_any(events)
+        entry, target = acquired
+        entry.disconnected_callback = disconnected_callback
+
+        try:
+            await self._disconnect(evicted)
+            if entry.client is None:
+                entry.client = await self._connector(
+                    target, partial(self._handle_disconnect, address)
+                )
+        except BaseException:
+            if self._connections.get(address) is entry:
+                if entry.balancer is not None and entry.adapter is not None:
+                    entry.balancer.record(entry.adapter, address, failed=True)
+                self._remove(address)
+            raise
+        return entry.client
+
+    async def _disconnect(self, evicted: list[_PooledConnection]) -> None:
+        while evicted:
+            if (client := evicted.pop().client) is not None:
+                await client.disconnect()
+
+    async def release(
+        self, client: BleakClientWithServiceCache, keep: bool = True
+    ) -> None:
+        """Give back a client, disconnecting it unless it should be kept."""
+        address = client.address
+        entry = self._connections.get(address)
+        if entry is not None and entry.client is client:
+            entry.in_use = False
+            entry.disconnected_callback = None
+            if entry.balancer is not None and entry.adapter is not None:
+                entry.balancer.record(entry.adapter, address, failed=not keep)
+            if not keep or not client.is_connected:
+                self._remove(address)
+            else:
+                self._notify()
+        if not keep or entry is None or entry.client is not client:
+            await client.disconnect()
+
+    async def close(self) -> None:
+        """Disconnect all idle connections."""
+        idle = [
+            self._remove(address)
+            for address, entry in list(self._connections.items())
+            if not entry.in_use
+        ]
+        for entry in idle:
+            if entry.client is not None:
+                await entry.client.disconnect()
+
+    def _handle_disconnect(
+        self, address: str, client: BleakClientWithServiceCache
+    ) -> None:
+        """Drop a connection that was closed by the device."""
+        entry = self._connections.get(address)
+        if entry is None or entry.client is not client:
+            return
+        self.stats.disconnects += 1
+        if callback := entry.disconnected_callback:
+            callback(client)
+        if not entry.in_use:
+            self._remove(address)
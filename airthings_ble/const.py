@@ -3,8 +3,13 @@
 from uuid import UUID
 
 MFCT_ID = 820
+# The services and characteristics of Airthings devices share this UUID base
+AIRTHINGS_UUID_SUFFIX = "-ade7-11e4-89d3-123b93f75cba"
 
 UPDATE_TIMEOUT = 15
+# Seconds a subscription waits for the response to a request before a refresh
+# sends a new one
+COMMAND_RESPONSE_TIMEOUT = 5
 
 # Use full UUID since we do not use UUID from bluetooth library
 CHAR_UUID_MANUFACTURER_NAME = UUID("00002a29-0000-1000-8000-00805f9b34fb")
@@ -43,6 +48,90 @@ TEMPERATURE_MAX = 100
 
 DEFAULT_MAX_UPDATE_ATTEMPTS = 1
 
+# Connections at the same time on a single Bluetooth adapter
+DEFAULT_ADAPTER_MAX_CONNECTIONS = 3
+# RSSI units subtracted from the link score for a failure rate of 100%
+DEFAULT_ADAPTER_FAILURE_PENALTY = 30
+# Seconds an RSSI observation is used for routing
+DEFAULT_RSSI_MAX_AGE = 60
+# Weight of the latest advertisement in the smoothed RSSI of a scanned device
+DEFAULT_SCANNER_RSSI_ALPHA = 0.3
+# Devices with a recent RSSI below this are not connected to until it improves
+DEFAULT_ADMISSION_MIN_RSSI = -90
+# Devices with a lower update success rate are only tried again after a delay
+DEFAULT_ADMISSION_MIN_SUCCESS_RATE = 0.25
+# First delay (in seconds) before a deferred device is tried again
+DEFAULT_ADMISSION_RETRY_DELAY = 60
+# Longest time (in seconds) a device is deferred
+DEFAULT_ADMISSION_MAX_DEFERRAL = 900
+
+# Devices kept connected between updates by a connection pool
+DEFAULT_POOL_MAX_CONNECTIONS = 5
+
+# Seconds a reading is served from cache, 0 disables the cache
+DEFAULT_CACHE_TTL = 0
+
+# Expected time (in seconds) between two samples until the period is learned
+DEFAULT_SAMPLE_PERIOD = 300
+# Delay (in seconds) after the expected sample before polling
+DEFAULT_POLL_MARGIN = 15
+# Shorter intervals between value changes are not used to learn the period
+MIN_SAMPLE_PERIOD = 30
+
+# Windows (in seconds) of the rolling aggregates
+DEFAULT_AGGREGATE_WINDOWS = (300, 3600)
+# Values kept per sensor and device for the rolling aggregates
+DEFAULT_AGGREGATE_CAPACITY = 720
+
+# Devices that fit in a shared readings table
+DEFAULT_SHARED_TABLE_ROWS = 256
+
+# Samples encoded together in a block of the compressed history
+DEFAULT_HISTORY_BLOCK_SIZE = 256
+# Seconds of compressed history kept per sensor
+DEFAULT_HISTORY_RETENTION = 7 * 24 * 3600
+
+# Seconds between polls of each device by a collector worker
+DEFAULT_COLLECT_INTERVAL = 300
+# Seconds a collector worker waits for a device to advertise before a poll fails
+DEFAULT_COLLECT_SCAN_TIMEOUT = 10
+# Seconds before a crashed collector worker is restarted, doubled on each crash
+DEFAULT_WORKER_RESTART_DELAY = 1
+# Longest delay (in seconds) before restarting a crashed collector worker
+DEFAULT_WORKER_MAX_RESTART_DELAY = 60
+
+# Seconds a gateway owns a device without renewing the lease
+DEFAULT_OWNERSHIP_LEASE_TTL = 900
+# RSSI units another gateway must be better by to take over a device
+DEFAULT_OWNERSHIP_HYSTERESIS = 6
+
+# Upper bounds (in seconds) of the update duration histogram buckets
+DEFAULT_LATENCY_BUCKETS = (
+    0.25, 0.5, 0.75, 1, 1.5, 2, 3, 4, 5, 6, 8, 10, 12, 15, 20, 25, 30, 45, 60, 90, 120
+)  # fmt: skip
+
+# Rows buffered by the SQLite sink before they are written
+DEFAULT_SINK_BATCH_SIZE = 500
+# Longest time (in seconds) rows stay buffered by the SQLite sink
+DEFAULT_SINK_FLUSH_INTERVAL = 30
+
+# Rows per record batch and Parquet row group of exported readings
+DEFAULT_EXPORT_CHUNK_SIZE = 10_000
+
+# Seconds of stored frames of a device decoded by one backfill task
+DEFAULT_BACKFILL_WINDOW = 86_400
+# Frames of a device less than this many seconds apart are one backfilled reading
+DEFAULT_BACKFILL_SESSION_GAP = 60
+
+# Seconds between event loop lag measurements
+DEFAULT_LOOP_MONITOR_INTERVAL = 0.25
+# Seconds of event loop lag that are reported as a stall
+DEFAULT_LOOP_LAG_THRESHOLD = 0.1
+# Upper bounds (in seconds) of the event loop lag histogram buckets
+DEFAULT_LOOP_LAG_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5
+)  # fmt: skip
+
 ATOM_BAT = "BAT"
 ATOM_LUX = "LUX"
 ATOM_TEMPERATURE = "TMP"
@@ -79,3 +168,21 @@ RADON_MONTH_LEVEL = "radon_month_level"
 RADON_YEAR_AVG = "radon_year_avg"
 RADON_YEAR_LEVEL = "radon_year_level"
 VOC = "voc"
+
+# Sensors with numeric values, in a fixed order for tabular storage
+NUMERIC_SENSORS = (
+    BATTERY,
+    CO2,
+    HUMIDITY,
+    ILLUMINANCE,
+    LUX,
+    NOISE,
+    PRESSURE,
+    TEMPERATURE,
+    RADON_1DAY_AVG,
+    RADON_WEEK_AVG,
+    RADON_MONTH_AVG,
+    RADON_YEAR_AVG,
+    RADON_LONGTERM_AVG,
+    VOC,
+)
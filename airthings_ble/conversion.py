@@ -0,0 +1,139 @@
+"""Table driven unit conversion and classification for Airthings sensor values.
+
+Every conversion can be applied to a single value, as done by the parser for
+live readings, or to a whole sequence of values at once for batch jobs. The
+sequence variants use NumPy when it is installed, and fall back to plain
+Python otherwise.
+"""
+
+from __future__ import annotations
+
+import importlib
+import math
+from bisect import bisect_right
+from typing import Any, Iterable, Sequence
+
+from .const import BQ_TO_PCI_MULTIPLIER
+
+
+def _import_numpy() -> Any:
+    try:
+        return importlib.import_module("numpy")
+    except ImportError:
+        return None
+
+
+np: Any = _import_numpy()
+
+
+class LinearConversion:
+    """Convert values with `value / divisor * multiplier + offset`."""
+
+    def __init__(
+        self,
+        divisor: float = 1.0,
+        multiplier: float = 1.0,
+        offset: float = 0.0,
+        ndigits: int | None = None,
+    ) -> None:
+        self.divisor = divisor
+        self.multiplier = multiplier
+        self.offset = offset
+        self.ndigits = ndigits
+
+    def __call__(self, value: float) -> float:
+        result = float(value) / self.divisor * self.multiplier + self.offset
+        if self.ndigits is not None:
+            return round(result, self.ndigits)
+        return result
+
+    def apply(self, values: Iterable[float]) -> Sequence[float]:
+        """Convert all values."""
+        if np is None:
+            return [self(value) for value in values]
+        result = (
+            np.asarray(values, dtype=float) / self.divisor * self.multiplier
+            + self.offset
+        )
+        if self.ndigits is not None:
+            return np.round(result, self.ndigits)
+        return result
+
+
+class PiecewiseLinear:
+    """Piecewise linear interpolation between breakpoints.
+
+    Values outside of the breakpoints are clamped to the first or last value.
+    """
+
+    def __init__(self, points: Sequence[tuple[float, float]]) -> None:
+        if len(points) < 2:
+            raise ValueError("At least two points are required")
+        points = sorted(points)
+        self.x = [float(x) for x, _ in points]
+        self.y = [float(y) for _, y in points]
+
+    def __call__(self, value: float) -> float:
+        x, y = self.x, self.y
+        if value <= x[0]:
+            return y[0]
+        if value >= x[-1]:
+            return y[-1]
+        index = bisect_right(x, value)
+        return (value - x[index - 1]) / (x[index] - x[index - 1]) * (
+            y[index] - y[index - 1]
+        ) + y[index - 1]
+
+    def apply(self, values: Iterable[float]) -> Sequence[float]:
+        """Interpolate all values."""
+        if np is None:
+            return [self(value) for value in values]
+        return np.interp(np.asarray(values, dtype=float), self.x, self.y)
+
+
+class StepClassifier:
+    """Classify values into labels based on sorted lower bounds.
+
+    A value gets the label of the highest lower bound it is equal to or above,
+    or `below_label` if it is below all of them (or is NaN).
+    """
+
+    def __init__(
+        self, bounds: Sequence[float], labels: Sequence[str], below_label: str
+    ) -> None:
+        if len(bounds) != len(labels):
+            raise ValueError("There must be one label per bound")
+        if list(bounds) != sorted(bounds):
+            raise ValueError("Bounds must be sorted")
+        self.bounds = [float(x) for x in bounds]
+        self.labels = [below_label, *labels]
+
+    def __call__(self, value: float) -> str:
+        if math.isnan(value):
+            return self.labels[0]
+        return self.labels[bisect_right(self.bounds, value)]
+
+    def apply(self, values: Iterable[float]) -> Sequence[str]:
+        """Classify all values."""
+        if np is None:
+            return [self(value) for value in values]
+        array = np.asarray(values, dtype=float)
+        indexes = np.searchsorted(self.bounds, array, side="right")
+        indexes[np.isnan(array)] = 0
+        return np.asarray(self.labels, dtype=object)[indexes]
+
+
+# Battery percentage based on the voltage for devices with two or three batteries
+BATTERY_TWO_CELLS = PiecewiseLinear(
+    [(2.10, 0), (2.20, 5), (2.50, 28), (2.60, 53), (2.80, 81), (3.00, 100)]
+)
+BATTERY_THREE_CELLS = PiecewiseLinear(
+    [(2.40, 0), (3.30, 23), (3.75, 42), (3.90, 62), (4.20, 85), (4.50, 100)]
+)
+
+BQ_TO_PCI = LinearConversion(multiplier=BQ_TO_PCI_MULTIPLIER)
+# Temperature reported as hundredths of kelvin
+CENTIKELVIN_TO_CELSIUS = LinearConversion(divisor=100, offset=-273.15, ndigits=2)
+ATOM_BATTERY_TO_VOLT = LinearConversion(divisor=1000)
+ATOM_HUMIDITY_TO_PERCENT = LinearConversion(divisor=100)
+ATOM_PRESSURE_TO_HPA = LinearConversion(divisor=64 * 100)
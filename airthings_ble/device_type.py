@@ -3,6 +3,11 @@
 from enum import Enum
 
 from airthings_ble.airthings_firmware import AirthingsFirmwareVersion
+from airthings_ble.conversion import (
+    BATTERY_THREE_CELLS,
+    BATTERY_TWO_CELLS,
+    PiecewiseLinear,
+)
 
 
 class AirthingsDeviceType(Enum):
@@ -66,73 +71,16 @@ class AirthingsDeviceType(Enum):
             return "Corentium Home 2"
         return "Unknown"
 
-    def battery_percentage(self, voltage: float) -> int:
-        """Calculate battery percentage based on voltage."""
+    @property
+    def battery_curve(self) -> PiecewiseLinear:
+        """Get the battery percentage curve based on the voltage."""
         if self == AirthingsDeviceType.WAVE_MINI:
-            return round(self._three_batteries(voltage))
-        return round(self._two_batteries(voltage))
-
-    # pylint: disable=too-many-return-statements
-    def _two_batteries(self, voltage: float) -> float:
-        if voltage >= 3.00:
-            return 100
-        if 2.80 <= voltage < 3.00:
-            return self._interpolate(
-                voltage=voltage, voltage_range=(2.80, 3.00), percentage_range=(81, 100)
-            )
-        if 2.60 <= voltage < 2.80:
-            return self._interpolate(
-                voltage=voltage, voltage_range=(2.60, 2.80), percentage_range=(53, 81)
-            )
-        if 2.50 <= voltage < 2.60:
-            return self._interpolate(
-                voltage=voltage, voltage_range=(2.50, 2.60), percentage_range=(28, 53)
-            )
-        if 2.20 <= voltage < 2.50:
-            return self._interpolate(
-                voltage=voltage, voltage_range=(2.20, 2.50), percentage_range=(5, 28)
-            )
-        if 2.10 <= voltage < 2.20:
-            return self._interpolate(
-                voltage=voltage, voltage_range=(2.10, 2.20), percentage_range=(0, 5)
-            )
-        return 0
+            return BATTERY_THREE_CELLS
+        return BATTERY_TWO_CELLS
 
-    # pylint: disable=too-many-return-statements
-    def _three_batteries(self, voltage: float) -> float:
-        if voltage >= 4.50:
-            return 100
-        if 4.20 <= voltage < 4.50:
-            return self._interpolate(
-                voltage=voltage, voltage_range=(4.20, 4.50), percentage_range=(85, 100)
-            )
-        if 3.90 <= voltage < 4.20:
-            return self._interpolate(
-                voltage=voltage, voltage_range=(3.90, 4.20), percentage_range=(62, 85)
-            )
-        if 3.75 <= voltage < 3.90:
-            return self._interpolate(
-                voltage=voltage, voltage_range=(3.75, 3.90), percentage_range=(42, 62)
-            )
-        if 3.30 <= voltage < 3.75:
-            return self._interpolate(
-                voltage=voltage, voltage_range=(3.30, 3.75), percentage_range=(23, 42)
-            )
-        if 2.40 <= voltage < 3.30:
-            return self._interpolate(
-                voltage=voltage, voltage_range=(2.40, 3.30), percentage_range=(0, 23)
-            )
-        return 0
-
-    def _interpolate(
-        self,
-        voltage: float,
-        voltage_range: tuple[float, float],
-        percentage_range: tuple[int, int],
-    ) -> float:
-        return (voltage - voltage_range[0]) / (voltage_range[1] - voltage_range[0]) * (
-            percentage_range[1] - percentage_range[0]
-        ) + percentage_range[0]
+    def battery_percentage(self, voltage: float) -> int:
+        """Calculate battery percentage based on voltage."""
+        return round(self.battery_curve(voltage))
 
     def need_firmware_upgrade(self, current_version: str) -> "AirthingsFirmwareVersion":
         """Check if the device needs an update."""
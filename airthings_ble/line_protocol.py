@@ -0,0 +1,175 @@
+"""Format readings as InfluxDB line protocol or OpenMetrics samples, in batches."""
+
+from __future__ import annotations
+
+import math
+import time
+from typing import TYPE_CHECKING, Iterable, Mapping
+
+if TYPE_CHECKING:
+    from .parser import AirthingsDevice
+
+# Line protocol has no escape for a newline, which would end the line, so it
+# is written as a backslash and an n like in the OpenMetrics labels
+_MEASUREMENT_ESCAPES = str.maketrans({",": "\\,", " ": "\\ ", "\n": "\\n"})
+_KEY_ESCAPES = str.maketrans({",": "\\,", "=": "\\=", " ": "\\ ", "\n": "\\n"})
+_STRING_ESCAPES = str.maketrans({'"': '\\"', "\\": "\\\\", "\n": "\\n"})
+_LABEL_ESCAPES = str.maketrans({'"': '\\"', "\\": "\\\\", "\n": "\\n"})
+
+
+def _nanoseconds(seconds: float) -> int:
+    # Nanoseconds since the epoch do not fit in the precision of a float
+    whole = math.floor(seconds)
+    return whole * 1_000_000_000 + round((seconds - whole) * 1_000_000_000)
+
+
+def _finite_number(value: object) -> float | None:
+    """Get the value as a float, None if it is not a finite number."""
+    if not isinstance(value, (int, float)) or isinstance(value, bool):
+        return None
+    return float(value) if math.isfinite(value) else None
+
+
+class BatchEncoder:
+    """Encode many readings at once, with the per-device parts cached.
+
+    The measurement and tags of a device (its address, model and name, and
+    the extra `tags`) are escaped once and kept as a prefix, as are the field
+    names. Readings are timestamped with `timestamp`, or else with the time
+    their sensors were read.
+    """
+
+    def __init__(
+        self,
+        measurement: str = "airthings",
+        tags: Mapping[str, str] | None = None,
+        metric_prefix: str = "airthings_",
+    ) -> None:
+        self.measurement = measurement
+        self.tags = dict(tags or {})
+        self.metric_prefix = metric_prefix
+        self._prefixes: dict[tuple[str, str, str], tuple[str, str]] = {}
+        self._field_keys: dict[str, str] = {}
+        self._metric_names: dict[str, str] = {}
+
+    def _device_tags(self, device: AirthingsDevice) -> dict[str, str]:
+        tags = {
+            **self.tags,
+            "address": device.address,
+            "model": device.model.name,
+            "name": device.name,
+        }
+        return {key: value for key, value in sorted(tags.items()) if value}
+
+    def _prefix(self, device: AirthingsDevice) -> tuple[str, str]:
+        """Get the line protocol prefix and the OpenMetrics labels of a device."""
+        key = (device.address, device.model.name, device.name)
+        if (prefix := self._prefixes.get(key)) is None:
+            tags = self._device_tags(device)
+            line = self.measurement.translate(_MEASUREMENT_ESCAPES) + "".join(
+                f",{k.translate(_KEY_ESCAPES)}={v.translate(_KEY_ESCAPES)}"
+                for k, v in tags.items()
+            )
+            labels = ",".join(
+                f'{k}="{v.translate(_LABEL_ESCAPES)}"' for k, v in tags.items()
+            )
+            prefix = self._prefixes[key] = (line, labels)
+        return prefix
+
+    def _field_key(self, sensor: str) -> str:
+        if (key := self._field_keys.get(sensor)) is None:
+            key = self._field_keys[sensor] = sensor.translate(_KEY_ESCAPES)
+        return key
+
+    def _metric_name(self, sensor: str) -> str:
+        if (name := self._metric_names.get(sensor)) is None:
+            name = "".join(
+                x if x.isalnum() or x == "_" else "_"
+                for x in self.metric_prefix + sensor
+            )
+            name = self._metric_names[sensor] = name
+        return name
+
+    def write_line_protocol(
+        self,
+        devices: Iterable[AirthingsDevice],
+        out: bytearray,
+        timestamp: float | None = None,
+    ) -> None:
+        """Append a line per reading to `out`, with nanosecond timestamps.
+
+        Numbers are written as floats, other values as strings, and missing
+        values are left out.
+        """
+        out += self._line_protocol_text(devices, timestamp).encode()
+
+    def line_protocol(
+        self, devices: Iterable[AirthingsDevice], timestamp: float | None = None
+    ) -> bytes:
+        """Encode readings as line protocol."""
+        return self._line_protocol_text(devices, timestamp).encode()
+
+    def _line_protocol_text(
+        self, devices: Iterable[AirthingsDevice], timestamp: float | None
+    ) -> str:
+        lines: list[str] = []
+        for device in devices:
+            fields: list[str] = []
+            for sensor, value in device.sensors.items():
+                if value is None:
+                    continue
+                if isinstance(value, (int, float)):
+                    if (number := _finite_number(value)) is not None:
+                        fields.append(f"{self._field_key(sensor)}={number!r}")
+                else:
+                    string = str(value).translate(_STRING_ESCAPES)
+                    fields.append(f'{self._field_key(sensor)}="{string}"')
+            if not fields:
+                continue
+            nanoseconds = _nanoseconds(
+                device.read_time or time.time() if timestamp is None else timestamp
+            )
+            lines.append(
+                f"{self._prefix(device)[0]} {','.join(fields)} {nanoseconds}\n"
+            )
+        return "".join(lines)
+
+    def write_openmetrics(
+        self,
+        devices: Iterable[AirthingsDevice],
+        out: bytearray,
+        timestamp: float | None = None,
+    ) -> None:
+        """Append a gauge family per numeric sensor to `out`.
+
+        The text ends with `# EOF`, so it is a complete OpenMetrics exposition.
+        """
+        out += self._openmetrics_text(devices, timestamp).encode()
+
+    def openmetrics(
+        self, devices: Iterable[AirthingsDevice], timestamp: float | None = None
+    ) -> bytes:
+        """Encode the numeric sensor values of readings as OpenMetrics gauges."""
+        return self._openmetrics_text(devices, timestamp).encode()
+
+    def _openmetrics_text(
+        self, devices: Iterable[AirthingsDevice], timestamp: float | None
+    ) -> str:
+        samples: dict[str, list[str]] = {}
+        for device in devices:
+            labels = self._prefix(device)[1]
+            seconds = (
+                device.read_time or time.time() if timestamp is None else timestamp
+            )
+            for sensor, value in device.sensors.items():
+                if (number := _finite_number(value)) is None:
+                    continue
+                samples.setdefault(sensor, []).append(
+                    f"{self._metric_name(sensor)}{{{labels}}} {number!r} {seconds!r}\n"
+                )
+        lines: list[str] = []
+        for sensor, family in samples.items():
+            lines.append(f"# TYPE {self._metric_name(sensor)} gauge\n")
+            lines.extend(family)
+        lines.append("# EOF\n")
+        return "".join(lines)
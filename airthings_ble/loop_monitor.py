@@ -0,0 +1,174 @@
+"""Detect when the event loop is blocked, and which part of the library ran."""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from types import TracebackType
+
+from .const import (
+    DEFAULT_LOOP_LAG_BUCKETS,
+    DEFAULT_LOOP_LAG_THRESHOLD,
+    DEFAULT_LOOP_MONITOR_INTERVAL,
+)
+from .metrics import MetricsRegistry
+
+_LOGGER = logging.getLogger(__name__)
+
+# Phases of the library that run without yielding to the event loop
+PHASE_DECODE = "decode"
+PHASE_NOTIFY = "notify"
+PHASE_LISTENER = "listener"
+# Phase reported for stalls while no library phase ran
+PHASE_OTHER = "other"
+
+_active_monitor: LoopMonitor | None = None  # pylint: disable=invalid-name
+
+
+class _Phase:
+    """Time a synchronous part of the library for the active monitor."""
+
+    __slots__ = ("name", "_started")
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self._started: list[float] = []
+
+    def __enter__(self) -> None:
+        if _active_monitor is not None:
+            self._started.append(time.perf_counter())
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        if self._started:
+            duration = time.perf_counter() - self._started.pop()
+            if _active_monitor is not None:
+                _active_monitor.record_phase(self.name, duration)
+
+
+_PHASES: dict[str, _Phase] = {}
+
+
+def loop_phase(name: str) -> _Phase:
+    """Get a context manager that attributes the time spent in it to `name`.
+
+    It does nothing unless a LoopMonitor is running. Only wrap code that does
+    not await, the time of other tasks would be counted otherwise.
+    """
+    if (phase := _PHASES.get(name)) is None:
+        phase = _PHASES[name] = _Phase(name)
+    return phase
+
+
+# pylint: disable=too-many-instance-attributes
+class LoopMonitor:
+    """Measure the lag of the event loop, and attribute stalls to library phases.
+
+    A task sleeps for `interval` seconds at a time, and the lag is how much
+    later than requested it woke up. A lag above `threshold` is a stall. It is
+    logged, and counted for the slowest phase that ran since the previous
+    wake up, or for "other" if the time was spent outside the library.
+
+    Only one monitor can run in a process. The lag and phase durations are
+    exported through `registry`.
+    """
+
+    def __init__(
+        self,
+        registry: MetricsRegistry | None = None,
+        interval: float = DEFAULT_LOOP_MONITOR_INTERVAL,
+        threshold: float = DEFAULT_LOOP_LAG_THRESHOLD,
+        logger: logging.Logger = _LOGGER,
+    ) -> None:
+        self.registry = registry or MetricsRegistry()
+        self.interval = interval
+        self.threshold = threshold
+        self.logger = logger
+        self.lag = self.registry.histogram(
+            "airthings_event_loop_lag_seconds",
+            "Delay of the event loop in running a timer.",
+            bounds=DEFAULT_LOOP_LAG_BUCKETS,
+        ).labels()
+        self.phase_durations = self.registry.histogram(
+            "airthings_loop_phase_duration_seconds",
+            "Time spent in a part of the library without yielding to the loop.",
+            ("phase",),
+            DEFAULT_LOOP_LAG_BUCKETS,
+        )
+        self.stalls = self.registry.counter(
+            "airthings_event_loop_stalls",
+            "Times the event loop lag went above the threshold.",
+            ("phase",),
+        )
+        self.max_lag = 0.0
+        self._slowest: tuple[str, float] | None = None
+        self._task: asyncio.Task[None] | None = None
+
+    @property
+    def running(self) -> bool:
+        """Check if the monitor is running."""
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        """Start monitoring the running event loop."""
+        global _active_monitor  # pylint: disable=global-statement
+        if _active_monitor is not None and _active_monitor is not self:
+            raise RuntimeError("Another loop monitor is running")
+        if self.running:
+            return
+        _active_monitor = self
+        self._slowest = None
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop monitoring."""
+        global _active_monitor  # pylint: disable=global-statement
+        if _active_monitor is self:
+            _active_monitor = None
+        if (task := self._task) is not None:
+            self._task = None
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    def record_phase(self, phase: str, duration: float) -> None:
+        """Record the time spent in a phase of the library."""
+        self.phase_durations.labels(phase).observe(duration)
+        if self._slowest is None or duration > self._slowest[1]:
+            self._slowest = (phase, duration)
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self._record_lag(max(0.0, loop.time() - expected))
+
+    def _record_lag(self, lag: float) -> None:
+        slowest, self._slowest = self._slowest, None
+        self.lag.observe(lag)
+        self.max_lag = max(self.max_lag, lag)
+        if lag <= self.threshold:
+            return
+        if slowest is not None and slowest[1] >= lag / 2:
+            # Most of the stall was spent in a single library phase
+            phase, duration = slowest
+            self.stalls.labels(phase).inc()
+            self.logger.warning(
+                "Event loop was blocked for %.3f s, %.3f s of it in %s",
+                lag,
+                duration,
+                phase,
+            )
+        else:
+            self.stalls.labels(PHASE_OTHER).inc()
+            self.logger.warning(
+                "Event loop was blocked for %.3f s outside of the library", lag
+            )
@@ -0,0 +1,319 @@
+"""Counters and latency histograms of device updates, in OpenMetrics format."""
+
+from __future__ import annotations
+
+import asyncio
+import math
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from typing import Iterable, Iterator
+
+from .const import DEFAULT_LATENCY_BUCKETS
+
+OPENMETRICS_CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+
+def log_linear_buckets(
+    minimum: float, maximum: float, per_power_of_two: int = 4
+) -> tuple[float, ...]:
+    """Get bucket bounds with a fixed relative error, like an HDR histogram.
+
+    Each power of two from `minimum` up to `maximum` is split in
+    `per_power_of_two` linear steps.
+    """
+    bounds: list[float] = []
+    base = minimum
+    while base < maximum:
+        step = base / per_power_of_two
+        bounds.extend(base + step * index for index in range(per_power_of_two))
+        base *= 2
+    bounds.append(base)
+    return tuple(float(f"{x:.6g}") for x in bounds)
+
+
+# pylint: disable=too-few-public-methods
+class Counter:
+    """Value that only goes up."""
+
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        """Increase the counter."""
+        self.value += amount
+
+
+class Histogram:
+    """Counts of observed values in fixed buckets.
+
+    Observing a value is a binary search over the bounds, so it is cheap
+    enough to do for every update. Quantiles are estimated by interpolating
+    within the bucket.
+    """
+
+    __slots__ = ("bounds", "counts", "count", "total")
+
+    def __init__(self, bounds: Iterable[float] = DEFAULT_LATENCY_BUCKETS) -> None:
+        self.bounds = tuple(sorted(bounds))
+        # The last bucket holds the values above the highest bound
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value: float) -> None:
+        """Add a value."""
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+
+    def quantile(self, quantile: float) -> float:
+        """Estimate the value below which the `quantile` of values fall.
+
+        Returns NaN if there are no values, and the highest bound if the
+        quantile falls above it.
+        """
+        if not self.count:
+            return math.nan
+        rank = quantile * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                if index == len(self.bounds):
+                    return self.bounds[-1]
+                lower = self.bounds[index - 1] if index else 0.0
+                upper = self.bounds[index]
+                return lower + (upper - lower) * max(rank - seen, 0) / count
+            seen += count
+        return self.bounds[-1]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if value == int(value):
+        return str(int(value))
+    return repr(value)
+
+
+# pylint: disable=too-few-public-methods
+class _Family(ABC):
+    """Metrics with the same name, one per combination of label values."""
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str]) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+
+    def _header(self) -> Iterator[str]:
+        yield f"# TYPE {self.name} {self.kind}"
+        yield f"# HELP {self.name} {_escape(self.documentation)}"
+
+    @abstractmethod
+    def render(self) -> Iterator[str]:
+        """Get the lines of the family in the OpenMetrics text format."""
+
+
+class CounterFamily(_Family):
+    """Counters with the same name."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str]) -> None:
+        super().__init__(name, documentation, labels)
+        self.children: dict[tuple[str, ...], Counter] = {}
+
+    def labels(self, *values: str) -> Counter:
+        """Get the counter for the label values, keep it to update it cheaply."""
+        if (counter := self.children.get(values)) is None:
+            if len(values) != len(self.label_names):
+                raise ValueError(f"{self.name} needs labels {self.label_names}")
+            counter = self.children[values] = Counter()
+        return counter
+
+    def render(self) -> Iterator[str]:
+        """Get the lines of the family in the OpenMetrics text format."""
+        yield from self._header()
+        for values, counter in self.children.items():
+            labels = _format_labels(self.label_names, values)
+            yield f"{self.name}_total{labels} {_format_value(counter.value)}"
+
+
+class HistogramFamily(_Family):
+    """Histograms with the same name and buckets."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Iterable[str],
+        bounds: Iterable[float] = DEFAULT_LATENCY_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, labels)
+        self.bounds = tuple(sorted(bounds))
+        self.children: dict[tuple[str, ...], Histogram] = {}
+
+    def labels(self, *values: str) -> Histogram:
+        """Get the histogram for the label values, keep it to update it cheaply."""
+        if (histogram := self.children.get(values)) is None:
+            if len(values) != len(self.label_names):
+                raise ValueError(f"{self.name} needs labels {self.label_names}")
+            histogram = self.children[values] = Histogram(self.bounds)
+        return histogram
+
+    def render(self) -> Iterator[str]:
+        """Get the lines of the family in the OpenMetrics text format."""
+        yield from self._header()
+        names = self.label_names + ("le",)
+        for values, histogram in self.children.items():
+            cumulative = 0
+            for bound, count in zip(
+                histogram.bounds + (math.inf,), histogram.counts, strict=True
+            ):
+                cumulative += count
+                labels = _format_labels(names, values + (_format_value(bound),))
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.label_names, values)
+            yield f"{self.name}_count{labels} {histogram.count}"
+            yield f"{self.name}_sum{labels} {_format_value(histogram.total)}"
+
+
+class MetricsRegistry:
+    """Metric families, rendered together for a scraper."""
+
+    def __init__(self) -> None:
+        self._families: dict[str, _Family] = {}
+
+    def counter(
+        self, name: str, documentation: str, labels: Iterable[str] = ()
+    ) -> CounterFamily:
+        """Get or create a counter family."""
+        if (family := self._families.get(name)) is None:
+            family = self._families[name] = CounterFamily(name, documentation, labels)
+        if not isinstance(family, CounterFamily):
+            raise ValueError(f"{name} is already registered as a {family.kind}")
+        return family
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labels: Iterable[str] = (),
+        bounds: Iterable[float] = DEFAULT_LATENCY_BUCKETS,
+    ) -> HistogramFamily:
+        """Get or create a histogram family."""
+        if (family := self._families.get(name)) is None:
+            family = self._families[name] = HistogramFamily(
+                name, documentation, labels, bounds
+            )
+        if not isinstance(family, HistogramFamily):
+            raise ValueError(f"{name} is already registered as a {family.kind}")
+        return family
+
+    def render(self) -> str:
+        """Get all metrics in the OpenMetrics text format."""
+        lines = [line for family in self._families.values() for line in family.render()]
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+
+# pylint: disable=too-many-instance-attributes
+class UpdateMetrics:
+    """Metrics of device updates, by model and address.
+
+    Pass an instance as `metrics` to `AirthingsBluetoothDeviceData`, all
+    parsers can share one.
+    """
+
+    def __init__(self, registry: MetricsRegistry | None = None) -> None:
+        self.registry = registry or MetricsRegistry()
+        labels = ("model", "address")
+        self.update_duration = self.registry.histogram(
+            "airthings_update_duration_seconds",
+            "Time to update a device, including retries.",
+            labels,
+        )
+        self.updates = self.registry.counter(
+            "airthings_updates", "Finished device updates.", labels + ("result",)
+        )
+        self.connect_failures = self.registry.counter(
+            "airthings_connect_failures", "Failed connection attempts.", labels
+        )
+        self.disconnects = self.registry.counter(
+            "airthings_disconnects", "Unexpected disconnects during updates.", labels
+        )
+        self.retries = self.registry.counter(
+            "airthings_update_retries", "Update attempts after a failure.", labels
+        )
+        self.notification_timeouts = self.registry.counter(
+            "airthings_notification_timeouts",
+            "Commands that got no complete response in time.",
+            labels,
+        )
+
+    def observe_update(
+        self, model: str, address: str, duration: float, result: str
+    ) -> None:
+        """Record a finished update, the result is ok, partial or error."""
+        self.update_duration.labels(model, address).observe(duration)
+        self.updates.labels(model, address, result).inc()
+
+    def latency_quantiles(
+        self,
+        model: str,
+        address: str,
+        quantiles: Iterable[float] = (0.5, 0.95, 0.99),
+    ) -> dict[float, float]:
+        """Estimate quantiles of the update duration of a device."""
+        histogram = self.update_duration.labels(model, address)
+        return {quantile: histogram.quantile(quantile) for quantile in quantiles}
+
+
+async def serve_metrics(
+    registry: MetricsRegistry, host: str = "127.0.0.1", port: int = 9300
+) -> asyncio.Server:
+    """Serve the metrics over HTTP for a scraper, on every path.
+
+    Close the returned server to stop serving.
+    """
+
+    async def _handle(
+        reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            # The request is ignored, but must be read before replying
+            while await reader.readline() not in (b"\r\n", b"\n", b""):
+                pass
+            body = registry.render().encode()
+            writer.write(
+                b"HTTP/1.1 200 OK\r\n"
+                + f"Content-Type: {OPENMETRICS_CONTENT_TYPE}\r\n".encode()
+                + f"Content-Length: {len(body)}\r\n".encode()
+                + b"Connection: close\r\n\r\n"
+                + body
+            )
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(_handle, host, port)
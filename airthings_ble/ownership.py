@@ -0,0 +1,254 @@
+"""Share devices between gateways, so each device is polled by a single one."""
+
+from __future__ import annotations
+
+import dataclasses
+import sqlite3
+import threading
+import time
+from typing import Protocol
+
+from bleak.backends.device import BLEDevice
+from bleak.backends.scanner import AdvertisementData
+
+from .const import (
+    DEFAULT_OWNERSHIP_HYSTERESIS,
+    DEFAULT_OWNERSHIP_LEASE_TTL,
+    DEFAULT_RSSI_MAX_AGE,
+)
+
+
+@dataclasses.dataclass(frozen=True)
+class Lease:
+    """Ownership of a device by a gateway, until `expires`."""
+
+    address: str
+    owner: str
+    expires: float
+
+
+class OwnershipBackend(Protocol):
+    """Storage shared by the gateways.
+
+    `acquire` must be atomic between all gateways using the backend.
+    """
+
+    def report(self, address: str, gateway: str, rssi: int, timestamp: float) -> None:
+        """Store the latest RSSI of a device as heard by a gateway."""
+
+    def observations(self, address: str, since: float) -> dict[str, int]:
+        """Get the RSSI of each gateway that heard the device since `since`."""
+
+    def lease(self, address: str, now: float) -> Lease | None:
+        """Get the lease of a device, None if there is no lease or it expired."""
+
+    def acquire(
+        self,
+        address: str,
+        gateway: str,
+        expires: float,
+        now: float,
+        replace: str | None = None,
+    ) -> Lease | None:
+        """Take or renew the lease of a device, and return the current lease.
+
+        The lease is taken if there is none, it expired, it is already held by
+        `gateway` or it is held by `replace`.
+        """
+
+    def release(self, address: str, gateway: str) -> None:
+        """Give up the lease of a device, if held by `gateway`."""
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS observations (
+    address TEXT NOT NULL,
+    gateway TEXT NOT NULL,
+    rssi INTEGER NOT NULL,
+    timestamp REAL NOT NULL,
+    PRIMARY KEY (address, gateway)
+);
+CREATE TABLE IF NOT EXISTS leases (
+    address TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires REAL NOT NULL
+);
+"""
+
+
+class SQLiteOwnershipBackend:
+    """Backend for gateways on a single host, in a SQLite database file.
+
+    Every gateway process opens the same file. Use ":memory:" for a backend
+    that is only shared within one process.
+    """
+
+    def __init__(self, path: str, timeout: float = 5.0) -> None:
+        self.path = path
+        self._connection = sqlite3.connect(
+            path, timeout=timeout, isolation_level=None, check_same_thread=False
+        )
+        self._lock = threading.Lock()
+        with self._lock:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.executescript(_SCHEMA)
+
+    def report(self, address: str, gateway: str, rssi: int, timestamp: float) -> None:
+        """Store the latest RSSI of a device as heard by a gateway."""
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO observations VALUES (?, ?, ?, ?)",
+                (address, gateway, rssi, timestamp),
+            )
+
+    def observations(self, address: str, since: float) -> dict[str, int]:
+        """Get the RSSI of each gateway that heard the device since `since`."""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT gateway, rssi FROM observations"
+                " WHERE address = ? AND timestamp >= ?",
+                (address, since),
+            ).fetchall()
+        return dict(rows)
+
+    def lease(self, address: str, now: float) -> Lease | None:
+        """Get the lease of a device, None if there is no lease or it expired."""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT owner, expires FROM leases WHERE address = ? AND expires > ?",
+                (address, now),
+            ).fetchone()
+        return None if row is None else Lease(address, row[0], row[1])
+
+    def acquire(
+        self,
+        address: str,
+        gateway: str,
+        expires: float,
+        now: float,
+        replace: str | None = None,
+    ) -> Lease | None:
+        """Take or renew the lease of a device, and return the current lease."""
+        with self._lock:
+            connection = self._connection
+            # Take the write lock first, so the check and the update are atomic
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                connection.execute(
+                    "INSERT INTO leases VALUES (?, ?, ?) ON CONFLICT (address)"
+                    " DO UPDATE SET owner = excluded.owner, expires = excluded.expires"
+                    " WHERE expires <= ? OR owner = ? OR owner = ?",
+                    (address, gateway, expires, now, gateway, replace),
+                )
+                row = connection.execute(
+                    "SELECT owner, expires FROM leases WHERE address = ?",
+                    (address,),
+                ).fetchone()
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+        if row is None or row[1] <= now:
+            return None
+        return Lease(address, row[0], row[1])
+
+    def release(self, address: str, gateway: str) -> None:
+        """Give up the lease of a device, if held by `gateway`."""
+        with self._lock:
+            self._connection.execute(
+                "DELETE FROM leases WHERE address = ? AND owner = ?",
+                (address, gateway),
+            )
+
+    def close(self) -> None:
+        """Close the database."""
+        with self._lock:
+            self._connection.close()
+
+
+class OwnershipCoordinator:
+    """Decide which gateway polls each device.
+
+    Every gateway reports the RSSI of the devices it hears with `observe`, and
+    only polls a device when `owns` returns True. The gateway with the best
+    recent RSSI takes the lease of a device. The owner keeps it until another
+    gateway hears the device `hysteresis` dB better, or until the owner stops
+    renewing the lease and its observations get older than `rssi_max_age`.
+
+    A gateway renews its leases by calling `owns` before each poll, so the
+    lease TTL should be longer than the poll interval.
+    """
+
+    def __init__(
+        self,
+        gateway: str,
+        backend: OwnershipBackend,
+        lease_ttl: float = DEFAULT_OWNERSHIP_LEASE_TTL,
+        rssi_max_age: float = DEFAULT_RSSI_MAX_AGE,
+        hysteresis: float = DEFAULT_OWNERSHIP_HYSTERESIS,
+    ) -> None:
+        self.gateway = gateway
+        self.backend = backend
+        self.lease_ttl = lease_ttl
+        self.rssi_max_age = rssi_max_age
+        self.hysteresis = hysteresis
+        self._owned: set[str] = set()
+
+    @property
+    def owned(self) -> frozenset[str]:
+        """Devices this gateway held a lease of when last checked."""
+        return frozenset(self._owned)
+
+    def observe(self, address: str, rssi: int, now: float | None = None) -> None:
+        """Report that this gateway heard the device."""
+        now = time.time() if now is None else now
+        self.backend.report(address, self.gateway, rssi, now)
+
+    def observe_advertisement(
+        self, ble_device: BLEDevice, advertisement_data: AdvertisementData
+    ) -> None:
+        """Report an advertisement, usable as a BleakScanner detection callback."""
+        self.observe(ble_device.address, advertisement_data.rssi)
+
+    def owns(self, address: str, now: float | None = None) -> bool:
+        """Check if this gateway should poll the device, and renew its lease."""
+        now = time.time() if now is None else now
+        rssi = self.backend.observations(address, now - self.rssi_max_age)
+        if self.gateway not in rssi:
+            # Another gateway can take over once the lease expires
+            self._owned.discard(address)
+            return False
+
+        own_rssi = rssi[self.gateway]
+        replace: str | None = None
+        lease = self.backend.lease(address, now)
+        if lease is None:
+            if own_rssi < max(rssi.values()):
+                self._owned.discard(address)
+                return False
+        elif lease.owner != self.gateway:
+            # A silent owner has no recent observations, so it is replaced
+            owner_rssi = rssi.get(lease.owner)
+            if owner_rssi is not None and own_rssi < owner_rssi + self.hysteresis:
+                self._owned.discard(address)
+                return False
+            replace = lease.owner
+
+        lease = self.backend.acquire(
+            address, self.gateway, now + self.lease_ttl, now, replace
+        )
+        if lease is not None and lease.owner == self.gateway:
+            self._owned.add(address)
+            return True
+        self._owned.discard(address)
+        return False
+
+    def release(self, address: str) -> None:
+        """Give up a device, so another gateway can take it right away."""
+        self.backend.release(address, self.gateway)
+        self._owned.discard(address)
+
+    def release_all(self) -> None:
+        """Give up all devices, for example when the gateway shuts down."""
+        for address in list(self._owned):
+            self.release(address)
@@ -1,25 +1,65 @@
 """Parser for Airthings BLE devices"""
 
+# pylint: disable=too-many-lines
+
 from __future__ import annotations
 
 import asyncio
+import contextlib
+import copy
 import dataclasses
 import re
+import time
 from collections import namedtuple
+from datetime import datetime
 from functools import partial
 from logging import Logger
+from typing import AsyncContextManager, Callable
 
 from async_interrupt import interrupt
 from bleak import BleakClient, BleakError
 from bleak.backends.device import BLEDevice
+from bleak.backends.scanner import AdvertisementData
 from bleak.backends.service import BleakGATTService
 from bleak_retry_connector import BleakClientWithServiceCache, establish_connection
 
+from airthings_ble.adapters import AdapterBalancer
+from airthings_ble.advertisement import AirthingsAdvertisement, parse_advertisement
 from airthings_ble.airthings_firmware import AirthingsFirmwareVersion
+from airthings_ble.airtime import AirtimeStats, metered_client
 from airthings_ble.atom.request_path import AtomRequestPath
-from airthings_ble.command_decode import COMMAND_DECODERS, AtomCommandDecode
-from airthings_ble.radon_level import get_radon_level
+from airthings_ble.command_decode import (
+    COMMAND_DECODERS,
+    AtomCommandDecode,
+    CommandDecode,
+    NotificationReceiver,
+    decode_atom_response,
+)
+from airthings_ble.connection_pool import ConnectionPool
+from airthings_ble.conversion import (
+    ATOM_BATTERY_TO_VOLT,
+    ATOM_HUMIDITY_TO_PERCENT,
+    ATOM_PRESSURE_TO_HPA,
+    BQ_TO_PCI,
+    CENTIKELVIN_TO_CELSIUS,
+    StepClassifier,
+)
+from airthings_ble.loop_monitor import PHASE_DECODE, PHASE_LISTENER, loop_phase
+from airthings_ble.metrics import UpdateMetrics
+from airthings_ble.radon_level import (
+    DEFAULT_RADON_CLASSIFIER,
+    AirthingsRadonLevel,
+    radon_classifier,
+)
+from airthings_ble.scheduler import MeasurementScheduler
 from airthings_ble.sensor_decoders import SENSOR_DECODERS
+from airthings_ble.subscription import (
+    AirthingsSubscription,
+    AtomFrames,
+    NotifyChannel,
+    SizedFrames,
+    SubscriptionCallback,
+)
 
 from .const import (
     ATOM_BAT,
@@ -35,7 +75,6 @@ from .const import (
     ATOM_TEMPERATURE,
     ATOM_VOC,
     BATTERY,
-    BQ_TO_PCI_MULTIPLIER,
     CHAR_UUID_DATETIME,
     CHAR_UUID_DEVICE_NAME,
     CHAR_UUID_FIRMWARE_REV,
@@ -57,6 +96,8 @@ from .const import (
     COMMAND_UUID_WAVE_2,
     COMMAND_UUID_WAVE_MINI,
     COMMAND_UUID_WAVE_PLUS,
+    DATE_TIME,
+    DEFAULT_CACHE_TTL,
     DEFAULT_MAX_UPDATE_ATTEMPTS,
     HUMIDITY,
     ILLUMINANCE,
@@ -110,6 +151,20 @@ sensors_characteristics_uuid = [
 ]
 sensors_characteristics_uuid_str = [str(x) for x in sensors_characteristics_uuid]
 
+# Characteristics are read from the lowest rank, so that the sensor values are
+# read before the battery level and the device clock when time is short.
+_READ_PRIORITY = {
+    str(CHAR_UUID_DATETIME): 2,
+    str(COMMAND_UUID_WAVE_2): 1,
+    str(COMMAND_UUID_WAVE_PLUS): 1,
+    str(COMMAND_UUID_WAVE_MINI): 1,
+}
+
+
+UpdateListener = Callable[["AirthingsDevice"], None]
+# Called with the address, the characteristic UUID and the raw data of a frame
+RawFrameListener = Callable[[str, str, bytes], None]
+
 
 class DisconnectedError(Exception):
     """Disconnected from device."""
@@ -155,16 +210,72 @@ class AirthingsDevice(AirthingsDeviceInfo):
     sensors: dict[str, str | float | None] = dataclasses.field(
         default_factory=lambda: {}
     )
+    # Clock of the device when the sensors were read, if the device has one
+    device_time: datetime | None = None
+    # Time each sensor was read at, in seconds since the epoch
+    sensor_timestamps: dict[str, float] = dataclasses.field(default_factory=lambda: {})
+    # Set if the update ran out of time before all sensors were read
+    partial: bool = False
+    # Connection time and GATT traffic of the update
+    airtime: AirtimeStats | None = None
 
     def friendly_name(self) -> str:
         """Generate a name for the device."""
 
         return f"Airthings {self.model.product_name}"
 
+    @property
+    def read_time(self) -> float | None:
+        """Time the latest sensor value was read, None if there are no values."""
+        return max(self.sensor_timestamps.values(), default=None)
+
+
+def _is_atom_service(service: BleakGATTService) -> bool:
+    """Check if the service contains the Atom command characteristics."""
+    uuids = {str(x.uuid) for x in service.characteristics}
+    return str(COMMAND_UUID_ATOM) in uuids and str(COMMAND_UUID_ATOM_NOTIFY) in uuids
+
+
+def _store_sensors(
+    device: AirthingsDevice,
+    sensors: dict[str, str | float | None],
+    values: dict[str, str | float | None],
+) -> None:
+    """Store sensor values, with the time they were read in the device."""
+    now = time.time()
+    sensors.update(values)
+    device.sensor_timestamps.update(dict.fromkeys(values, now))
+
+
+def _next_atom_command(decoder: AtomCommandDecode) -> bytes:
+    """Create a new request for the latest values, to match its response."""
+    decoder.set_request(url=AtomRequestPath.LATEST_VALUES)
+    return decoder.cmd
+
+
+def _copy_device(
+    device: AirthingsDevice, keep_airtime: bool = False
+) -> AirthingsDevice:
+    """Copy a device so that callers sharing a result cannot affect each other.
+
+    The airtime is only kept for the caller that made the connection, so that
+    cached and shared readings are not counted again by their callers.
+    """
+    device_copy = copy.copy(device)
+    device_copy.sensors = dict(device.sensors)
+    device_copy.sensor_timestamps = dict(device.sensor_timestamps)
+    device_copy.airtime = (
+        dataclasses.replace(device.airtime)
+        if keep_airtime and device.airtime is not None
+        else None
+    )
+    return device_copy
+
 
 # pylint: disable=too-many-locals
 # pylint: disable=too-many-branches
 # pylint: disable=too-few-public-methods
+# pylint: disable=too-many-arguments,too-many-positional-arguments
 class AirthingsBluetoothDeviceData:
     """Data for Airthings BLE sensors."""
 
@@ -173,17 +284,79 @@ class AirthingsBluetoothDeviceData:
         logger: Logger,
         is_metric: bool = True,
         max_attempts: int = DEFAULT_MAX_UPDATE_ATTEMPTS,
+        cache_ttl: float = DEFAULT_CACHE_TTL,
+        radon_levels: list[AirthingsRadonLevel] | None = None,
+        adapter_balancer: AdapterBalancer | None = None,
+        connection_pool: ConnectionPool | None = None,
+        scheduler: MeasurementScheduler | None = None,
+        update_deadline: float | None = None,
+        metrics: UpdateMetrics | None = None,
     ) -> None:
         """Initialize the Airthings BLE sensor data object."""
         self.logger = logger
         self.is_metric = is_metric
         self.device_info = AirthingsDeviceInfo()
         self.max_attempts = max_attempts
+        self.cache_ttl = cache_ttl
+        self.radon_classifier: StepClassifier = (
+            DEFAULT_RADON_CLASSIFIER
+            if radon_levels is None
+            else radon_classifier(radon_levels)
+        )
+        self.adapter_balancer = adapter_balancer
+        self.connection_pool = connection_pool
+        self.scheduler = scheduler
+        self.update_deadline = update_deadline
+        self.metrics = metrics
+        # Connection time and GATT traffic of all updates, by address
+        self.airtime: dict[str, AirtimeStats] = {}
+        self._pending_updates: dict[str, asyncio.Future[AirthingsDevice]] = {}
+        self._listeners: list[UpdateListener] = []
+        self._frame_listeners: list[RawFrameListener] = []
+        self._cached_devices: dict[str, tuple[float, AirthingsDevice]] = {}
 
     def set_max_attempts(self, max_attempts: int) -> None:
         """Set the number of attempts."""
         self.max_attempts = max_attempts
 
+    def add_listener(self, listener: UpdateListener) -> Callable[[], None]:
+        """Call `listener` with every new reading, returns a function to remove it.
+
+        The listener gets the shared result of the update, which must not be
+        modified.
+        """
+        self._listeners.append(listener)
+        return partial(self._listeners.remove, listener)
+
+    def add_frame_listener(self, listener: RawFrameListener) -> Callable[[], None]:
+        """Call `listener` with the raw data read from devices during updates.
+
+        Returns a function to remove the listener.
+        """
+        self._frame_listeners.append(listener)
+        return partial(self._frame_listeners.remove, listener)
+
+    def _handle_frame(self, address: str, characteristic: str, data: bytes) -> None:
+        for listener in list(self._frame_listeners):
+            try:
+                listener(address, characteristic, data)
+            except Exception:  # pylint: disable=broad-exception-caught
+                self.logger.exception("Error in frame listener")
+
+    def set_update_deadline(self, update_deadline: float | None) -> None:
+        """Set the time (in seconds) an update may take before partial data is returned.
+
+        None disables partial results, and an update that takes longer than
+        UPDATE_TIMEOUT fails.
+        """
+        self.update_deadline = update_deadline
+
+    def set_cache_ttl(self, cache_ttl: float) -> None:
+        """Set how long (in seconds) a reading is served without reconnecting."""
+        self.cache_ttl = cache_ttl
+        if cache_ttl <= 0:
+            self._cached_devices.clear()
+
     async def _get_device_characteristics(
         self, client: BleakClient, device: AirthingsDevice
     ) -> None:
@@ -193,8 +366,9 @@ class AirthingsBluetoothDeviceData:
 
         device.firmware.update_current_version(device_info.sw_version)
 
-        # We need to fetch model to determ what to fetch.
-        if not did_first_sync:
+        # We need to fetch model to determ what to fetch, unless it was already
+        # found in the advertisement.
+        if not did_first_sync and device_info.model == AirthingsDeviceType.UNKNOWN:
             try:
                 data = await client.read_gatt_char(CHAR_UUID_MODEL_NUMBER_STRING)
             except BleakError as err:
@@ -217,7 +391,6 @@ class AirthingsBluetoothDeviceData:
             if did_first_sync and characteristic.name != "firmware_rev":
                 # Only the sw_version can change once set, so we can skip the rest.
                 continue
-
             try:
                 data = await client.read_gatt_char(characteristic.uuid)
             except BleakError as err:
@@ -272,14 +445,7 @@ class AirthingsBluetoothDeviceData:
         sensors = device.sensors
         for service in svcs:
             if (
-                (
-                    str(COMMAND_UUID_ATOM)
-                    in (str(x.uuid) for x in service.characteristics)
-                )
-                and (
-                    str(COMMAND_UUID_ATOM_NOTIFY)
-                    in (str(x.uuid) for x in service.characteristics)
-                )
+                _is_atom_service(service)
                 and device.model in AirthingsDeviceType.atom_devices()
             ):
                 await self._atom_sensor_data(client, device, sensors, service)
@@ -293,7 +459,10 @@ class AirthingsBluetoothDeviceData:
         sensors: dict[str, str | float | None],
         service: BleakGATTService,
     ) -> None:
-        for characteristic in service.characteristics:
+        for characteristic in sorted(
+            service.characteristics,
+            key=lambda x: _READ_PRIORITY.get(str(x.uuid), 0),
+        ):
             uuid = characteristic.uuid
             uuid_str = str(uuid)
             if uuid in sensors_characteristics_uuid_str and uuid_str in SENSOR_DECODERS:
@@ -303,23 +472,12 @@ class AirthingsBluetoothDeviceData:
                     self.logger.debug("Get service characteristics exception: %s", err)
                     continue
 
-                sensor_data = SENSOR_DECODERS[uuid_str](data)
-
-                # Skipping for now
-                if "date_time" in sensor_data:
-                    sensor_data.pop("date_time")
-
-                sensors.update(sensor_data)
-
-                # Manage radon values
-                if (d := sensor_data.get(RADON_1DAY_AVG)) is not None:
-                    sensors[RADON_1DAY_LEVEL] = get_radon_level(float(d))
-                    if not self.is_metric:
-                        sensors[RADON_1DAY_AVG] = float(d) * BQ_TO_PCI_MULTIPLIER
-                if (d := sensor_data.get(RADON_LONGTERM_AVG)) is not None:
-                    sensors[RADON_LONGTERM_LEVEL] = get_radon_level(float(d))
-                    if not self.is_metric:
-                        sensors[RADON_LONGTERM_AVG] = float(d) * BQ_TO_PCI_MULTIPLIER
+                with loop_phase(PHASE_DECODE):
+                    _store_sensors(
+                        device,
+                        sensors,
+                        self._wave_sensor_values(device, uuid_str, data),
+                    )
 
             if uuid_str in COMMAND_DECODERS:
                 decoder = COMMAND_DECODERS[uuid_str]
@@ -334,26 +492,86 @@ class AirthingsBluetoothDeviceData:
                     await command_data_receiver.wait_for_message(5)
                 except asyncio.TimeoutError:
                     self.logger.warning("Timeout getting command data.")
-
-                command_sensor_data = decoder.decode_data(
-                    logger=self.logger, raw_data=command_data_receiver.message
-                )
-                if command_sensor_data is not None:
-                    new_values: dict[str, float | str | None] = {}
-
-                    if (bat_data := command_sensor_data.get(BATTERY)) is not None:
-                        new_values[BATTERY] = device.model.battery_percentage(
-                            float(bat_data)
+                    self._count_notification_timeout(client)
+
+                with loop_phase(PHASE_DECODE):
+                    command_sensor_data = decoder.decode_data(
+                        logger=self.logger, raw_data=command_data_receiver.message
+                    )
+                    if command_sensor_data is not None:
+                        _store_sensors(
+                            device,
+                            sensors,
+                            self._command_sensor_values(device, command_sensor_data),
                         )
 
-                    if illuminance := command_sensor_data.get(ILLUMINANCE):
-                        new_values[ILLUMINANCE] = illuminance
-
-                    sensors.update(new_values)
-
                 # Stop notification handler
                 await client.stop_notify(characteristic)
 
+    def _wave_sensor_values(
+        self, device: AirthingsDevice, uuid_str: str, data: bytes | bytearray
+    ) -> dict[str, str | float | None]:
+        """Decode the value of a Wave sensor characteristic."""
+        sensor_data = SENSOR_DECODERS[uuid_str](bytearray(data))
+
+        if (date_time := sensor_data.pop(DATE_TIME, None)) is not None and (
+            uuid_str == str(CHAR_UUID_DATETIME)
+        ):
+            # Only the date time characteristic holds the device clock,
+            # the other decoders set the time of decoding.
+            device.device_time = datetime.fromisoformat(str(date_time))
+
+        # Manage radon values
+        if (d := sensor_data.get(RADON_1DAY_AVG)) is not None:
+            sensor_data[RADON_1DAY_LEVEL] = self.radon_classifier(float(d))
+            if not self.is_metric:
+                sensor_data[RADON_1DAY_AVG] = BQ_TO_PCI(float(d))
+        if (d := sensor_data.get(RADON_LONGTERM_AVG)) is not None:
+            sensor_data[RADON_LONGTERM_LEVEL] = self.radon_classifier(float(d))
+            if not self.is_metric:
+                sensor_data[RADON_LONGTERM_AVG] = BQ_TO_PCI(float(d))
+        return sensor_data
+
+    def _command_sensor_values(
+        self,
+        device: AirthingsDevice,
+        command_sensor_data: dict[str, float | str | None],
+    ) -> dict[str, str | float | None]:
+        """Convert the values of a Wave command response."""
+        new_values: dict[str, float | str | None] = {}
+
+        if (bat_data := command_sensor_data.get(BATTERY)) is not None:
+            new_values[BATTERY] = device.model.battery_percentage(float(bat_data))
+
+        if illuminance := command_sensor_data.get(ILLUMINANCE):
+            new_values[ILLUMINANCE] = illuminance
+
+        return new_values
+
+    def decode_message(
+        self, device: AirthingsDevice, characteristic: str, message: bytes
+    ) -> dict[str, str | float | None]:
+        """Decode a complete message read from, or notified by, a characteristic.
+
+        The values are converted like they are during an update, with the
+        model of `device`. An Atom response is decoded without its request, and
+        only the latest values are converted. Other characteristics have no
+        values. Raises `ValueError` if the message is invalid.
+        """
+        if characteristic in SENSOR_DECODERS:
+            return self._wave_sensor_values(device, characteristic, message)
+        if (command := COMMAND_DECODERS.get(characteristic)) is not None:
+            values = command.decode_data(self.logger, bytearray(message))
+            return {} if values is None else self._command_sensor_values(device, values)
+        if characteristic != str(COMMAND_UUID_ATOM_NOTIFY):
+            return {}
+        path, values = decode_atom_response(self.logger, message)
+        if values is None or path != AtomRequestPath.LATEST_VALUES:
+            return values or {}
+        sensors: dict[str, str | float | None] = {}
+        self._parse_sensor_data(device=device, sensors=sensors, sensor_data=values)
+        return sensors
+
     async def _atom_sensor_data(
         self,
         client: BleakClient,
@@ -374,14 +592,6 @@ class AirthingsBluetoothDeviceData:
                 device.firmware.required_version or "N/A",
             )
 
-        connectivity_data = await self._create_decoder_and_fetch(
-            client=client,
-            service=service,
-            url=AtomRequestPath.CONNECTIVITY_MODE,
-        )
-        if connectivity_data is not None:
-            sensors.update(connectivity_data)
-
         sensor_data = await self._create_decoder_and_fetch(
             client=client,
             service=service,
@@ -394,6 +604,14 @@ class AirthingsBluetoothDeviceData:
                 sensor_data=sensor_data,
             )
 
+        connectivity_data = await self._create_decoder_and_fetch(
+            client=client,
+            service=service,
+            url=AtomRequestPath.CONNECTIVITY_MODE,
+        )
+        if connectivity_data is not None:
+            _store_sensors(device, sensors, connectivity_data)
+
     async def _create_decoder_and_fetch(
         self,
         client: BleakClient,
@@ -404,6 +622,27 @@ class AirthingsBluetoothDeviceData:
         decoder = AtomCommandDecode(url=url)
         command_data_receiver = decoder.make_data_receiver()
 
+        await self._atom_exchange(
+            client=client,
+            service=service,
+            cmd=decoder.cmd,
+            receiver=command_data_receiver,
+        )
+
+        with loop_phase(PHASE_DECODE):
+            return decoder.decode_data(
+                logger=self.logger,
+                raw_data=command_data_receiver.message,
+            )
+
+    async def _atom_exchange(
+        self,
+        client: BleakClient,
+        service: BleakGATTService,
+        cmd: bytes,
+        receiver: NotificationReceiver,
+    ) -> None:
+        """Send a command to an Atom device and wait for the response."""
         atom_write = service.get_characteristic(COMMAND_UUID_ATOM)
         atom_notify = service.get_characteristic(COMMAND_UUID_ATOM_NOTIFY)
 
@@ -411,26 +650,24 @@ class AirthingsBluetoothDeviceData:
             raise ValueError("Missing characteristics for device")
 
         # Set up the notification handlers
-        await client.start_notify(
-            char_specifier=atom_notify, callback=command_data_receiver
-        )
+        await client.start_notify(char_specifier=atom_notify, callback=receiver)
 
         # send command to this 'indicate' characteristic
-        await client.write_gatt_char(atom_write, bytearray(decoder.cmd))
+        await client.write_gatt_char(atom_write, bytearray(cmd))
         # Wait for up to five seconds to see if a callback comes in.
         try:
-            await command_data_receiver.wait_for_message(5)
+            await receiver.wait_for_message(5)
         except asyncio.TimeoutError:
             self.logger.warning("Timeout getting command data.")
-
-        data = decoder.decode_data(
-            logger=self.logger,
-            raw_data=command_data_receiver.message,
-        )
+            self._count_notification_timeout(client)
 
         await client.stop_notify(atom_notify)
 
-        return data
+    def _count_notification_timeout(self, client: BleakClient) -> None:
+        if self.metrics is not None:
+            self.metrics.notification_timeouts.labels(
+                *self._metric_labels(client.address)
+            ).inc()
 
     def _parse_sensor_data(
         self,
@@ -444,7 +681,7 @@ class AirthingsBluetoothDeviceData:
 
             if (bat_data := sensor_data.get(ATOM_BAT)) is not None:
                 new_values[BATTERY] = device.model.battery_percentage(
-                    float(bat_data) / 1000.0
+                    ATOM_BATTERY_TO_VOLT(float(bat_data))
                 )
 
             if (lux := sensor_data.get(ATOM_LUX)) is not None:
@@ -457,53 +694,60 @@ class AirthingsBluetoothDeviceData:
                 new_values[VOC] = voc
 
             if (hum := sensor_data.get(ATOM_HUMIDITY)) is not None:
-                new_values[HUMIDITY] = float(hum) / 100.0
+                new_values[HUMIDITY] = ATOM_HUMIDITY_TO_PERCENT(float(hum))
 
             if (temperature := sensor_data.get(ATOM_TEMPERATURE)) is not None:
-                # Temperature reported as kelvin
-                new_values[TEMPERATURE] = round(float(temperature) / 100.0 - 273.15, 2)
+                new_values[TEMPERATURE] = CENTIKELVIN_TO_CELSIUS(float(temperature))
 
             if (noise := sensor_data.get(ATOM_NOISE)) is not None:
                 new_values[NOISE] = noise
 
             if (pressure := sensor_data.get(ATOM_PRESSURE)) is not None:
-                new_values[PRESSURE] = float(pressure) / (64 * 100)
+                new_values[PRESSURE] = ATOM_PRESSURE_TO_HPA(float(pressure))
 
             if (radon_1day_avg := sensor_data.get(ATOM_RADON_1DAY_AVG)) is not None:
                 new_values[RADON_1DAY_AVG] = (
                     float(radon_1day_avg)
                     if self.is_metric
-                    else float(radon_1day_avg) * BQ_TO_PCI_MULTIPLIER
+                    else BQ_TO_PCI(float(radon_1day_avg))
+                )
+                new_values[RADON_1DAY_LEVEL] = self.radon_classifier(
+                    float(radon_1day_avg)
                 )
-                new_values[RADON_1DAY_LEVEL] = get_radon_level(float(radon_1day_avg))
 
             if (radon_week_avg := sensor_data.get(ATOM_RADON_WEEK_AVG)) is not None:
                 new_values[RADON_WEEK_AVG] = (
                     float(radon_week_avg)
                     if self.is_metric
-                    else float(radon_week_avg) * BQ_TO_PCI_MULTIPLIER
+                    else BQ_TO_PCI(float(radon_week_avg))
+                )
+                new_values[RADON_WEEK_LEVEL] = self.radon_classifier(
+                    float(radon_week_avg)
                 )
-                new_values[RADON_WEEK_LEVEL] = get_radon_level(float(radon_week_avg))
 
             if (radon_month_avg := sensor_data.get(ATOM_RADON_MONTH_AVG)) is not None:
                 new_values[RADON_MONTH_AVG] = (
                     float(radon_month_avg)
                     if self.is_metric
-                    else float(radon_month_avg) * BQ_TO_PCI_MULTIPLIER
+                    else BQ_TO_PCI(float(radon_month_avg))
+                )
+                new_values[RADON_MONTH_LEVEL] = self.radon_classifier(
+                    float(radon_month_avg)
                 )
-                new_values[RADON_MONTH_LEVEL] = get_radon_level(float(radon_month_avg))
 
             if (radon_year_avg := sensor_data.get(ATOM_RADON_YEAR_AVG)) is not None:
                 new_values[RADON_YEAR_AVG] = (
                     float(radon_year_avg)
                     if self.is_metric
-                    else float(radon_year_avg) * BQ_TO_PCI_MULTIPLIER
+                    else BQ_TO_PCI(float(radon_year_avg))
+                )
+                new_values[RADON_YEAR_LEVEL] = self.radon_classifier(
+                    float(radon_year_avg)
                 )
-                new_values[RADON_YEAR_LEVEL] = get_radon_level(float(radon_year_avg))
 
             self.logger.debug("Sensor values: %s", new_values)
 
-            sensors.update(new_values)
+            _store_sensors(device, sensors, new_values)
 
     def _handle_disconnect(
         self, disconnect_future: asyncio.Future[bool], client: BleakClient
@@ -513,45 +757,199 @@ class AirthingsBluetoothDeviceData:
         if not disconnect_future.done():
             disconnect_future.set_result(True)
 
-    async def update_device(self, ble_device: BLEDevice) -> AirthingsDevice:
-        """Connects to the device through BLE and retrieves relevant data"""
+    async def update_device(
+        self,
+        ble_device: BLEDevice,
+        advertisement_data: AdvertisementData | None = None,
+    ) -> AirthingsDevice:
+        """Connects to the device through BLE and retrieves relevant data
+
+        Concurrent calls for the same address share a single connection and
+        result. If `cache_ttl` is set, a reading younger than the TTL is
+        returned without connecting to the device. With a `scheduler`, the
+        previous reading is returned until a new sample is expected.
+
+        If `update_deadline` is set, the sensor values are read first, and the
+        values read so far are returned with `partial` set if the deadline is
+        reached or the device disconnects.
+
+        If the model can be found from the advertisement, it is not read from
+        the device on the first connection, and unsupported models are rejected
+        without connecting. The serial number and name read from the device
+        replace the advertised ones, which are only kept if the reads fail.
+        """
         # Try to abort early if the device name indicates it is not supported.
         # In some cases we only get the mac address, so we need to connect to
         # the device to get the name.
         if name := ble_device.name:
             if "Renew" in name or "View" in name:
                 raise UnsupportedDeviceError(f"Model {name} is not supported")
-        for attempt in range(self.max_attempts):
-            is_final_attempt = attempt == self.max_attempts - 1
-            try:
-                return await self._update_device(ble_device)
-            except DisconnectedError:
-                if is_final_attempt:
-                    raise
-                self.logger.debug(
-                    "Unexpectedly disconnected from %s", ble_device.address
+
+        if not self.device_info.did_first_sync:
+            advertisement = parse_advertisement(
+                name=ble_device.name,
+                manufacturer_data=(
+                    advertisement_data.manufacturer_data
+                    if advertisement_data is not None
+                    else None
+                ),
+            )
+            if advertisement is not None:
+                self._apply_advertisement(advertisement)
+
+        address = ble_device.address
+        if (cached := self._get_cached_device(address)) is not None:
+            self.logger.debug("Using cached data for %s", address)
+            return cached
+
+        pending = self._pending_updates.get(address)
+        # Only the caller that starts the update gets its airtime
+        started = pending is None
+        if pending is None:
+            pending = asyncio.ensure_future(
+                self._update_device_with_retries(ble_device)
+            )
+            self._pending_updates[address] = pending
+            pending.add_done_callback(partial(self._handle_update_done, address))
+        else:
+            self.logger.debug("Joining in-flight update for %s", address)
+
+        # Shield the shared update so that a cancelled caller does not abort
+        # the update for the other callers waiting on the same address.
+        return _copy_device(await asyncio.shield(pending), keep_airtime=started)
+
+    def _apply_advertisement(self, advertisement: AirthingsAdvertisement) -> None:
+        """Use the device information found in the advertisement."""
+        if not advertisement.is_supported:
+            raise UnsupportedDeviceError(
+                f"Model {advertisement.model_raw} is not supported"
+            )
+        device_info = self.device_info
+        if device_info.model == AirthingsDeviceType.UNKNOWN:
+            device_info.model = advertisement.model
+        if not device_info.identifier:
+            device_info.identifier = advertisement.identifier
+        if not device_info.name:
+            device_info.name = advertisement.name
+
+    def _get_cached_device(self, address: str) -> AirthingsDevice | None:
+        """Get a cached reading for the address if it is still fresh."""
+        if (cached := self._cached_devices.get(address)) is None:
+            return None
+        timestamp, device = cached
+        if self.cache_ttl > 0 and time.monotonic() - timestamp <= self.cache_ttl:
+            return _copy_device(device)
+        if self.scheduler is not None:
+            if not self.scheduler.should_poll(address):
+                return _copy_device(device)
+        else:
+            del self._cached_devices[address]
+        return None
+
+    def _handle_update_done(
+        self, address: str, future: asyncio.Future[AirthingsDevice]
+    ) -> None:
+        """Store the result of a finished update and release the in-flight slot."""
+        if self._pending_updates.get(address) is future:
+            del self._pending_updates[address]
+        if future.cancelled() or future.exception() is not None:
+            return
+        device = future.result()
+        with loop_phase(PHASE_LISTENER):
+            for listener in list(self._listeners):
+                try:
+                    listener(device)
+                except Exception:  # pylint: disable=broad-exception-caught
+                    self.logger.exception("Error in update listener")
+        if device.partial:
+            # Do not serve or learn from an incomplete reading
+            return
+        if self.scheduler is not None:
+            self.scheduler.observe(device)
+        if self.cache_ttl > 0 or self.scheduler is not None:
+            self._cached_devices[address] = (time.monotonic(), device)
+
+    async def _update_device_with_retries(
+        self, ble_device: BLEDevice
+    ) -> AirthingsDevice:
+        """Update the device, retrying up to `max_attempts` times."""
+        started = time.monotonic()
+        result = "error"
+        try:
+            for attempt in range(self.max_attempts):
+                is_final_attempt = attempt == self.max_attempts - 1
+                if attempt and self.metrics is not None:
+                    self.metrics.retries.labels(
+                        *self._metric_labels(ble_device.address)
+                    ).inc()
+                try:
+                    device = await self._update_device(ble_device)
+                    result = "partial" if device.partial else "ok"
+                    return device
+                except DisconnectedError:
+                    if self.metrics is not None:
+                        self.metrics.disconnects.labels(
+                            *self._metric_labels(ble_device.address)
+                        ).inc()
+                    if is_final_attempt:
+                        raise
+                    self.logger.debug(
+                        "Unexpectedly disconnected from %s", ble_device.address
+                    )
+                except BleakError as err:
+                    if is_final_attempt:
+                        raise
+                    self.logger.debug("Bleak error: %s", err)
+            raise RuntimeError("Should not reach this point")
+        finally:
+            if self.metrics is not None:
+                self.metrics.observe_update(
+                    *self._metric_labels(ble_device.address),
+                    time.monotonic() - started,
+                    result,
                 )
-            except BleakError as err:
-                if is_final_attempt:
-                    raise
-                self.logger.debug("Bleak error: %s", err)
-        raise RuntimeError("Should not reach this point")
+
+    def _metric_labels(self, address: str) -> tuple[str, str]:
+        """Get the model and address labels of the metrics of the device."""
+        return self.device_info.model.name, address
+
+    def _connection_target(
+        self, ble_device: BLEDevice
+    ) -> AsyncContextManager[BLEDevice]:
+        """Get the device to connect to, routed over the best adapter if balanced.
+
+        A connection pool routes its connections itself, as they keep their
+        adapter slot after the update.
+        """
+        if self.adapter_balancer is None or self.connection_pool is not None:
+            return contextlib.nullcontext(ble_device)
+        return self.adapter_balancer.acquire(ble_device)
 
     async def _update_device(self, ble_device: BLEDevice) -> AirthingsDevice:
         """Connects to the device through BLE and retrieves relevant data"""
+        async with self._connection_target(ble_device) as target:
+            return await self._update_device_session(target)
+
+    async def _update_device_session(self, ble_device: BLEDevice) -> AirthingsDevice:
+        """Connect to the device and read all data in a single session."""
         device = AirthingsDevice()
         loop = asyncio.get_running_loop()
         disconnect_future = loop.create_future()
-        client: BleakClientWithServiceCache = (
-            await establish_connection(  # pylint: disable=line-too-long
-                BleakClientWithServiceCache,
-                ble_device,
-                ble_device.address,
-                disconnected_callback=partial(
-                    self._handle_disconnect, disconnect_future
-                ),
-            )
+        started = time.monotonic()
+        client = await self._establish_connection(ble_device, disconnect_future)
+        connected = time.monotonic()
+        airtime = AirtimeStats(connections=1, connect_seconds=connected - started)
+        metered = metered_client(
+            client,
+            airtime,
+            (
+                partial(self._handle_frame, ble_device.address)
+                if self._frame_listeners
+                else None
+            ),
         )
+        keep_connection = False
+        deadline = self.update_deadline
         try:
             async with (
                 interrupt(
@@ -559,20 +957,218 @@ class AirthingsBluetoothDeviceData:
                     DisconnectedError,
                     f"Disconnected from {client.address}",
                 ),
-                asyncio.timeout(UPDATE_TIMEOUT),
+                asyncio.timeout(UPDATE_TIMEOUT if deadline is None else deadline),
             ):
-                await self._get_device_characteristics(client, device)
-                await self._get_service_characteristics(client, device)
+                await self._get_device_characteristics(metered, device)
+                await self._get_service_characteristics(metered, device)
+            keep_connection = True
+        except (TimeoutError, DisconnectedError) as err:
+            if deadline is None or not device.sensors:
+                raise
+            # Keep the values read so far instead of discarding the session
+            self.logger.debug(
+                "Returning partial data for %s: %s",
+                client.address,
+                type(err).__name__,
+            )
+            device.partial = True
         except BleakError as err:
             if "not found" in str(err):  # In future bleak this is a named exception
                 # Clear the char cache since a char is likely
                 # missing from the cache
                 await client.clear_cache()
             raise
-        except UnsupportedDeviceError:
+        finally:
+            await self._release_connection(client, keep_connection)
+            airtime.connected_seconds = time.monotonic() - connected
+            self.airtime.setdefault(ble_device.address, AirtimeStats()).add(airtime)
+
+        device.airtime = airtime
+        return device
+
+    async def _establish_connection(
+        self, ble_device: BLEDevice, disconnect_future: asyncio.Future[bool]
+    ) -> BleakClientWithServiceCache:
+        """Connect to the device, reusing a pooled connection if possible."""
+        try:
+            if self.connection_pool is not None:
+                return await self.connection_pool.acquire(
+                    ble_device,
+                    partial(self._handle_disconnect, disconnect_future),
+                    self.adapter_balancer,
+                )
+            client: BleakClientWithServiceCache = (
+                await establish_connection(  # pylint: disable=line-too-long
+                    BleakClientWithServiceCache,
+                    ble_device,
+                    ble_device.address,
+                    disconnected_callback=partial(
+                        self._handle_disconnect, disconnect_future
+                    ),
+                )
+            )
+        except Exception:
+            if self.metrics is not None:
+                self.metrics.connect_failures.labels(
+                    *self._metric_labels(ble_device.address)
+                ).inc()
+            raise
+        return client
+
+    async def _release_connection(
+        self, client: BleakClientWithServiceCache, keep: bool
+    ) -> None:
+        """Give the connection back to the pool, or disconnect."""
+        if self.connection_pool is not None:
+            await self.connection_pool.release(client, keep=keep)
+        else:
             await client.disconnect()
+
+    async def subscribe(
+        self, ble_device: BLEDevice, callback: SubscriptionCallback
+    ) -> AirthingsSubscription:
+        """Keep the device connected and receive sensor values as notifications.
+
+        All values are read once and passed to the callback, then
+        notifications are enabled for the characteristics that support them.
+        Values that the device only sends in response to a request, like the
+        Atom sensor values and the Wave battery level, are requested with
+        `AirthingsSubscription.refresh`.
+        """
+        device = AirthingsDevice()
+        loop = asyncio.get_running_loop()
+        disconnect_future = loop.create_future()
+        started = time.monotonic()
+        client = await self._establish_connection(ble_device, disconnect_future)
+        connected = time.monotonic()
+        # Count the traffic in the totals as it happens, as a subscription can
+        # last for a long time
+        airtime = self.airtime.setdefault(ble_device.address, AirtimeStats())
+        airtime.connections += 1
+        airtime.connect_seconds += connected - started
+        metered = metered_client(
+            client,
+            airtime,
+            (
+                partial(self._handle_frame, ble_device.address)
+                if self._frame_listeners
+                else None
+            ),
+        )
+        subscription = AirthingsSubscription(
+            client=metered,
+            device=device,
+            callback=callback,
+            logger=self.logger,
+            disconnected=disconnect_future,
+            release=partial(self._release_subscription, client, airtime, connected),
+        )
+        try:
+            async with (
+                interrupt(
+                    disconnect_future,
+                    DisconnectedError,
+                    f"Disconnected from {client.address}",
+                ),
+                asyncio.timeout(UPDATE_TIMEOUT),
+            ):
+                await self._get_device_characteristics(metered, device)
+                await self._get_service_characteristics(metered, device)
+                self._add_notify_channels(subscription)
+                await subscription.start()
+        except BaseException:
+            await self._release_subscription(client, airtime, connected, False)
             raise
+
+        callback(device)
+        return subscription
+
+    async def _release_subscription(
+        self,
+        client: BleakClientWithServiceCache,
+        airtime: AirtimeStats,
+        connected: float,
+        keep: bool,
+    ) -> None:
+        """Release the connection of a subscription and count its duration."""
+        try:
+            await self._release_connection(client, keep)
         finally:
-            await client.disconnect()
+            airtime.connected_seconds += time.monotonic() - connected
 
-        return device
+    def _add_notify_channels(self, subscription: AirthingsSubscription) -> None:
+        """Add the characteristics of the device that can notify sensor values."""
+        device = subscription.device
+        for service in subscription.client.services:
+            if (
+                _is_atom_service(service)
+                and device.model in AirthingsDeviceType.atom_devices()
+            ):
+                atom_notify = service.get_characteristic(COMMAND_UUID_ATOM_NOTIFY)
+                atom_write = service.get_characteristic(COMMAND_UUID_ATOM)
+                if atom_notify is None or atom_write is None:
+                    continue
+                decoder = AtomCommandDecode(url=AtomRequestPath.LATEST_VALUES)
+                subscription.add_channel(
+                    NotifyChannel(
+                        characteristic=atom_notify,
+                        handle_frame=partial(self._handle_atom_frame, device, decoder),
+                        frames=AtomFrames(),
+                        command=partial(_next_atom_command, decoder),
+                        write_to=atom_write,
+                    )
+                )
+                continue
+
+            for characteristic in service.characteristics:
+                if not {"notify", "indicate"} & set(characteristic.properties):
+                    continue
+                uuid_str = str(characteristic.uuid)
+                if uuid_str in SENSOR_DECODERS:
+                    subscription.add_channel(
+                        NotifyChannel(
+                            characteristic=characteristic,
+                            handle_frame=partial(
+                                self._handle_wave_frame, device, uuid_str
+                            ),
+                        )
+                    )
+                elif (command := COMMAND_DECODERS.get(uuid_str)) is not None:
+                    subscription.add_channel(
+                        NotifyChannel(
+                            characteristic=characteristic,
+                            handle_frame=partial(
+                                self._handle_command_frame, device, command
+                            ),
+                            frames=SizedFrames(command.message_size),
+                            command=partial(bytes, command.cmd),
+                            write_to=characteristic,
+                        )
+                    )
+
+    def _handle_wave_frame(
+        self, device: AirthingsDevice, uuid_str: str, frame: bytes
+    ) -> bool:
+        """Store the values of a Wave sensor notification."""
+        values = self._wave_sensor_values(device, uuid_str, frame)
+        _store_sensors(device, device.sensors, values)
+        return bool(values)
+
+    def _handle_command_frame(
+        self, device: AirthingsDevice, decoder: CommandDecode, frame: bytes
+    ) -> bool:
+        """Store the values of a Wave command response."""
+        if (data := decoder.decode_data(self.logger, bytearray(frame))) is None:
+            return False
+        values = self._command_sensor_values(device, data)
+        _store_sensors(device, device.sensors, values)
+        return bool(values)
+
+    def _handle_atom_frame(
+        self, device: AirthingsDevice, decoder: AtomCommandDecode, frame: bytes
+    ) -> bool:
+        """Store the values of an Atom response."""
+        if (data := decoder.decode_data(self.logger, bytearray(frame))) is None:
+            return False
+        self._parse_sensor_data(device=device, sensors=device.sensors, sensor_data=data)
+        return True
@@ -1,8 +1,13 @@
 """Airthings radon level definitions and utilities."""
 
+import math
 from dataclasses import dataclass
 from typing import Optional
 
+from .conversion import StepClassifier
+
+UNKNOWN_LEVEL = "unknown"
+
 
 @dataclass(frozen=True)
 class AirthingsRadonLevel:
@@ -23,16 +28,36 @@ LEVELS = [
 ]
 
 
-def _in_range(value: float, min_value: float | None, max_value: float | None) -> bool:
-    """Check if value is in range [min_value, max_value)."""
-    return (min_value is None or value >= min_value) and (
-        max_value is None or value < max_value
+def radon_classifier(levels: list[AirthingsRadonLevel]) -> StepClassifier:
+    """Create a classifier for the radon levels.
+
+    The levels must be contiguous, each level starting where the previous ends.
+    """
+    levels = sorted(
+        levels, key=lambda x: -math.inf if x.min_value is None else x.min_value
     )
+    bounds: list[float] = []
+    labels: list[str] = []
+    for index, level in enumerate(levels):
+        if level.min_value is None:
+            if index != 0:
+                raise ValueError("Only the first level can be without minimum")
+        else:
+            bounds.append(level.min_value)
+            labels.append(level.name)
+        if index > 0 and levels[index - 1].max_value != level.min_value:
+            raise ValueError("Radon levels must be contiguous")
+
+    below_label = levels[0].name if levels[0].min_value is None else UNKNOWN_LEVEL
+    if (max_value := levels[-1].max_value) is not None:
+        bounds.append(max_value)
+        labels.append(UNKNOWN_LEVEL)
+    return StepClassifier(bounds=bounds, labels=labels, below_label=below_label)
+
+
+DEFAULT_RADON_CLASSIFIER = radon_classifier(LEVELS)
 
 
 def get_radon_level(value: float) -> str:
     """Get radon level string based on value."""
-    for level in LEVELS:
-        if _in_range(value, level.min_value, level.max_value):
-            return level.name
-    return "unknown"
+    return DEFAULT_RADON_CLASSIFIER(value)
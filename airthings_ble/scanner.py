@@ -0,0 +1,207 @@
+"""Discover Airthings devices from BLE advertisements."""
+
+from __future__ import annotations
+
+import dataclasses
+import time
+from functools import partial
+from typing import Any, Callable, Iterable
+
+from bleak import BleakScanner
+from bleak.backends.device import BLEDevice
+from bleak.backends.scanner import AdvertisementData
+
+from .advertisement import parse_advertisement
+from .const import (
+    AIRTHINGS_UUID_SUFFIX,
+    DEFAULT_RSSI_MAX_AGE,
+    DEFAULT_SCANNER_RSSI_ALPHA,
+    MFCT_ID,
+)
+from .device_type import AirthingsDeviceType
+
+
+def is_airthings_advertisement(advertisement_data: AdvertisementData) -> bool:
+    """Check if an advertisement has the Airthings manufacturer ID or services."""
+    return MFCT_ID in advertisement_data.manufacturer_data or any(
+        x.endswith(AIRTHINGS_UUID_SUFFIX) for x in advertisement_data.service_uuids
+    )
+
+
+# pylint: disable=too-many-instance-attributes
+@dataclasses.dataclass
+class ScannedDevice:
+    """An Airthings device seen by the scanner."""
+
+    ble_device: BLEDevice
+    # Latest advertisement of the device
+    advertisement_data: AdvertisementData | None = None
+    model: AirthingsDeviceType = AirthingsDeviceType.UNKNOWN
+    identifier: str = ""
+    # Smoothed RSSI, and the RSSI of the latest advertisement
+    rssi: float = 0.0
+    last_rssi: int = 0
+    # Monotonic time the device was first and last seen
+    first_seen: float = 0.0
+    last_seen: float = 0.0
+    advertisements: int = 0
+
+    @property
+    def address(self) -> str:
+        """Address of the device."""
+        return self.ble_device.address
+
+    def age(self, now: float | None = None) -> float:
+        """Seconds since the latest advertisement."""
+        return (time.monotonic() if now is None else now) - self.last_seen
+
+
+ScanListener = Callable[[ScannedDevice], None]
+
+
+class AirthingsScanner:
+    """Keep a table of the Airthings devices that are advertising nearby.
+
+    `observe` can be registered as the detection callback of a `BleakScanner`,
+    or `start` runs a scanner. Other advertisements are dropped with a
+    dictionary lookup and a check of the service UUIDs. An Airthings device is
+    identified once, and after that an advertisement only updates its RSSI and
+    time. The RSSI is smoothed with an exponentially weighted moving average,
+    which starts again once the device has not been seen for `rssi_max_age`
+    seconds. The devices are indexed by model, so a query only looks at the
+    devices of the requested model.
+    """
+
+    def __init__(
+        self,
+        rssi_alpha: float = DEFAULT_SCANNER_RSSI_ALPHA,
+        rssi_max_age: float = DEFAULT_RSSI_MAX_AGE,
+    ) -> None:
+        self.rssi_alpha = rssi_alpha
+        self.rssi_max_age = rssi_max_age
+        self._devices: dict[str, ScannedDevice] = {}
+        self._by_model: dict[AirthingsDeviceType, dict[str, ScannedDevice]] = {}
+        self._scanner: BleakScanner | None = None
+        self._listeners: list[ScanListener] = []
+
+    def __len__(self) -> int:
+        return len(self._devices)
+
+    def __contains__(self, address: object) -> bool:
+        return address in self._devices
+
+    def get(self, address: str) -> ScannedDevice | None:
+        """Get a device by its address."""
+        return self._devices.get(address)
+
+    def add_listener(self, listener: ScanListener) -> Callable[[], None]:
+        """Call `listener` with each advertisement of an Airthings device.
+
+        Returns a function to remove the listener.
+        """
+        self._listeners.append(listener)
+        return partial(self._listeners.remove, listener)
+
+    def observe(
+        self,
+        ble_device: BLEDevice,
+        advertisement_data: AdvertisementData,
+        now: float | None = None,
+    ) -> None:
+        """Record an advertisement, usable as a BleakScanner detection callback."""
+        device = self._devices.get(ble_device.address)
+        if device is None:
+            if not is_airthings_advertisement(advertisement_data):
+                return
+            now = time.monotonic() if now is None else now
+            device = self._devices[ble_device.address] = ScannedDevice(
+                ble_device=ble_device, first_seen=now, last_seen=now
+            )
+            self._index(device)
+        elif now is None:
+            now = time.monotonic()
+
+        rssi = advertisement_data.rssi
+        if device.advertisements and now - device.last_seen < self.rssi_max_age:
+            device.rssi += self.rssi_alpha * (rssi - device.rssi)
+        else:
+            device.rssi = rssi
+        device.ble_device = ble_device
+        device.advertisement_data = advertisement_data
+        device.last_rssi = rssi
+        device.last_seen = now
+        device.advertisements += 1
+        if device.model == AirthingsDeviceType.UNKNOWN:
+            self._identify(device, ble_device, advertisement_data)
+        for listener in list(self._listeners):
+            listener(device)
+
+    def _index(self, device: ScannedDevice) -> None:
+        self._by_model.setdefault(device.model, {})[device.address] = device
+
+    def _unindex(self, device: ScannedDevice) -> None:
+        if (devices := self._by_model.get(device.model)) is not None:
+            devices.pop(device.address, None)
+            if not devices:
+                del self._by_model[device.model]
+
+    def _identify(
+        self,
+        device: ScannedDevice,
+        ble_device: BLEDevice,
+        advertisement_data: AdvertisementData,
+    ) -> None:
+        """Find the model, which is not in every advertisement of a device."""
+        advertisement = parse_advertisement(
+            advertisement_data.local_name or ble_device.name,
+            advertisement_data.manufacturer_data,
+        )
+        if advertisement is None or not advertisement.is_supported:
+            return
+        self._unindex(device)
+        device.model = advertisement.model
+        device.identifier = advertisement.identifier
+        self._index(device)
+
+    def devices(
+        self,
+        model: AirthingsDeviceType | None = None,
+        max_age: float | None = None,
+        now: float | None = None,
+    ) -> list[ScannedDevice]:
+        """Get the devices of a model seen in the last `max_age` seconds.
+
+        The devices are sorted by smoothed RSSI, strongest first.
+        """
+        devices = self._devices if model is None else self._by_model.get(model, {})
+        candidates: Iterable[ScannedDevice] = devices.values()
+        if max_age is not None:
+            oldest = (time.monotonic() if now is None else now) - max_age
+            candidates = [x for x in candidates if x.last_seen >= oldest]
+        return sorted(candidates, key=lambda x: x.rssi, reverse=True)
+
+    def prune(self, max_age: float, now: float | None = None) -> list[ScannedDevice]:
+        """Forget the devices not seen in the last `max_age` seconds."""
+        oldest = (time.monotonic() if now is None else now) - max_age
+        removed = [x for x in self._devices.values() if x.last_seen < oldest]
+        for device in removed:
+            del self._devices[device.address]
+            self._unindex(device)
+        return removed
+
+    async def start(self, **scanner_kwargs: Any) -> None:
+        """Start a BleakScanner that reports to this table.
+
+        The keyword arguments are passed to the scanner, for example `adapter`.
+        """
+        if self._scanner is not None:
+            return
+        scanner = BleakScanner(detection_callback=self.observe, **scanner_kwargs)
+        await scanner.start()
+        self._scanner = scanner
+
+    async def stop(self) -> None:
+        """Stop the scanner started with `start`."""
+        if (scanner := self._scanner) is not None:
+            self._scanner = None
+            await scanner.stop()
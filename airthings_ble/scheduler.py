@@ -0,0 +1,181 @@
+"""Schedule polls based on the measurement cycle of each device."""
+
+from __future__ import annotations
+
+import dataclasses
+import math
+import statistics
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING
+
+from .const import (
+    DEFAULT_POLL_MARGIN,
+    DEFAULT_SAMPLE_PERIOD,
+    MIN_SAMPLE_PERIOD,
+)
+
+if TYPE_CHECKING:
+    from .parser import AirthingsDevice
+
+# Number of sample intervals used to estimate the period
+_PERIOD_HISTORY = 8
+
+
+# pylint: disable=too-many-instance-attributes
+@dataclasses.dataclass
+class SampleCycle:
+    """Learned measurement cycle of a device.
+
+    All times are in seconds since the epoch, on the clock of the host.
+    """
+
+    period: float
+    # The latest sample was taken after `sample_after` and at `sample_before`
+    sample_after: float | None = None
+    sample_before: float | None = None
+    # Device clock minus host clock
+    clock_offset: float | None = None
+    last_poll: float | None = None
+    retry_at: float | None = None
+    fingerprint: tuple[tuple[str, str | float | None], ...] | None = None
+    # Longest time between two polls since the latest sample
+    max_poll_gap: float = 0.0
+    intervals: deque[float] = dataclasses.field(
+        default_factory=lambda: deque(maxlen=_PERIOD_HISTORY)
+    )
+
+    @property
+    def sample_time(self) -> float | None:
+        """Best estimate of the time of the latest sample."""
+        if self.sample_after is None or self.sample_before is None:
+            return None
+        return (self.sample_after + self.sample_before) / 2
+
+    def next_sample(self, after: float) -> float | None:
+        """Get the time the first sample after `after` is expected."""
+        if self.sample_before is not None:
+            periods = max(1, math.floor((after - self.sample_before) / self.period) + 1)
+            return self.sample_before + periods * self.period
+        if self.clock_offset is not None:
+            # Assume the device samples on whole periods of its own clock
+            device_time = after + self.clock_offset
+            return (
+                math.floor(device_time / self.period) + 1
+            ) * self.period - self.clock_offset
+        return None
+
+
+class MeasurementScheduler:
+    """Poll devices just after they are expected to have a new sample.
+
+    Every update is reported with `observe`. When the sensor values change, a
+    new sample was taken between the previous poll and this one. These windows
+    are combined over several samples to learn the period and phase of the
+    measurement cycle, and `should_poll` returns False until the next sample
+    is expected. If the device reports its clock, samples are assumed to be
+    aligned to whole periods of that clock until a change has been observed.
+    """
+
+    def __init__(
+        self,
+        default_period: float = DEFAULT_SAMPLE_PERIOD,
+        margin: float = DEFAULT_POLL_MARGIN,
+        max_poll_interval: float | None = None,
+    ) -> None:
+        self.default_period = default_period
+        self.margin = margin
+        self.max_poll_interval = max_poll_interval
+        self.cycles: dict[str, SampleCycle] = {}
+
+    def observe(self, device: AirthingsDevice, timestamp: float | None = None) -> None:
+        """Record the values read from a device at `timestamp`."""
+        now = time.time() if timestamp is None else timestamp
+        if (cycle := self.cycles.get(device.address)) is None:
+            cycle = self.cycles[device.address] = SampleCycle(
+                period=self.default_period
+            )
+
+        if device.device_time is not None:
+            cycle.clock_offset = _epoch(device.device_time) - now
+
+        fingerprint = tuple(sorted(device.sensors.items()))
+        previous_poll = cycle.last_poll
+        if previous_poll is not None:
+            cycle.max_poll_gap = max(cycle.max_poll_gap, now - previous_poll)
+        cycle.last_poll = now
+
+        if cycle.fingerprint is None or previous_poll is None:
+            cycle.fingerprint = fingerprint
+            return
+
+        if fingerprint == cycle.fingerprint:
+            expected = cycle.next_sample(previous_poll)
+            if cycle.retry_at is not None or (expected is not None and now >= expected):
+                # The sample is late, try again after a part of the period
+                cycle.retry_at = now + max(self.margin, cycle.period / 10)
+            return
+
+        cycle.fingerprint = fingerprint
+        cycle.retry_at = None
+        self._sample_taken(cycle, after=previous_poll, before=now)
+
+    def _sample_taken(self, cycle: SampleCycle, after: float, before: float) -> None:
+        """Update the cycle with a new sample taken in the window."""
+        previous = cycle.sample_time
+        max_poll_gap = cycle.max_poll_gap
+        cycle.max_poll_gap = 0.0
+
+        if (
+            previous is not None
+            and cycle.sample_after is not None
+            and cycle.sample_before is not None
+        ):
+            # Narrow the window with the previous one moved to this sample
+            periods = round((before - cycle.sample_before) / cycle.period)
+            narrowed_after = max(after, cycle.sample_after + periods * cycle.period)
+            narrowed_before = min(before, cycle.sample_before + periods * cycle.period)
+            if narrowed_after < narrowed_before:
+                after, before = narrowed_after, narrowed_before
+
+            interval = (after + before) / 2 - previous
+            if max_poll_gap > cycle.period:
+                # Samples may have been missed between the polls
+                interval /= max(1, round(interval / cycle.period))
+            if interval >= MIN_SAMPLE_PERIOD:
+                cycle.intervals.append(interval)
+                cycle.period = statistics.median(cycle.intervals)
+
+        cycle.sample_after = after
+        cycle.sample_before = before
+
+    def next_poll(self, address: str, now: float | None = None) -> float | None:
+        """Get the time of the next useful poll, None if unknown."""
+        now = time.time() if now is None else now
+        if (cycle := self.cycles.get(address)) is None or cycle.last_poll is None:
+            return None
+        if cycle.retry_at is not None:
+            # The expected sample has not arrived yet
+            next_poll = cycle.retry_at
+        elif (expected := cycle.next_sample(cycle.last_poll)) is not None:
+            next_poll = expected + self.margin
+        else:
+            return None
+        if self.max_poll_interval is not None:
+            next_poll = min(next_poll, cycle.last_poll + self.max_poll_interval)
+        return next_poll
+
+    def should_poll(self, address: str, now: float | None = None) -> bool:
+        """Check if a poll is expected to return a new sample."""
+        now = time.time() if now is None else now
+        if (next_poll := self.next_poll(address, now)) is None:
+            return True
+        return now >= next_poll
+
+
+def _epoch(value: datetime) -> float:
+    """Get the timestamp of a device time, which has no time zone."""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
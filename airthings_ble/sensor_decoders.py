@@ -31,6 +31,7 @@ from .const import (
     VOC,
     VOC_MAX,
 )
+from .conversion import CENTIKELVIN_TO_CELSIUS
 
 
 def _decode_base(
@@ -120,7 +121,7 @@ def _decode_wave_mini(
         data[DATE_TIME] = str(datetime.isoformat(datetime.now()))
         data[ILLUMINANCE] = illuminance_converter(value=val[0])
         data[TEMPERATURE] = validate_value(
-            value=round(val[2] / 100.0 - 273.15, 2), max_value=TEMPERATURE_MAX
+            value=CENTIKELVIN_TO_CELSIUS(val[2]), max_value=TEMPERATURE_MAX
         )
         data[PRESSURE] = float(val[3] / 50.0)
         data[HUMIDITY] = validate_value(value=val[4] / 100.0, max_value=PERCENTAGE_MAX)
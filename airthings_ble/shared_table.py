@@ -0,0 +1,262 @@
+"""Latest readings of all devices in shared memory, for other processes."""
+
+from __future__ import annotations
+
+import dataclasses
+import math
+import struct
+import sys
+import time
+from multiprocessing import resource_tracker, shared_memory
+from typing import TYPE_CHECKING, Iterable, Iterator
+
+from .const import DEFAULT_SHARED_TABLE_ROWS, NUMERIC_SENSORS
+
+if TYPE_CHECKING:
+    from .parser import AirthingsDevice
+
+_MAGIC = b"ATRT"
+_LAYOUT_VERSION = 1
+# Magic, layout version, rows, columns, rows in use
+_HEADER = struct.Struct("<4sIIII")
+_NAME_SIZE = 32
+_ADDRESS_SIZE = 40
+# Sequence number, address and timestamp, followed by one double per column
+_ROW_PREFIX = struct.Struct(f"<Q{_ADDRESS_SIZE}sd")
+_USED_ROWS_OFFSET = 16
+
+# Attempts to get a consistent copy of a row that is being written
+_READ_ATTEMPTS = 100
+
+
+def _align(size: int) -> int:
+    return (size + 7) & ~7
+
+
+def _attach_shared_memory(name: str) -> shared_memory.SharedMemory:
+    """Attach to shared memory without removing it when this process exits."""
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(  # pylint: disable=unexpected-keyword-arg
+            name=name, track=False
+        )
+    # Before Python 3.13 attaching registers the memory to be unlinked
+    shm = shared_memory.SharedMemory(name=name)
+    resource_tracker.unregister(getattr(shm, "_name"), "shared_memory")
+    return shm
+
+
+def _buffer(shm: shared_memory.SharedMemory) -> memoryview:
+    if (buf := shm.buf) is None:
+        raise ValueError(f"Shared memory {shm.name} is closed")
+    return buf
+
+
+@dataclasses.dataclass(frozen=True)
+class SharedReading:
+    """Latest reading of a device in the table."""
+
+    address: str
+    timestamp: float
+    sensors: dict[str, float]
+
+
+# pylint: disable=too-many-instance-attributes
+class SharedReadingsTable:
+    """Fixed layout table of the latest sensor values, one row per device.
+
+    The polling process creates the table and writes every reading with
+    `write`, which can be registered with `add_listener`. Other processes
+    attach by name and read rows without copying them through a queue.
+
+    Each row has a sequence number that is odd while the row is written, so a
+    reader retries until it got a copy between two equal even numbers. Only a
+    single process may write to the table. Missing values are stored as NaN
+    and left out when reading.
+
+    The stores are plain memory writes without barriers, so the sequence
+    number only protects the rows on CPUs that keep stores in program order,
+    such as x86 and x86-64. On weakly ordered CPUs, such as ARM, a reader
+    can get a row that is partly updated.
+    """
+
+    def __init__(
+        self,
+        shm: shared_memory.SharedMemory,
+        sensors: tuple[str, ...],
+        rows: int,
+        owner: bool,
+    ) -> None:
+        self._shm = shm
+        self.sensors = sensors
+        self.rows = rows
+        self._owner = owner
+        self._columns = {sensor: index for index, sensor in enumerate(sensors)}
+        self._data_offset = _align(_HEADER.size + _NAME_SIZE * len(sensors))
+        self._row_size = _ROW_PREFIX.size + 8 * len(sensors)
+        self._buf = _buffer(shm)
+        data = self._buf[self._data_offset : self._data_offset + rows * self._row_size]
+        self._words = data.cast("Q")
+        self._doubles = data.cast("d")
+        data.release()
+        self._index: dict[str, int] = {}
+
+    @classmethod
+    def create(
+        cls,
+        name: str | None = None,
+        sensors: Iterable[str] = NUMERIC_SENSORS,
+        rows: int = DEFAULT_SHARED_TABLE_ROWS,
+    ) -> SharedReadingsTable:
+        """Create a new table, to be written by this process."""
+        sensors = tuple(sensors)
+        if any(len(x.encode()) > _NAME_SIZE for x in sensors):
+            raise ValueError(f"Sensor names are limited to {_NAME_SIZE} bytes")
+        data_offset = _align(_HEADER.size + _NAME_SIZE * len(sensors))
+        size = data_offset + rows * (_ROW_PREFIX.size + 8 * len(sensors))
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        buf = _buffer(shm)
+        _HEADER.pack_into(buf, 0, _MAGIC, _LAYOUT_VERSION, rows, len(sensors), 0)
+        for index, sensor in enumerate(sensors):
+            struct.pack_into(
+                f"{_NAME_SIZE}s",
+                buf,
+                _HEADER.size + index * _NAME_SIZE,
+                sensor.encode(),
+            )
+        return cls(shm, sensors, rows, owner=True)
+
+    @classmethod
+    def attach(cls, name: str) -> SharedReadingsTable:
+        """Attach to a table created by another process, to read it."""
+        shm = _attach_shared_memory(name)
+        buf = _buffer(shm)
+        magic, version, rows, columns, _ = _HEADER.unpack_from(buf, 0)
+        if magic != _MAGIC or version != _LAYOUT_VERSION:
+            shm.close()
+            raise ValueError(f"Shared memory {name} is not a readings table")
+        sensors = tuple(
+            struct.unpack_from(
+                f"{_NAME_SIZE}s", buf, _HEADER.size + index * _NAME_SIZE
+            )[0]
+            .rstrip(b"\0")
+            .decode()
+            for index in range(columns)
+        )
+        return cls(shm, sensors, rows, owner=False)
+
+    @property
+    def name(self) -> str:
+        """Name to attach to the table from other processes."""
+        return self._shm.name
+
+    @property
+    def used_rows(self) -> int:
+        """Number of rows with a device."""
+        return int(struct.unpack_from("<I", self._buf, _USED_ROWS_OFFSET)[0])
+
+    def __len__(self) -> int:
+        return self.used_rows
+
+    def __contains__(self, address: object) -> bool:
+        return isinstance(address, str) and self._row_of(address) is not None
+
+    def _row_offset(self, row: int) -> int:
+        return self._data_offset + row * self._row_size
+
+    def _row_of(self, address: str) -> int | None:
+        if (row := self._index.get(address)) is None and not self._owner:
+            # Rows are only added, so only the new rows need to be scanned
+            for new_row in range(len(self._index), self.used_rows):
+                self._index[self._read_address(new_row)] = new_row
+            row = self._index.get(address)
+        return row
+
+    def _read_address(self, row: int) -> str:
+        raw = struct.unpack_from(
+            f"{_ADDRESS_SIZE}s", self._buf, self._row_offset(row) + 8
+        )[0]
+        return str(raw.rstrip(b"\0").decode())
+
+    def write(self, device: AirthingsDevice, timestamp: float | None = None) -> None:
+        """Store the numeric sensor values of a reading."""
+        if not self._owner:
+            raise RuntimeError("Only the process that created the table can write")
+        if (row := self._index.get(device.address)) is None:
+            row = self._add_row(device.address)
+
+        word = row * self._row_size // 8
+        first_value = word + _ROW_PREFIX.size // 8
+        # A new row is still odd from when it was added
+        sequence = self._words[word] | 1
+        self._words[word] = sequence
+        self._doubles[first_value - 1] = time.time() if timestamp is None else timestamp
+        for sensor, column in self._columns.items():
+            value = device.sensors.get(sensor)
+            self._doubles[first_value + column] = (
+                float(value)
+                if isinstance(value, (int, float)) and not isinstance(value, bool)
+                else math.nan
+            )
+        self._words[word] = sequence + 1
+
+    def _add_row(self, address: str) -> int:
+        """Add a row for a device, it stays odd until its first write."""
+        if len(address.encode()) > _ADDRESS_SIZE:
+            raise ValueError(f"Address {address} is too long")
+        row = len(self._index)
+        if row >= self.rows:
+            raise ValueError(f"The table is full ({self.rows} devices)")
+        word = row * self._row_size // 8
+        first_value = word + _ROW_PREFIX.size // 8
+        self._words[word] = 1
+        struct.pack_into(
+            f"{_ADDRESS_SIZE}s", self._buf, self._row_offset(row) + 8, address.encode()
+        )
+        for index in range(first_value - 1, first_value + len(self.sensors)):
+            self._doubles[index] = math.nan
+        self._index[address] = row
+        # Readers only see the row once it is complete
+        struct.pack_into("<I", self._buf, _USED_ROWS_OFFSET, row + 1)
+        return row
+
+    def read(self, address: str) -> SharedReading | None:
+        """Get the latest reading of a device, None if it has no row."""
+        if (row := self._row_of(address)) is None:
+            return None
+        word = row * self._row_size // 8
+        first_value = word + _ROW_PREFIX.size // 8
+        for _ in range(_READ_ATTEMPTS):
+            before = self._words[word]
+            if not before & 1:
+                timestamp = self._doubles[first_value - 1]
+                values = self._doubles[first_value : first_value + len(self.sensors)]
+                copied = values.tolist()
+                values.release()
+                if self._words[word] == before:
+                    break
+            # Let the writer finish
+            time.sleep(0)
+        else:
+            raise TimeoutError(f"Row of {address} is being written")
+        return SharedReading(
+            address=address,
+            timestamp=timestamp,
+            sensors={
+                sensor: value
+                for sensor, value in zip(self.sensors, copied)
+                if not math.isnan(value)
+            },
+        )
+
+    def __iter__(self) -> Iterator[SharedReading]:
+        for row in range(self.used_rows):
+            if (reading := self.read(self._read_address(row))) is not None:
+                yield reading
+
+    def close(self) -> None:
+        """Detach from the table, and remove it if this process created it."""
+        self._words.release()
+        self._doubles.release()
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
@@ -0,0 +1,607 @@
+"""Simulate a fleet of Airthings devices, to test polling at scale without hardware.
+
+The simulated clients serve the GATT table of each model, and emulate the
+connect latency, dropped connections and MTU fragmentation of real devices.
+They are connected through a `ConnectionPool`, so updates run the same code
+as with real devices.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import dataclasses
+import logging
+import math
+import random
+import struct
+import time
+import tracemalloc
+from logging import Logger
+from typing import Any, Callable, Iterable, Sequence, cast
+
+import cbor2
+from bleak import BleakError
+from bleak.backends.device import BLEDevice
+from bleak.backends.scanner import AdvertisementData
+from bleak_retry_connector import BleakClientWithServiceCache
+
+from .admission import ConnectionAdmission
+from .atom.frame import ATOM_RESPONSE_HEADER
+from .atom.request_path import AtomRequestPath
+from .connection_pool import ConnectionPool, DisconnectedCallback
+from .const import (
+    CHAR_UUID_DEVICE_NAME,
+    CHAR_UUID_FIRMWARE_REV,
+    CHAR_UUID_HARDWARE_REV,
+    CHAR_UUID_MANUFACTURER_NAME,
+    CHAR_UUID_MODEL_NUMBER_STRING,
+    CHAR_UUID_SERIAL_NUMBER_STRING,
+    CHAR_UUID_WAVE_2_DATA,
+    CHAR_UUID_WAVE_PLUS_DATA,
+    CHAR_UUID_WAVEMINI_DATA,
+    COMMAND_UUID_ATOM,
+    COMMAND_UUID_ATOM_NOTIFY,
+    COMMAND_UUID_WAVE_2,
+    COMMAND_UUID_WAVE_MINI,
+    COMMAND_UUID_WAVE_PLUS,
+    DEFAULT_POOL_MAX_CONNECTIONS,
+    MFCT_ID,
+)
+from .device_type import AirthingsDeviceType
+from .loop_monitor import LoopMonitor
+from .parser import AirthingsBluetoothDeviceData, DisconnectedError
+
+_LOGGER = logging.getLogger(__name__)
+
+# Seconds per ATT round trip, one connection interval
+_CONNECTION_INTERVAL = 0.03
+# Bytes of the ATT MTU that are not payload in a notification
+_NOTIFICATION_OVERHEAD = 3
+# Longest time (in seconds) into a session that a dropped connection is lost
+_MAX_DROP_DELAY = 0.5
+
+# The characteristics of the sensor service of each model. Atom devices have a
+# command characteristic, and a characteristic that notifies the responses.
+GATT_TABLES: dict[AirthingsDeviceType, tuple[str, str]] = {
+    AirthingsDeviceType.WAVE_PLUS: (
+        str(CHAR_UUID_WAVE_PLUS_DATA),
+        str(COMMAND_UUID_WAVE_PLUS),
+    ),
+    AirthingsDeviceType.WAVE_RADON: (
+        str(CHAR_UUID_WAVE_2_DATA),
+        str(COMMAND_UUID_WAVE_2),
+    ),
+    AirthingsDeviceType.WAVE_MINI: (
+        str(CHAR_UUID_WAVEMINI_DATA),
+        str(COMMAND_UUID_WAVE_MINI),
+    ),
+    **dict.fromkeys(
+        AirthingsDeviceType.atom_devices(),
+        (str(COMMAND_UUID_ATOM), str(COMMAND_UUID_ATOM_NOTIFY)),
+    ),
+}
+
+_FIRMWARE = {
+    AirthingsDeviceType.WAVE_ENHANCE_EU: "T-SUB-2.6.1-master+0",
+    AirthingsDeviceType.WAVE_ENHANCE_US: "T-SUB-2.6.1-master+0",
+    AirthingsDeviceType.CORENTIUM_HOME_2: "R-SUB-1.3.4-master+0",
+}
+
+
+# pylint: disable=too-many-instance-attributes
+@dataclasses.dataclass
+class SimulatedDevice:
+    """A simulated device, with its link quality and sensor values."""
+
+    address: str
+    model: AirthingsDeviceType
+    serial_number: str
+    rssi: int = -70
+    # Mean seconds to connect, and the share of connects that fail
+    connect_latency: float = 1.0
+    connect_failure_rate: float = 0.0
+    # Share of connections the device drops
+    disconnect_rate: float = 0.0
+    mtu: int = 23
+    temperature: float = 21.0
+    humidity: float = 40.0
+    pressure: float = 1013.0
+    co2: float = 600.0
+    voc: float = 100.0
+    radon: float = 50.0
+    battery: int = 2900
+    # Change the sensor values a little on each read
+    drifting: bool = True
+    ble_device: BLEDevice = dataclasses.field(init=False)
+
+    def __post_init__(self) -> None:
+        self.ble_device = BLEDevice(address=self.address, name=self.name, details=None)
+
+    @property
+    def name(self) -> str:
+        """Advertised name of the device."""
+        return f"Airthings {self.model.product_name}"
+
+    @property
+    def advertisement(self) -> AdvertisementData:
+        """Advertisement of the device, with its serial number."""
+        return AdvertisementData(
+            local_name=self.name,
+            manufacturer_data={MFCT_ID: int(self.serial_number).to_bytes(4, "little")},
+            service_data={},
+            service_uuids=[],
+            tx_power=None,
+            rssi=self.rssi,
+            platform_data=(),
+        )
+
+    def drift(self, rng: random.Random) -> None:
+        """Change the sensor values a little, as between two samples."""
+        if not self.drifting:
+            return
+        self.temperature += rng.uniform(-0.2, 0.2)
+        self.humidity = min(100.0, max(0.0, self.humidity + rng.uniform(-1, 1)))
+        self.co2 = max(400.0, self.co2 + rng.uniform(-20, 20))
+        self.voc = max(0.0, self.voc + rng.uniform(-5, 5))
+        self.radon = max(0.0, self.radon + rng.uniform(-2, 2))
+
+    def device_information(self) -> dict[str, bytes]:
+        """Get the values of the device information characteristics."""
+        return {
+            str(CHAR_UUID_MANUFACTURER_NAME): b"Airthings AS",
+            str(CHAR_UUID_MODEL_NUMBER_STRING): self.model.value.encode(),
+            str(CHAR_UUID_SERIAL_NUMBER_STRING): self.serial_number.encode(),
+            str(CHAR_UUID_DEVICE_NAME): self.name.encode(),
+            str(CHAR_UUID_FIRMWARE_REV): _FIRMWARE.get(
+                self.model, "G-BLE-1.5.3-master+0"
+            ).encode(),
+            str(CHAR_UUID_HARDWARE_REV): b"REV A",
+        }
+
+    def sensor_data(self) -> bytes:
+        """Get the value of the sensor characteristic of a Wave device."""
+        if self.model == AirthingsDeviceType.WAVE_MINI:
+            return struct.pack(
+                "<2B5HLL",
+                10,
+                0,
+                round((self.temperature + 273.15) * 100),
+                round(self.pressure * 50),
+                round(self.humidity * 100),
+                round(self.voc),
+                0,
+                0,
+                0,
+            )
+        return struct.pack(
+            "<4B8H",
+            1,
+            round(self.humidity * 2),
+            10,
+            0,
+            round(self.radon),
+            round(self.radon),
+            round(self.temperature * 100),
+            round(self.pressure * 50),
+            round(self.co2),
+            round(self.voc),
+            0,
+            0,
+        )
+
+    def command_response(self) -> bytes:
+        """Get the response of a Wave device to the battery command."""
+        if self.model == AirthingsDeviceType.WAVE_MINI:
+            values = [0] * 14
+            values[11] = self.battery
+            return b"\x6d\x00" + struct.pack("<2L4B2HL4HL", *values)
+        values = [0] * 15
+        values[13] = self.battery
+        return b"\x6d\x00" + struct.pack("<L2BH2B9H", *values)
+
+    def atom_response(self, request: bytes) -> bytes:
+        """Get the response of an Atom device to a request."""
+        random_bytes = request[2:4]
+        path = AtomRequestPath(cbor2.loads(request[4:])[0][0])
+        data: Any
+        if path == AtomRequestPath.CONNECTIVITY_MODE:
+            data = 4
+        else:
+            data = cbor2.dumps(self._atom_values())
+        return (
+            ATOM_RESPONSE_HEADER
+            + random_bytes
+            + cbor2.dumps([{0: path.value, 2: data}])
+        )
+
+    def _atom_values(self) -> dict[str, int]:
+        values = {
+            "TMP": round((self.temperature + 273.15) * 100),
+            "HUM": round(self.humidity * 100),
+            "BAT": self.battery,
+            "TIM": 60,
+        }
+        if self.model == AirthingsDeviceType.CORENTIUM_HOME_2:
+            radon = round(self.radon)
+            return {**values, "R24": radon, "R7D": radon, "R30D": radon, "R1Y": radon}
+        return {
+            **values,
+            "CO2": round(self.co2),
+            "VOC": round(self.voc),
+            "PRS": round(self.pressure * 6400),
+            "LUX": 10,
+            "NOI": 40,
+        }
+
+
+def simulated_fleet(
+    count: int,
+    models: Sequence[AirthingsDeviceType] = (
+        AirthingsDeviceType.WAVE_PLUS,
+        AirthingsDeviceType.WAVE_MINI,
+        AirthingsDeviceType.WAVE_ENHANCE_EU,
+    ),
+    seed: int | None = None,
+) -> list[SimulatedDevice]:
+    """Create devices of the models, in turn, with random signal strengths.
+
+    Devices with a weaker signal are slower to connect, and fail and drop
+    their connections more often, like real links.
+    """
+    rng = random.Random(seed)
+    devices: list[SimulatedDevice] = []
+    for index in range(count):
+        model = models[index % len(models)]
+        rssi = rng.randint(-95, -55)
+        weakness = max(0, -75 - rssi)
+        devices.append(
+            SimulatedDevice(
+                address=":".join(f"{x:02X}" for x in (0xA5, 0x17, *index.to_bytes(4))),
+                model=model,
+                serial_number=f"{model.value}{index % 1_000_000:06d}",
+                rssi=rssi,
+                connect_latency=0.5 + weakness * 0.1,
+                connect_failure_rate=min(0.5, weakness / 40),
+                disconnect_rate=min(0.25, weakness / 80),
+                temperature=rng.uniform(18, 24),
+                co2=rng.uniform(400, 1200),
+            )
+        )
+    return devices
+
+
+@dataclasses.dataclass
+class _SimulatedCharacteristic:
+    uuid: str
+
+
+# pylint: disable=too-few-public-methods
+class _SimulatedService:
+    def __init__(self, uuids: Iterable[str]) -> None:
+        self.characteristics = [_SimulatedCharacteristic(x) for x in uuids]
+
+    def get_characteristic(self, specifier: Any) -> _SimulatedCharacteristic | None:
+        """Get a characteristic of the service by its UUID."""
+        uuid = str(getattr(specifier, "uuid", specifier))
+        return next((x for x in self.characteristics if x.uuid == uuid), None)
+
+
+class SimulatedClient:
+    """A connection to a simulated device, used in place of a BleakClient."""
+
+    def __init__(
+        self,
+        simulator: FleetSimulator,
+        device: SimulatedDevice,
+        disconnected_callback: DisconnectedCallback,
+    ) -> None:
+        self.address = device.address
+        self.services = [_SimulatedService(GATT_TABLES[device.model])]
+        self._simulator = simulator
+        self._device = device
+        self._disconnected_callback = disconnected_callback
+        self._connected = True
+        self._values = device.device_information()
+        self._sensor_uuid = (
+            None
+            if device.model in AirthingsDeviceType.atom_devices()
+            else GATT_TABLES[device.model][0]
+        )
+        self._notify: dict[str, Callable[[Any, bytearray], None]] = {}
+        self._timers: list[asyncio.TimerHandle] = []
+
+    @property
+    def is_connected(self) -> bool:
+        """Check if the device is still connected."""
+        return self._connected
+
+    async def _round_trips(self, length: int, payload: int) -> None:
+        await self._simulator.sleep(
+            max(1, math.ceil(length / payload)) * _CONNECTION_INTERVAL
+        )
+        if not self._connected:
+            raise BleakError(f"Not connected to {self.address}")
+
+    async def read_gatt_char(self, char_specifier: Any, **_kwargs: Any) -> bytearray:
+        """Read a characteristic, with a round trip per MTU of data."""
+        uuid = str(getattr(char_specifier, "uuid", char_specifier))
+        if uuid == self._sensor_uuid:
+            self._device.drift(self._simulator.random)
+            data = self._device.sensor_data()
+        elif (value := self._values.get(uuid)) is not None:
+            data = value
+        else:
+            raise BleakError(f"Characteristic {uuid} was not found!")
+        await self._round_trips(len(data), self._device.mtu - 1)
+        return bytearray(data)
+
+    async def write_gatt_char(
+        self, char_specifier: Any, data: bytes | bytearray, **_kwargs: Any
+    ) -> None:
+        """Write a command, and notify the response in MTU sized fragments."""
+        uuid = str(getattr(char_specifier, "uuid", char_specifier))
+        await self._round_trips(len(data), self._device.mtu - 3)
+        if uuid == str(COMMAND_UUID_ATOM):
+            self._notify_fragments(
+                str(COMMAND_UUID_ATOM_NOTIFY), self._device.atom_response(bytes(data))
+            )
+        elif uuid in (
+            str(COMMAND_UUID_WAVE_PLUS),
+            str(COMMAND_UUID_WAVE_2),
+            str(COMMAND_UUID_WAVE_MINI),
+        ):
+            self._notify_fragments(uuid, self._device.command_response())
+
+    def _notify_fragments(self, uuid: str, data: bytes) -> None:
+        loop = asyncio.get_running_loop()
+        size = self._device.mtu - _NOTIFICATION_OVERHEAD
+        for index, offset in enumerate(range(0, len(data), size)):
+            self._timers.append(
+                loop.call_later(
+                    self._simulator.scale((index + 1) * _CONNECTION_INTERVAL),
+                    self._deliver,
+                    uuid,
+                    bytearray(data[offset : offset + size]),
+                )
+            )
+
+    def _deliver(self, uuid: str, data: bytearray) -> None:
+        if self._connected and (callback := self._notify.get(uuid)) is not None:
+            callback(_SimulatedCharacteristic(uuid), data)
+
+    async def start_notify(
+        self,
+        char_specifier: Any,
+        callback: Callable[[Any, bytearray], None],
+        **_kwargs: Any,
+    ) -> None:
+        """Start notifications of a characteristic."""
+        await self._round_trips(2, self._device.mtu - 3)
+        self._notify[str(getattr(char_specifier, "uuid", char_specifier))] = callback
+
+    async def stop_notify(self, char_specifier: Any) -> None:
+        """Stop notifications of a characteristic."""
+        await self._round_trips(2, self._device.mtu - 3)
+        self._notify.pop(str(getattr(char_specifier, "uuid", char_specifier)), None)
+
+    def drop_after(self, delay: float) -> None:
+        """Have the device drop the connection after `delay` seconds."""
+        self._timers.append(
+            asyncio.get_running_loop().call_later(
+                self._simulator.scale(delay), self._drop
+            )
+        )
+
+    def _drop(self) -> None:
+        if not self._connected:
+            return
+        self._close()
+        self._simulator.disconnects += 1
+        self._disconnected_callback(cast(BleakClientWithServiceCache, self))
+
+    def _close(self) -> None:
+        self._connected = False
+        self._notify.clear()
+        for timer in self._timers:
+            timer.cancel()
+        self._timers.clear()
+
+    async def disconnect(self) -> bool:
+        """Close the connection."""
+        self._close()
+        return True
+
+    async def clear_cache(self) -> bool:
+        """Clear the GATT cache, there is none to clear."""
+        return True
+
+
+class FleetSimulator:
+    """Connect to simulated devices, as the connector of a `ConnectionPool`.
+
+    All simulated delays are multiplied by `time_scale`, so a large fleet can
+    be polled in less time than it would take on site.
+    """
+
+    def __init__(
+        self,
+        devices: Iterable[SimulatedDevice],
+        time_scale: float = 1.0,
+        seed: int | None = None,
+    ) -> None:
+        self.devices = {x.address: x for x in devices}
+        self.time_scale = time_scale
+        self.random = random.Random(seed)
+        self.connections = 0
+        self.connect_failures = 0
+        self.disconnects = 0
+
+    def scale(self, seconds: float) -> float:
+        """Get the time a simulated delay takes."""
+        return seconds * self.time_scale
+
+    async def sleep(self, seconds: float) -> None:
+        """Wait for a simulated delay."""
+        await asyncio.sleep(self.scale(seconds))
+
+    async def connect(
+        self, ble_device: BLEDevice, disconnected_callback: DisconnectedCallback
+    ) -> BleakClientWithServiceCache:
+        """Connect to a simulated device."""
+        if (device := self.devices.get(ble_device.address)) is None:
+            raise BleakError(f"Device with address {ble_device.address} was not found")
+        rng = self.random
+        # Connect times have a long tail
+        await self.sleep(rng.gammavariate(4, device.connect_latency / 4))
+        if rng.random() < device.connect_failure_rate:
+            self.connect_failures += 1
+            raise BleakError(f"Failed to connect to {device.address}")
+        self.connections += 1
+        client = SimulatedClient(self, device, disconnected_callback)
+        if rng.random() < device.disconnect_rate:
+            client.drop_after(rng.uniform(0, _MAX_DROP_DELAY))
+        return cast(BleakClientWithServiceCache, client)
+
+
+# pylint: disable=too-many-instance-attributes
+@dataclasses.dataclass
+class SimulationReport:
+    """Outcome of polling a simulated fleet.
+
+    Times are measured on the host clock, so they include the scaled
+    simulated delays and the time spent in the library.
+    """
+
+    devices: int
+    cycles: int
+    updates: int = 0
+    failures: int = 0
+    deferred: int = 0
+    seconds: float = 0.0
+    # Durations of the successful updates, in seconds
+    latencies: list[float] = dataclasses.field(default_factory=list)
+    peak_memory: int | None = None
+    max_loop_lag: float = 0.0
+    loop_stalls: int = 0
+
+    @property
+    def throughput(self) -> float:
+        """Successful updates per second."""
+        return self.updates / self.seconds if self.seconds else 0.0
+
+    def latency(self, quantile: float) -> float:
+        """Get a quantile of the update durations, NaN if there are none."""
+        if not self.latencies:
+            return math.nan
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, math.ceil(quantile * len(ordered)) - 1)]
+
+    def summary(self) -> str:
+        """Describe the report in a few lines."""
+        memory = (
+            "not traced"
+            if self.peak_memory is None
+            else f"{self.peak_memory / 1_000_000:.1f} MB"
+        )
+        return "\n".join(
+            [
+                f"{self.devices} devices, {self.cycles} cycles in {self.seconds:.1f} s",
+                f"{self.updates} updates ({self.throughput:.1f}/s), "
+                f"{self.failures} failed, {self.deferred} deferred",
+                f"Latency p50 {self.latency(0.5):.3f} s, "
+                f"p90 {self.latency(0.9):.3f} s, p99 {self.latency(0.99):.3f} s",
+                f"Peak memory {memory}",
+                f"Event loop lag max {self.max_loop_lag:.3f} s, "
+                f"{self.loop_stalls} stalls",
+            ]
+        )
+
+
+def _cycle_addresses(
+    simulator: FleetSimulator,
+    admission: ConnectionAdmission | None,
+    report: SimulationReport,
+) -> Iterable[str]:
+    """Get the devices to poll in a cycle, in order."""
+    if admission is None:
+        return simulator.devices
+    for device in simulator.devices.values():
+        admission.observe(device.address, device.rssi)
+    plan = admission.plan(simulator.devices)
+    report.deferred += len(plan.deferred)
+    return plan.admitted
+
+
+# pylint: disable=too-many-arguments,too-many-positional-arguments
+async def run_simulation(
+    simulator: FleetSimulator,
+    cycles: int = 1,
+    max_connections: int = DEFAULT_POOL_MAX_CONNECTIONS,
+    admission: ConnectionAdmission | None = None,
+    trace_memory: bool = True,
+    logger: Logger = _LOGGER,
+) -> SimulationReport:
+    """Poll every simulated device once per cycle, and report how it went.
+
+    Each device has its own parser, and all share a pool of `max_connections`
+    connections. With an `admission`, the devices are polled in its order and
+    the deferred ones are skipped. The event loop is monitored during the run,
+    and memory is traced with tracemalloc if `trace_memory` is set.
+    """
+    report = SimulationReport(devices=len(simulator.devices), cycles=cycles)
+    pool = ConnectionPool(max_connections, connector=simulator.connect)
+    parsers = {
+        address: AirthingsBluetoothDeviceData(logger, connection_pool=pool)
+        for address in simulator.devices
+    }
+
+    def _record_failure(address: str) -> None:
+        report.failures += 1
+        if admission is not None:
+            admission.record(address, False)
+
+    async def _update(device: SimulatedDevice) -> None:
+        started = time.monotonic()
+        try:
+            await parsers[device.address].update_device(
+                device.ble_device, device.advertisement
+            )
+        except (BleakError, DisconnectedError, TimeoutError) as err:
+            logger.debug("Update of %s failed: %s", device.address, err)
+            _record_failure(device.address)
+            return
+        except Exception:  # pylint: disable=broad-exception-caught
+            # A bug in the library, which the simulation is there to find
+            logger.exception("Update of %s raised an error", device.address)
+            _record_failure(device.address)
+            return
+        duration = time.monotonic() - started
+        report.updates += 1
+        report.latencies.append(duration)
+        if admission is not None:
+            admission.record(device.address, True, duration)
+
+    monitor = LoopMonitor(logger=logger)
+    tracing = trace_memory and not tracemalloc.is_tracing()
+    if tracing:
+        tracemalloc.start()
+    monitor.start()
+    started = time.monotonic()
+    try:
+        for _ in range(cycles):
+            await asyncio.gather(
+                *(
+                    _update(simulator.devices[address])
+                    for address in _cycle_addresses(simulator, admission, report)
+                )
+            )
+    finally:
+        report.seconds = time.monotonic() - started
+        await monitor.stop()
+        await pool.close()
+        if tracing:
+            report.peak_memory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+    report.max_loop_lag = monitor.max_lag
+    report.loop_stalls = round(sum(x.value for x in monitor.stalls.children.values()))
+    return report
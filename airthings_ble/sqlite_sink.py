@@ -0,0 +1,343 @@
+"""Store readings in a local SQLite database, in batches."""
+
+from __future__ import annotations
+
+import math
+import sqlite3
+import time
+from typing import TYPE_CHECKING, Any, Iterable, Iterator, NamedTuple
+
+from .aggregator import Aggregate
+from .const import (
+    DEFAULT_SINK_BATCH_SIZE,
+    DEFAULT_SINK_FLUSH_INTERVAL,
+    NUMERIC_SENSORS,
+)
+
+if TYPE_CHECKING:
+    from .parser import AirthingsDevice
+
+SCHEMA_NARROW = "narrow"
+SCHEMA_WIDE = "wide"
+
+_DEVICES_SCHEMA = """
+CREATE TABLE IF NOT EXISTS devices (
+    id INTEGER PRIMARY KEY,
+    address TEXT NOT NULL UNIQUE
+);
+"""
+
+_NARROW_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sensors (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS readings (
+    device_id INTEGER NOT NULL REFERENCES devices (id),
+    sensor_id INTEGER NOT NULL REFERENCES sensors (id),
+    ts REAL NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (device_id, sensor_id, ts)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS readings_ts ON readings (ts);
+"""
+
+
+class Reading(NamedTuple):
+    """A stored sensor value."""
+
+    address: str
+    timestamp: float
+    sensor: str
+    value: float
+
+
+def _numeric(value: Any) -> bool:
+    return (
+        isinstance(value, (int, float))
+        and not isinstance(value, bool)
+        and not math.isnan(value)
+    )
+
+
+# pylint: disable=too-many-instance-attributes
+# pylint: disable=too-many-arguments,too-many-positional-arguments
+class SQLiteSink:
+    """Buffer readings and write them to SQLite in transactions.
+
+    Readings are added with `add`, which can be registered as a listener with
+    `AirthingsBluetoothDeviceData.add_listener`. They are written with a
+    single `executemany` once `batch_size` rows are buffered, or on the first
+    reading after `flush_interval` seconds. Call `close` to write the rest.
+
+    The narrow schema has a row per device, sensor and time, clustered by
+    device and sensor so range queries read adjacent pages. The wide schema
+    has a row per reading with a column per sensor in `sensors`. Both have an
+    index on the time, for queries over all devices. Only numeric values are
+    stored. New devices and sensors get their ids in the transaction of the
+    flush, so a failed flush leaves nothing behind. The database uses WAL mode, so readers in other
+    processes do not block the writer.
+
+    The writes are blocking. When another connection holds the write lock, a
+    flush waits up to `timeout` seconds, on the event loop when `add` is a
+    listener, so keep `timeout` short there. If the lock is not released in
+    time, `flush` raises `sqlite3.OperationalError` and the rows stay buffered
+    for the next flush.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        schema: str = SCHEMA_NARROW,
+        sensors: Iterable[str] | None = None,
+        batch_size: int = DEFAULT_SINK_BATCH_SIZE,
+        flush_interval: float = DEFAULT_SINK_FLUSH_INTERVAL,
+        timeout: float = 5.0,
+    ) -> None:
+        if schema not in (SCHEMA_NARROW, SCHEMA_WIDE):
+            raise ValueError(f"Unknown schema {schema}")
+        if sensors is None:
+            sensors = NUMERIC_SENSORS if schema == SCHEMA_WIDE else ()
+        self.sensors = tuple(sensors)
+        if schema == SCHEMA_WIDE and not all(x.isidentifier() for x in self.sensors):
+            raise ValueError("Sensor names must be identifiers in the wide schema")
+        self.schema = schema
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._connection = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        # Durable at checkpoints, which is enough for a history
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(_DEVICES_SCHEMA)
+        self._wide_insert = ""
+        self._sensor_ids: dict[str, int] = {}
+        if schema == SCHEMA_WIDE:
+            self._create_wide_table()
+        else:
+            self._connection.executescript(_NARROW_SCHEMA)
+            self._sensor_ids.update(
+                self._connection.execute("SELECT name, id FROM sensors")
+            )
+        self._device_ids: dict[str, int] = dict(
+            self._connection.execute("SELECT address, id FROM devices")
+        )
+        self._rows: list[tuple[Any, ...]] = []
+        self._last_flush = time.monotonic()
+
+    def _create_wide_table(self) -> None:
+        connection = self._connection
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS readings_wide ("
+            " device_id INTEGER NOT NULL REFERENCES devices (id),"
+            " ts REAL NOT NULL,"
+            " PRIMARY KEY (device_id, ts)"
+            ") WITHOUT ROWID"
+        )
+        connection.execute(
+            "CREATE INDEX IF NOT EXISTS readings_wide_ts ON readings_wide (ts)"
+        )
+        columns = {
+            row[1] for row in connection.execute("PRAGMA table_info(readings_wide)")
+        }
+        for sensor in self.sensors:
+            if sensor not in columns:
+                connection.execute(
+                    f'ALTER TABLE readings_wide ADD COLUMN "{sensor}" REAL'
+                )
+        placeholders = ", ".join("?" * (len(self.sensors) + 2))
+        names = "".join(f', "{x}"' for x in self.sensors)
+        self._wide_insert = (
+            f"INSERT OR REPLACE INTO readings_wide (device_id, ts{names})"
+            f" VALUES ({placeholders})"
+        )
+
+    @property
+    def pending(self) -> int:
+        """Number of buffered rows."""
+        return len(self._rows)
+
+    def _get_id(
+        self,
+        table: str,
+        column: str,
+        key: str,
+        ids: dict[str, int],
+        created: dict[str, int],
+    ) -> int:
+        """Get the id of a device or sensor, creating it in the open transaction.
+
+        New ids are kept in `created` until the transaction is committed.
+        """
+        if (row_id := ids.get(key, created.get(key))) is None:
+            self._connection.execute(
+                f"INSERT OR IGNORE INTO {table} ({column}) VALUES (?)", (key,)
+            )
+            row_id = created[key] = self._connection.execute(
+                f"SELECT id FROM {table} WHERE {column} = ?", (key,)
+            ).fetchone()[0]
+        return row_id
+
+    def _device_id(self, address: str, created: dict[str, int]) -> int:
+        return self._get_id("devices", "address", address, self._device_ids, created)
+
+    def _sensor_id(self, sensor: str, created: dict[str, int]) -> int:
+        return self._get_id("sensors", "name", sensor, self._sensor_ids, created)
+
+    def add(self, device: AirthingsDevice, timestamp: float | None = None) -> None:
+        """Buffer the numeric sensor values of a reading."""
+        now = time.time() if timestamp is None else timestamp
+        address = device.address
+        sensors = device.sensors
+        if self.schema == SCHEMA_WIDE:
+            values = [sensors.get(x) for x in self.sensors]
+            if any(_numeric(x) for x in values):
+                self._rows.append(
+                    (address, now, *(x if _numeric(x) else None for x in values))
+                )
+        else:
+            names = self.sensors or sensors.keys()
+            self._rows.extend(
+                (address, name, now, value)
+                for name in names
+                if _numeric(value := sensors.get(name))
+            )
+        if (
+            len(self._rows) >= self.batch_size
+            or time.monotonic() - self._last_flush >= self.flush_interval
+        ):
+            self.flush()
+
+    def flush(self) -> None:
+        """Write the buffered rows in a single transaction.
+
+        This blocks for up to `timeout` seconds while the database is locked.
+        """
+        self._last_flush = time.monotonic()
+        if not self._rows:
+            return
+        connection = self._connection
+        # The rows are only taken from the buffer once the lock is held
+        connection.execute("BEGIN IMMEDIATE")
+        rows, self._rows = self._rows, []
+        devices: dict[str, int] = {}
+        sensors: dict[str, int] = {}
+        try:
+            if self.schema == SCHEMA_WIDE:
+                connection.executemany(
+                    self._wide_insert,
+                    [
+                        (self._device_id(address, devices), *values)
+                        for address, *values in rows
+                    ],
+                )
+            else:
+                connection.executemany(
+                    "INSERT OR REPLACE INTO readings VALUES (?, ?, ?, ?)",
+                    [
+                        (
+                            self._device_id(address, devices),
+                            self._sensor_id(sensor, sensors),
+                            ts,
+                            value,
+                        )
+                        for address, sensor, ts, value in rows
+                    ],
+                )
+            connection.execute("COMMIT")
+        except BaseException:
+            # A failed COMMIT leaves the transaction open
+            if connection.in_transaction:
+                connection.execute("ROLLBACK")
+            # Keep the rows, to try again with the next flush
+            self._rows[:0] = rows
+            raise
+        self._device_ids.update(devices)
+        self._sensor_ids.update(sensors)
+
+    def _range_query(
+        self,
+        address: str | None,
+        sensor: str | None,
+        start: float | None,
+        end: float | None,
+    ) -> tuple[str, list[Any]]:
+        """Get the FROM and WHERE clauses selecting values of a sensor."""
+        conditions: list[str] = []
+        parameters: list[Any] = []
+        if self.schema == SCHEMA_WIDE:
+            if sensor is None or sensor not in self.sensors:
+                raise ValueError(
+                    "The wide schema is queried one stored sensor at a time"
+                )
+            sql = (
+                "SELECT d.address AS address, r.ts AS ts, ? AS sensor,"
+                f' r."{sensor}" AS value FROM readings_wide r'
+                " JOIN devices d ON d.id = r.device_id"
+            )
+            parameters.append(sensor)
+            conditions.append(f'r."{sensor}" IS NOT NULL')
+        else:
+            sql = (
+                "SELECT d.address AS address, r.ts AS ts, s.name AS sensor,"
+                " r.value AS value FROM readings r"
+                " JOIN devices d ON d.id = r.device_id"
+                " JOIN sensors s ON s.id = r.sensor_id"
+            )
+            if sensor is not None:
+                conditions.append("s.name = ?")
+                parameters.append(sensor)
+        if address is not None:
+            conditions.append("d.address = ?")
+            parameters.append(address)
+        if start is not None:
+            conditions.append("r.ts >= ?")
+            parameters.append(start)
+        if end is not None:
+            conditions.append("r.ts < ?")
+            parameters.append(end)
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        return sql, parameters
+
+    def iter_readings(
+        self,
+        address: str | None = None,
+        sensor: str | None = None,
+        start: float | None = None,
+        end: float | None = None,
+    ) -> Iterator[Reading]:
+        """Iterate the stored values with `start <= timestamp < end`, in time order.
+
+        Buffered rows are not included until they are flushed.
+        """
+        sql, parameters = self._range_query(address, sensor, start, end)
+        for row in self._connection.execute(sql + " ORDER BY r.ts", parameters):
+            yield Reading(*row)
+
+    def downsample(
+        self,
+        address: str,
+        sensor: str,
+        step: float,
+        start: float | None = None,
+        end: float | None = None,
+    ) -> list[tuple[float, Aggregate]]:
+        """Aggregate the values of a sensor in buckets of `step` seconds."""
+        sql, parameters = self._range_query(address, sensor, start, end)
+        rows = self._connection.execute(
+            "SELECT CAST(ts / ? AS INTEGER) * ? AS bucket,"
+            " min(value), max(value), avg(value), count(*)"
+            f" FROM ({sql}) GROUP BY bucket ORDER BY bucket",
+            [step, step, *parameters],
+        )
+        return [
+            (bucket, Aggregate(minimum, maximum, mean, count))
+            for bucket, minimum, maximum, mean, count in rows
+        ]
+
+    def close(self) -> None:
+        """Write the buffered rows and close the database."""
+        try:
+            self.flush()
+        finally:
+            self._connection.close()
@@ -0,0 +1,191 @@
+"""Receive sensor values from notifications of a connected device."""
+
+from __future__ import annotations
+
+import asyncio
+import dataclasses
+import time
+from functools import partial
+from logging import Logger
+from typing import TYPE_CHECKING, Awaitable, Callable, Protocol
+
+from bleak import BleakClient, BleakError
+from bleak.backends.characteristic import BleakGATTCharacteristic
+
+from .atom.frame import AtomFrameAssembler
+from .const import COMMAND_RESPONSE_TIMEOUT
+from .loop_monitor import PHASE_NOTIFY, loop_phase
+
+if TYPE_CHECKING:
+    from .parser import AirthingsDevice
+
+SubscriptionCallback = Callable[["AirthingsDevice"], None]
+
+# pylint: disable=too-few-public-methods
+
+
+class FrameJoiner(Protocol):
+    """Join notification fragments into complete frames."""
+
+    def feed(self, data: bytes | bytearray) -> bytes | None:
+        """Add a fragment, returns the frame once it is complete."""
+
+
+class SingleFrame:
+    """Every notification is a complete frame."""
+
+    def feed(self, data: bytes | bytearray) -> bytes | None:
+        """Add a fragment, returns the frame once it is complete."""
+        return bytes(data)
+
+
+class SizedFrames:
+    """Frames of a known size, which may be split over several notifications."""
+
+    def __init__(self, size: int) -> None:
+        self.size = size
+        self._buffer = bytearray()
+
+    def feed(self, data: bytes | bytearray) -> bytes | None:
+        """Add a fragment, returns the frame once it is complete."""
+        self._buffer += data
+        if len(self._buffer) < self.size:
+            return None
+        frame = bytes(self._buffer)
+        self._buffer = bytearray()
+        return frame
+
+
+class AtomFrames:
+    """Atom responses, which end when their CBOR payload is complete."""
+
+    def __init__(self) -> None:
+        self._assembler = AtomFrameAssembler()
+
+    def feed(self, data: bytes | bytearray) -> bytes | None:
+        """Add a fragment, returns the frame once it is complete."""
+        if not self._assembler.feed(data):
+            return None
+        frame = bytes(self._assembler.buffer)
+        self._assembler = AtomFrameAssembler()
+        return frame
+
+
+@dataclasses.dataclass
+class NotifyChannel:
+    """A characteristic that sends sensor values as notifications.
+
+    `handle_frame` stores the values of a frame in the device, and returns
+    True if any were found. If the device only sends values in response to a
+    request, `command` creates the request and it is written to `write_to`.
+    A request is sent again until it is answered or times out, as a new one
+    may not match the response to the previous one.
+    """
+
+    characteristic: BleakGATTCharacteristic
+    handle_frame: Callable[[bytes], bool]
+    frames: FrameJoiner = dataclasses.field(default_factory=SingleFrame)
+    command: Callable[[], bytes] | None = None
+    write_to: BleakGATTCharacteristic | None = None
+    # The request waiting for a response, and the monotonic time it was made
+    pending: bytes | None = dataclasses.field(default=None, init=False)
+    requested: float = dataclasses.field(default=0.0, init=False)
+
+    def request(self, now: float | None = None) -> bytes | None:
+        """Get the request to write, the pending one if it has not timed out."""
+        if self.command is None:
+            return None
+        now = time.monotonic() if now is None else now
+        if self.pending is None or now - self.requested >= COMMAND_RESPONSE_TIMEOUT:
+            self.pending = self.command()
+            self.requested = now
+        return self.pending
+
+
+# pylint: disable=too-many-instance-attributes,too-many-arguments
+# pylint: disable=too-many-positional-arguments
+class AirthingsSubscription:
+    """Notifications from a device that is kept connected.
+
+    The sensor values of `device` are updated in place as notifications
+    arrive, and the callback is called with the device after each update.
+    """
+
+    def __init__(
+        self,
+        client: BleakClient,
+        device: AirthingsDevice,
+        callback: SubscriptionCallback,
+        logger: Logger,
+        disconnected: asyncio.Future[bool],
+        release: Callable[[bool], Awaitable[None]],
+    ) -> None:
+        self.client = client
+        self.device = device
+        self.channels: list[NotifyChannel] = []
+        self.disconnected = disconnected
+        self._callback = callback
+        self._logger = logger
+        self._release = release
+        self._started: list[NotifyChannel] = []
+
+    @property
+    def is_connected(self) -> bool:
+        """Return True until the device disconnects or is unsubscribed."""
+        return not self.disconnected.done()
+
+    def add_channel(self, channel: NotifyChannel) -> None:
+        """Add a characteristic to enable notifications for."""
+        self.channels.append(channel)
+
+    async def start(self) -> None:
+        """Enable notifications for all channels."""
+        for channel in self.channels:
+            await self.client.start_notify(
+                channel.characteristic, partial(self._handle_notification, channel)
+            )
+            self._started.append(channel)
+
+    def _handle_notification(
+        self, channel: NotifyChannel, _: BleakGATTCharacteristic, data: bytearray
+    ) -> None:
+        with loop_phase(PHASE_NOTIFY):
+            if (frame := channel.frames.feed(data)) is None:
+                return
+            if not channel.handle_frame(frame):
+                self._logger.debug(
+                    "No sensor values in notification from %s",
+                    channel.characteristic,
+                )
+                return
+            channel.pending = None
+            try:
+                self._callback(self.device)
+            except Exception:  # pylint: disable=broad-exception-caught
+                self._logger.exception("Error in subscription callback")
+
+    async def refresh(self) -> None:
+        """Request new values from channels that only respond to requests.
+
+        The responses arrive as notifications, which are already enabled.
+        """
+        for channel in self.channels:
+            if channel.write_to is not None and (
+                (request := channel.request()) is not None
+            ):
+                await self.client.write_gatt_char(channel.write_to, bytearray(request))
+
+    async def unsubscribe(self) -> None:
+        """Disable the notifications and release the connection."""
+        keep = self.is_connected
+        if keep:
+            for channel in self._started:
+                try:
+                    await self.client.stop_notify(channel.characteristic)
+                except BleakError as err:
+                    self._logger.debug("Failed to stop notifications: %s", err)
+                    keep = False
+        self._started.clear()
+        if not self.disconnected.done():
+            self.disconnected.set_result(False)
+        await self._release(keep)
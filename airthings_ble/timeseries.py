@@ -0,0 +1,367 @@
+"""Compressed in-memory history of sensor values.
+
+The series are encoded like the Gorilla time series database: timestamps as
+the difference between consecutive deltas, and values as the XOR with the
+previous value. Slowly changing sensors take a few bits per sample.
+"""
+
+from __future__ import annotations
+
+import dataclasses
+import math
+import struct
+import time
+from collections import deque
+from typing import TYPE_CHECKING, Iterable, Iterator
+
+from .aggregator import Aggregate
+from .const import (
+    DEFAULT_HISTORY_BLOCK_SIZE,
+    DEFAULT_HISTORY_RETENTION,
+    NUMERIC_SENSORS,
+)
+
+if TYPE_CHECKING:
+    from .parser import AirthingsDevice
+
+_DOUBLE = struct.Struct(">d")
+_UINT64 = struct.Struct(">Q")
+_MASK_64 = (1 << 64) - 1
+
+# Prefix bits, prefix length and value bits for each range of delta of delta
+_TIMESTAMP_BUCKETS = (
+    (0b10, 2, 7),
+    (0b110, 3, 9),
+    (0b1110, 4, 12),
+)
+
+
+class BitWriter:
+    """Append bits to a byte array."""
+
+    def __init__(self) -> None:
+        self.data = bytearray()
+        self._pending = 0
+        self._pending_bits = 0
+        self.bits = 0
+
+    def write(self, value: int, bits: int) -> None:
+        """Write the lowest `bits` bits of the value."""
+        self._pending = (self._pending << bits) | (value & ((1 << bits) - 1))
+        self._pending_bits += bits
+        self.bits += bits
+        while self._pending_bits >= 8:
+            self._pending_bits -= 8
+            self.data.append((self._pending >> self._pending_bits) & 0xFF)
+        self._pending &= (1 << self._pending_bits) - 1
+
+    def getvalue(self) -> bytes:
+        """Get the bits written so far, padded to whole bytes."""
+        if not self._pending_bits:
+            return bytes(self.data)
+        return bytes(self.data) + bytes(
+            [(self._pending << (8 - self._pending_bits)) & 0xFF]
+        )
+
+
+class BitReader:
+    """Read bits from bytes written by a BitWriter."""
+
+    def __init__(self, data: bytes) -> None:
+        self._value = int.from_bytes(data, "big")
+        self._remaining = len(data) * 8
+
+    def read(self, bits: int) -> int:
+        """Read the next `bits` bits."""
+        self._remaining -= bits
+        if self._remaining < 0:
+            raise ValueError("Read past the end of the data")
+        return (self._value >> self._remaining) & ((1 << bits) - 1)
+
+    def read_bit(self) -> int:
+        """Read the next bit."""
+        return self.read(1)
+
+
+# pylint: disable=too-many-instance-attributes,too-few-public-methods
+class _Encoder:
+    """State of the encoder for a block of samples."""
+
+    def __init__(self) -> None:
+        self.writer = BitWriter()
+        self.count = 0
+        self.first_timestamp = 0
+        self.last_timestamp = 0
+        self._delta = 0
+        self._value = 0
+        self._leading = -1
+        self._trailing = 0
+
+    def append(self, timestamp: int, value: float) -> None:
+        """Encode a sample."""
+        writer = self.writer
+        bits = _UINT64.unpack(_DOUBLE.pack(value))[0]
+        if not self.count:
+            self.first_timestamp = timestamp
+            writer.write(timestamp & _MASK_64, 64)
+            writer.write(bits, 64)
+        else:
+            delta = timestamp - self.last_timestamp
+            _write_delta_of_delta(writer, delta - self._delta)
+            self._delta = delta
+            self._write_value(bits)
+        self.last_timestamp = timestamp
+        self._value = bits
+        self.count += 1
+
+    def _write_value(self, bits: int) -> None:
+        writer = self.writer
+        xor = bits ^ self._value
+        if not xor:
+            writer.write(0, 1)
+            return
+        leading = min(64 - xor.bit_length(), 31)
+        trailing = (xor & -xor).bit_length() - 1
+        if self._leading >= 0 and (
+            leading >= self._leading and trailing >= self._trailing
+        ):
+            # The changed bits fit in the window of the previous value
+            writer.write(0b10, 2)
+            writer.write(xor >> self._trailing, 64 - self._leading - self._trailing)
+            return
+        meaningful = 64 - leading - trailing
+        writer.write(0b11, 2)
+        writer.write(leading, 5)
+        writer.write(meaningful - 1, 6)
+        writer.write(xor >> trailing, meaningful)
+        self._leading = leading
+        self._trailing = trailing
+
+
+def _write_delta_of_delta(writer: BitWriter, delta_of_delta: int) -> None:
+    if not delta_of_delta:
+        writer.write(0, 1)
+        return
+    for prefix, prefix_bits, bits in _TIMESTAMP_BUCKETS:
+        offset = (1 << (bits - 1)) - 1
+        if -offset <= delta_of_delta <= offset + 1:
+            writer.write(prefix, prefix_bits)
+            writer.write(delta_of_delta + offset, bits)
+            return
+    writer.write(0b1111, 4)
+    writer.write(delta_of_delta & 0xFFFFFFFF, 32)
+
+
+def _read_delta_of_delta(reader: BitReader) -> int:
+    if not reader.read_bit():
+        return 0
+    for _, _, bits in _TIMESTAMP_BUCKETS:
+        if not reader.read_bit():
+            return reader.read(bits) - ((1 << (bits - 1)) - 1)
+    value = reader.read(32)
+    return value - (1 << 32) if value & (1 << 31) else value
+
+
+def decode_block(data: bytes, count: int) -> Iterator[tuple[int, float]]:
+    """Decode the samples of a block."""
+    if not count:
+        return
+    reader = BitReader(data)
+    timestamp = reader.read(64)
+    if timestamp & (1 << 63):
+        timestamp -= 1 << 64
+    bits = reader.read(64)
+    yield timestamp, _DOUBLE.unpack(_UINT64.pack(bits))[0]
+    delta = 0
+    leading = trailing = 0
+    for _ in range(count - 1):
+        delta += _read_delta_of_delta(reader)
+        timestamp += delta
+        if reader.read_bit():
+            if reader.read_bit():
+                leading = reader.read(5)
+                meaningful = reader.read(6) + 1
+                trailing = 64 - leading - meaningful
+            bits ^= reader.read(64 - leading - trailing) << trailing
+        yield timestamp, _DOUBLE.unpack(_UINT64.pack(bits))[0]
+
+
+@dataclasses.dataclass(frozen=True)
+class _Block:
+    """A closed block of encoded samples."""
+
+    data: bytes
+    count: int
+    first_timestamp: int
+    last_timestamp: int
+
+
+class CompressedSeries:
+    """Compressed samples of a single sensor.
+
+    The samples are encoded in blocks of `block_size`. Blocks that only hold
+    samples older than `retention` seconds before the newest one are dropped.
+    Timestamps are stored in whole seconds and must not decrease.
+    """
+
+    def __init__(
+        self,
+        block_size: int = DEFAULT_HISTORY_BLOCK_SIZE,
+        retention: float | None = DEFAULT_HISTORY_RETENTION,
+    ) -> None:
+        self.block_size = block_size
+        self.retention = retention
+        self._blocks: deque[_Block] = deque()
+        self._encoder = _Encoder()
+        self._last_timestamp: int | None = None
+
+    def __len__(self) -> int:
+        return sum(x.count for x in self._blocks) + self._encoder.count
+
+    @property
+    def nbytes(self) -> int:
+        """Size of the encoded samples."""
+        return sum(len(x.data) for x in self._blocks) + len(self._encoder.writer.data)
+
+    def append(self, timestamp: float, value: float) -> None:
+        """Add a sample."""
+        seconds = round(timestamp)
+        if self._last_timestamp is not None and seconds < self._last_timestamp:
+            raise ValueError("Samples must be appended in time order")
+        self._last_timestamp = seconds
+        encoder = self._encoder
+        encoder.append(seconds, value)
+        if encoder.count >= self.block_size:
+            self._blocks.append(
+                _Block(
+                    data=encoder.writer.getvalue(),
+                    count=encoder.count,
+                    first_timestamp=encoder.first_timestamp,
+                    last_timestamp=encoder.last_timestamp,
+                )
+            )
+            self._encoder = _Encoder()
+        if self.retention is not None:
+            cutoff = seconds - self.retention
+            while self._blocks and self._blocks[0].last_timestamp < cutoff:
+                self._blocks.popleft()
+
+    def samples(
+        self, start: float | None = None, end: float | None = None
+    ) -> Iterator[tuple[int, float]]:
+        """Iterate the samples with `start <= timestamp < end`."""
+        blocks: list[tuple[bytes, int, int, int]] = [
+            (x.data, x.count, x.first_timestamp, x.last_timestamp) for x in self._blocks
+        ]
+        encoder = self._encoder
+        if encoder.count:
+            blocks.append(
+                (
+                    encoder.writer.getvalue(),
+                    encoder.count,
+                    encoder.first_timestamp,
+                    encoder.last_timestamp,
+                )
+            )
+        for data, count, first_timestamp, last_timestamp in blocks:
+            if start is not None and last_timestamp < start:
+                continue
+            if end is not None and first_timestamp >= end:
+                break
+            for timestamp, value in decode_block(data, count):
+                if start is not None and timestamp < start:
+                    continue
+                if end is not None and timestamp >= end:
+                    return
+                yield timestamp, value
+
+    def downsample(
+        self, step: float, start: float | None = None, end: float | None = None
+    ) -> list[tuple[float, Aggregate]]:
+        """Aggregate the samples in buckets of `step` seconds."""
+        result: list[tuple[float, Aggregate]] = []
+        bucket: float | None = None
+        values: list[float] = []
+        for timestamp, value in self.samples(start, end):
+            if math.isnan(value):
+                continue
+            sample_bucket = timestamp - timestamp % step
+            if sample_bucket != bucket:
+                if bucket is not None and values:
+                    result.append((bucket, _aggregate(values)))
+                bucket = sample_bucket
+                values = []
+            values.append(value)
+        if bucket is not None and values:
+            result.append((bucket, _aggregate(values)))
+        return result
+
+
+def _aggregate(values: list[float]) -> Aggregate:
+    return Aggregate(
+        minimum=min(values),
+        maximum=max(values),
+        mean=math.fsum(values) / len(values),
+        count=len(values),
+    )
+
+
+class DeviceHistory:
+    """Compressed history of the numeric sensors of devices.
+
+    Readings are added with `add`, which can be registered as a listener with
+    `AirthingsBluetoothDeviceData.add_listener`.
+    """
+
+    def __init__(
+        self,
+        sensors: Iterable[str] = NUMERIC_SENSORS,
+        block_size: int = DEFAULT_HISTORY_BLOCK_SIZE,
+        retention: float | None = DEFAULT_HISTORY_RETENTION,
+    ) -> None:
+        self.sensors = tuple(sensors)
+        self.block_size = block_size
+        self.retention = retention
+        self._series: dict[str, dict[str, CompressedSeries]] = {}
+
+    @property
+    def nbytes(self) -> int:
+        """Size of all encoded samples."""
+        return sum(
+            series.nbytes
+            for device in self._series.values()
+            for series in device.values()
+        )
+
+    def add(self, device: AirthingsDevice, timestamp: float | None = None) -> None:
+        """Add the sensor values of a reading."""
+        now = time.time() if timestamp is None else timestamp
+        device_series = self._series.setdefault(device.address, {})
+        for sensor in self.sensors:
+            value = device.sensors.get(sensor)
+            if not isinstance(value, (int, float)) or isinstance(value, bool):
+                continue
+            if (series := device_series.get(sensor)) is None:
+                series = device_series[sensor] = CompressedSeries(
+                    self.block_size, self.retention
+                )
+            series.append(now, float(value))
+
+    def series(self, address: str, sensor: str) -> CompressedSeries | None:
+        """Get the series of a sensor of a device."""
+        return self._series.get(address, {}).get(sensor)
+
+    def samples(
+        self,
+        address: str,
+        sensor: str,
+        start: float | None = None,
+        end: float | None = None,
+    ) -> Iterator[tuple[int, float]]:
+        """Iterate the samples of a sensor with `start <= timestamp < end`."""
+        if (series := self.series(address, sensor)) is not None:
+            yield from series.samples(start, end)
+
+    def remove(self, address: str) -> None:
+        """Forget the history of a device."""
+        self._series.pop(address, None)
@@ -0,0 +1,104 @@
+import asyncio
+
+import pytest
+from airthings_ble.adapters import AdapterBalancer, adapter_from_device
+from bleak.backends.device import BLEDevice
+
+ADDRESS = "AA:BB:CC:DD:EE:FF"
+
+
+def _ble_device(adapter: str, address: str = ADDRESS) -> BLEDevice:
+    return BLEDevice(
+        address=address,
+        name=None,
+        details={"path": f"/org/bluez/{adapter}/dev_{address.replace(':', '_')}"},
+    )
+
+
+def test_adapter_from_device() -> None:
+    """Test getting the adapter from the device details."""
+    assert adapter_from_device(_ble_device("hci1")) == "hci1"
+    assert (
+        adapter_from_device(
+            BLEDevice(
+                address=ADDRESS, name=None, details={"source": "00:1A:7D:DA:71:13"}
+            )
+        )
+        == "00:1A:7D:DA:71:13"
+    )
+    assert (
+        adapter_from_device(BLEDevice(address=ADDRESS, name=None, details=None)) is None
+    )
+
+
+@pytest.mark.asyncio
+async def test_best_rssi_is_selected() -> None:
+    """Test that the adapter with the best RSSI is used."""
+    balancer = AdapterBalancer()
+    balancer.observe(_ble_device("hci0"), rssi=-85)
+    balancer.observe(_ble_device("hci1"), rssi=-60)
+
+    async with balancer.acquire(_ble_device("hci0")) as target:
+        assert adapter_from_device(target) == "hci1"
+        assert balancer.adapters["hci1"].in_flight == 1
+    assert balancer.adapters["hci1"].in_flight == 0
+    assert balancer.adapters_for([ADDRESS]) == {ADDRESS: "hci1"}
+
+
+@pytest.mark.asyncio
+async def test_failures_move_device_to_other_adapter() -> None:
+    """Test that a failing link is avoided."""
+    balancer = AdapterBalancer(failure_penalty=30)
+    balancer.observe(_ble_device("hci0"), rssi=-70)
+    balancer.observe(_ble_device("hci1"), rssi=-65)
+
+    with pytest.raises(TimeoutError):
+        async with balancer.acquire(_ble_device("hci1")) as target:
+            assert adapter_from_device(target) == "hci1"
+            raise TimeoutError
+
+    assert balancer.adapters["hci1"].failures == 1
+    async with balancer.acquire(_ble_device("hci1")) as target:
+        assert adapter_from_device(target) == "hci0"
+
+
+@pytest.mark.asyncio
+async def test_connection_limit_per_adapter() -> None:
+    """Test that connections wait for a free slot."""
+    balancer = AdapterBalancer(max_connections=1)
+    other = "11:22:33:44:55:66"
+    balancer.observe(_ble_device("hci0"), rssi=-60)
+    balancer.observe(_ble_device("hci0", other), rssi=-60)
+    balancer.observe(_ble_device("hci1", other), rssi=-90)
+
+    release = asyncio.Event()
+    used: list[str | None] = []
+
+    async def _connect(address: str) -> None:
+        async with balancer.acquire(_ble_device("hci0", address)) as target:
+            used.append(adapter_from_device(target))
+            await release.wait()
+
+    first = asyncio.ensure_future(_connect(ADDRESS))
+    await asyncio.sleep(0)
+    # hci0 is busy, so the other device uses hci1 despite the worse RSSI
+    second = asyncio.ensure_future(_connect(other))
+    await asyncio.sleep(0)
+    # Only hci0 sees this device, so it has to wait
+    third = asyncio.ensure_future(_connect(ADDRESS))
+    await asyncio.sleep(0.01)
+    assert used == ["hci0", "hci1"]
+
+    release.set()
+    await asyncio.gather(first, second, third)
+    assert used == ["hci0", "hci1", "hci0"]
+
+
+@pytest.mark.asyncio
+async def test_unknown_adapter_connects_directly() -> None:
+    """Test devices without adapter information."""
+    balancer = AdapterBalancer()
+    ble_device = BLEDevice(address=ADDRESS, name=None, details=None)
+    async with balancer.acquire(ble_device) as target:
+        assert target is ble_device
+    assert balancer.adapters == {}
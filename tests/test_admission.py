@@ -0,0 +1,58 @@
+from airthings_ble.admission import AdmissionPlan, ConnectionAdmission
+
+
+def test_order_by_rssi_and_success() -> None:
+    """Test that strong and reliable links are connected to first."""
+    admission = ConnectionAdmission(failure_penalty=30)
+    admission.observe("A", -80, now=0)
+    admission.observe("B", -60, now=0)
+    admission.observe("C", -65, now=0)
+    admission.record("B", False, now=1)
+    admission.record("C", True, duration=4.0, now=1)
+
+    # B loses 9 points for its failure
+    assert admission.plan(["A", "B", "C", "D"], now=2) == AdmissionPlan(
+        admitted=["C", "B", "A", "D"], deferred=[]
+    )
+    assert admission.links["C"].duration == 4.0
+
+
+def test_weak_devices_are_deferred() -> None:
+    """Test deferring devices below the RSSI threshold until it improves."""
+    admission = ConnectionAdmission(min_rssi=-90, max_deferral=600, rssi_max_age=60)
+    admission.observe("A", -95, now=0)
+    admission.record("A", True, now=0)
+
+    assert not admission.admit("A", now=10)
+    admission.observe("A", -85, now=20)
+    assert admission.admit("A", now=20)
+
+    admission.observe("A", -95, now=30)
+    assert not admission.admit("A", now=30)
+    # A stale RSSI is not used
+    assert admission.admit("A", now=100)
+    # A weak device is still tried after the longest deferral
+    admission.observe("A", -95, now=600)
+    assert admission.admit("A", now=600)
+
+
+def test_failing_devices_back_off() -> None:
+    """Test deferring devices that keep failing, for longer each time."""
+    admission = ConnectionAdmission(
+        min_success_rate=0.25, retry_delay=60, max_deferral=200
+    )
+    for now in range(4):
+        assert admission.admit("A", now=now)
+        admission.record("A", False, now=now)
+    # The success rate is now 0.7 ** 4 = 0.24
+    assert admission.plan(["A"], now=10) == AdmissionPlan([], ["A"])
+    assert admission.admit("A", now=63)
+
+    admission.record("A", False, now=63)
+    assert not admission.admit("A", now=182)
+    assert admission.admit("A", now=183)
+    admission.record("A", False, now=183)
+    assert admission.links["A"].retry_at == 383
+
+    admission.record("A", True, duration=3.0, now=400)
+    assert admission.admit("A", now=400)
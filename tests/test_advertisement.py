@@ -0,0 +1,72 @@
+import pytest
+from airthings_ble.advertisement import parse_advertisement
+from airthings_ble.const import MFCT_ID
+from airthings_ble.device_type import AirthingsDeviceType
+
+
+def test_parse_wave_gen_1_name() -> None:
+    """Test getting model and identifier from the Wave Gen 1 name."""
+    advertisement = parse_advertisement(name="AT#123456-2900Radon")
+
+    assert advertisement is not None
+    assert advertisement.model == AirthingsDeviceType.WAVE_GEN_1
+    assert advertisement.identifier == "123456"
+    assert advertisement.name == "AT#123456-2900Radon"
+    assert advertisement.is_supported
+
+
+@pytest.mark.parametrize(
+    "serial_number,model",
+    [
+        (2930012345, AirthingsDeviceType.WAVE_PLUS),
+        (2920012345, AirthingsDeviceType.WAVE_MINI),
+        (3210012345, AirthingsDeviceType.WAVE_ENHANCE_EU),
+        (3250012345, AirthingsDeviceType.CORENTIUM_HOME_2),
+    ],
+)
+def test_parse_manufacturer_data(
+    serial_number: int, model: AirthingsDeviceType
+) -> None:
+    """Test getting model and serial number from the manufacturer data."""
+    advertisement = parse_advertisement(
+        name="Airthings Wave+",
+        manufacturer_data={
+            MFCT_ID: serial_number.to_bytes(4, "little") + bytes.fromhex("0900")
+        },
+    )
+
+    assert advertisement is not None
+    assert advertisement.model == model
+    assert advertisement.identifier == str(serial_number)
+    assert advertisement.name == ""
+
+
+def test_parse_unsupported_model() -> None:
+    """Test that unsupported models are reported, without changing UNKNOWN."""
+    advertisement = parse_advertisement(
+        name=None,
+        manufacturer_data={MFCT_ID: (2960012345).to_bytes(4, "little")},
+    )
+
+    assert advertisement is not None
+    assert advertisement.model == AirthingsDeviceType.UNKNOWN
+    assert advertisement.model_raw == "2960"
+    assert not advertisement.is_supported
+    assert AirthingsDeviceType.UNKNOWN.raw_value == "0"
+
+
+@pytest.mark.parametrize(
+    "name,manufacturer_data",
+    [
+        (None, None),
+        ("Airthings Wave+", {}),
+        ("Airthings Wave+", {MFCT_ID: bytes.fromhex("0102")}),
+        ("Airthings Wave+", {MFCT_ID: (1234).to_bytes(4, "little")}),
+        ("Airthings Wave+", {76: (2930012345).to_bytes(4, "little")}),
+    ],
+)
+def test_parse_without_model(
+    name: str | None, manufacturer_data: dict[int, bytes] | None
+) -> None:
+    """Test advertisements without model information."""
+    assert parse_advertisement(name=name, manufacturer_data=manufacturer_data) is None
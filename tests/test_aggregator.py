@@ -0,0 +1,87 @@
+import logging
+import random
+
+import pytest
+from airthings_ble import AirthingsBluetoothDeviceData
+from airthings_ble.aggregator import Aggregate, RollingAggregator, SensorSeries
+from airthings_ble.parser import AirthingsDevice
+from bleak.backends.device import BLEDevice
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def test_series_matches_brute_force() -> None:
+    """Test the rolling aggregates against a full recomputation."""
+    rng = random.Random(1234)
+    series = SensorSeries(windows=(60, 300), capacity=40)
+    history: list[tuple[float, float]] = []
+    now = 0.0
+    for _ in range(500):
+        now += rng.uniform(1, 20)
+        value = round(rng.uniform(400, 2000), 1)
+        series.append(now, value)
+        history.append((now, value))
+
+        kept = history[-40:]
+        for window in (60, 300):
+            values = [v for t, v in kept if t > now - window]
+            aggregate = series.aggregate(window, now)
+            assert aggregate is not None
+            assert aggregate.minimum == min(values)
+            assert aggregate.maximum == max(values)
+            assert aggregate.mean == pytest.approx(sum(values) / len(values))
+            assert aggregate.count == len(values)
+
+
+def test_window_expires_without_new_values() -> None:
+    """Test that old values leave the window when queried later."""
+    series = SensorSeries(windows=(60,), capacity=10)
+    series.append(0, 1.0)
+    series.append(30, 3.0)
+    assert series.aggregate(60, now=50) == Aggregate(1.0, 3.0, 2.0, 2)
+    assert series.aggregate(60, now=80) == Aggregate(3.0, 3.0, 3.0, 1)
+    assert series.aggregate(60, now=100) is None
+    assert len(series) == 2
+
+
+def test_aggregator_keeps_numeric_sensors() -> None:
+    """Test that only the selected numeric sensors are aggregated."""
+    aggregator = RollingAggregator(windows=(300,))
+    for timestamp, co2 in ((0, 800.0), (60, 1000.0)):
+        aggregator.add(
+            AirthingsDevice(
+                address="A",
+                sensors={"co2": co2, "connectivity_mode": "BLE", "voc": None},
+            ),
+            timestamp=timestamp,
+        )
+
+    assert aggregator.aggregates("A", now=60) == {
+        "co2": {300: Aggregate(800.0, 1000.0, 900.0, 2)}
+    }
+    assert aggregator.aggregate("A", "voc", 300, now=60) is None
+    aggregator.remove("A")
+    assert aggregator.aggregates("A", now=60) == {}
+
+
+@pytest.mark.asyncio
+async def test_listener_receives_updates(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test feeding the aggregator from update_device."""
+    data = AirthingsBluetoothDeviceData(logger=_LOGGER)
+    aggregator = RollingAggregator()
+    remove = data.add_listener(aggregator.add)
+
+    async def _update_device(ble_device: BLEDevice) -> AirthingsDevice:
+        return AirthingsDevice(address=ble_device.address, sensors={"co2": 500.0})
+
+    monkeypatch.setattr(data, "_update_device", _update_device)
+    ble_device = BLEDevice(address="A", name=None, details=None)
+
+    await data.update_device(ble_device)
+    aggregate = aggregator.aggregate("A", "co2", 300)
+    assert aggregate is not None and aggregate.count == 1
+
+    remove()
+    await data.update_device(ble_device)
+    aggregate = aggregator.aggregate("A", "co2", 300)
+    assert aggregate is not None and aggregate.count == 1
@@ -0,0 +1,136 @@
+import asyncio
+import logging
+from typing import Any, Callable
+
+import pytest
+from airthings_ble import AirthingsBluetoothDeviceData
+from airthings_ble.airtime import AirtimeStats, metered_client
+from airthings_ble.parser import AirthingsDevice
+from bleak import BleakClient
+from bleak.backends.device import BLEDevice
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class _FakeClient:
+    address = "A"
+
+    def __init__(self) -> None:
+        self.written: list[bytes] = []
+        self.callback: Callable[[Any, bytearray], None] | None = None
+
+    async def read_gatt_char(self, characteristic: object) -> bytearray:
+        return bytearray(b"\x01\x02\x03")
+
+    async def write_gatt_char(self, characteristic: object, data: bytes) -> None:
+        self.written.append(bytes(data))
+
+    async def start_notify(
+        self, characteristic: object, callback: Callable[[Any, bytearray], None]
+    ) -> None:
+        self.callback = callback
+
+
+@pytest.mark.asyncio
+async def test_metered_client_counts_traffic() -> None:
+    """Test counting reads, writes and notifications."""
+    fake = _FakeClient()
+    stats = AirtimeStats()
+    client = metered_client(fake, stats)  # type: ignore[arg-type]
+    received: list[bytearray] = []
+
+    assert client.address == "A"
+    assert await client.read_gatt_char("x") == bytearray(b"\x01\x02\x03")
+    await client.write_gatt_char("x", b"\x6d")
+    await client.start_notify("x", lambda _, data: received.append(data))
+    assert fake.callback is not None
+    fake.callback(None, bytearray(b"\x00" * 20))
+
+    assert fake.written == [b"\x6d"]
+    assert received == [bytearray(b"\x00" * 20)]
+    assert stats == AirtimeStats(
+        reads=1,
+        writes=1,
+        notifications=1,
+        bytes_read=3,
+        bytes_written=1,
+        bytes_notified=20,
+    )
+    assert stats.payload_bytes == 24
+
+
+def _fake_session(
+    monkeypatch: pytest.MonkeyPatch, data: AirthingsBluetoothDeviceData
+) -> None:
+
+    async def _establish_connection(
+        ble_device: BLEDevice, disconnect_future: asyncio.Future[bool]
+    ) -> _FakeClient:
+        await asyncio.sleep(0.01)
+        return _FakeClient()
+
+    async def _release_connection(client: object, keep: bool) -> None:
+        assert isinstance(client, _FakeClient)
+
+    async def _get_device_characteristics(
+        client: BleakClient, device: AirthingsDevice
+    ) -> None:
+        await client.read_gatt_char("model")
+
+    async def _get_service_characteristics(
+        client: BleakClient, device: AirthingsDevice
+    ) -> None:
+        await client.read_gatt_char("sensors")
+        await client.write_gatt_char("command", b"\x6d")
+
+    monkeypatch.setattr(data, "_establish_connection", _establish_connection)
+    monkeypatch.setattr(data, "_release_connection", _release_connection)
+    monkeypatch.setattr(
+        data, "_get_device_characteristics", _get_device_characteristics
+    )
+    monkeypatch.setattr(
+        data, "_get_service_characteristics", _get_service_characteristics
+    )
+
+
+@pytest.mark.asyncio
+async def test_update_reports_airtime(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that each update has its delta and the parser keeps the totals."""
+    data = AirthingsBluetoothDeviceData(logger=_LOGGER)
+    _fake_session(monkeypatch, data)
+    ble_device = BLEDevice(address="A", name=None, details=None)
+
+    first = await data.update_device(ble_device)
+    second = await data.update_device(ble_device)
+
+    assert first.airtime is not None and second.airtime is not None
+    assert first.airtime.connections == 1
+    assert first.airtime.connect_seconds >= 0.01
+    assert (first.airtime.reads, first.airtime.writes) == (2, 1)
+    assert first.airtime.bytes_read == 6
+    total = data.airtime["A"]
+    assert (total.connections, total.reads, total.writes) == (2, 4, 2)
+    assert total.connect_seconds == pytest.approx(
+        first.airtime.connect_seconds + second.airtime.connect_seconds
+    )
+
+
+@pytest.mark.asyncio
+async def test_shared_readings_have_no_airtime(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Test that only the caller that connected gets the airtime."""
+    data = AirthingsBluetoothDeviceData(logger=_LOGGER, cache_ttl=60)
+    _fake_session(monkeypatch, data)
+    ble_device = BLEDevice(address="A", name=None, details=None)
+
+    first, joined = await asyncio.gather(
+        data.update_device(ble_device), data.update_device(ble_device)
+    )
+    cached = await data.update_device(ble_device)
+
+    assert first.airtime is not None
+    assert first.airtime.connections == 1
+    assert joined.airtime is None
+    assert cached.airtime is None
+    assert data.airtime["A"].connections == 1
@@ -0,0 +1,118 @@
+import asyncio
+import logging
+from pathlib import Path
+
+import pytest
+from airthings_ble import AirthingsBluetoothDeviceData
+from airthings_ble.arrow_export import (
+    FrameRecorder,
+    ParquetSink,
+    record_batches,
+    write_parquet,
+)
+from airthings_ble.const import CHAR_UUID_WAVE_2_DATA
+from airthings_ble.device_type import AirthingsDeviceType
+from airthings_ble.parser import AirthingsDevice
+from bleak import BleakClient
+from bleak.backends.device import BLEDevice
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def _devices(count: int) -> list[AirthingsDevice]:
+    return [
+        AirthingsDevice(
+            address=f"00:00:00:00:00:{index % 3:02X}",
+            model=AirthingsDeviceType.WAVE_PLUS,
+            sensors={"co2": 400.0 + index, "radon_1day_level": "good"},
+            sensor_timestamps={"co2": 1000.0 + index},
+        )
+        for index in range(count)
+    ]
+
+
+def test_record_batches_are_chunked() -> None:
+    """Test converting readings to dictionary encoded record batches."""
+    pa = pytest.importorskip("pyarrow")
+    batches = list(record_batches(_devices(5), sensors=("co2", "voc"), chunk_size=2))
+
+    assert [x.num_rows for x in batches] == [2, 2, 1]
+    table = pa.Table.from_batches(batches)
+    assert pa.types.is_dictionary(table.schema.field("address").type)
+    assert table.column("co2").to_pylist() == [400.0, 401.0, 402.0, 403.0, 404.0]
+    assert table.column("voc").null_count == 5
+    assert table.column("model").to_pylist()[0] == "WAVE_PLUS"
+    assert table.column("timestamp").cast(pa.int64()).to_pylist()[0] == 1_000_000
+
+
+def test_write_parquet(tmp_path: Path) -> None:
+    """Test writing readings to Parquet, a row group per chunk."""
+    pytest.importorskip("pyarrow")
+    import pyarrow.parquet as pq
+
+    path = str(tmp_path / "readings.parquet")
+    assert write_parquet(path, iter(_devices(5)), chunk_size=2) == 5
+    assert pq.ParquetFile(path).metadata.num_row_groups == 3
+
+    sink_path = str(tmp_path / "sink.parquet")
+    sink = ParquetSink(sink_path, sensors=("co2",), chunk_size=4)
+    for device in _devices(5):
+        sink.add(device)
+    sink.close()
+    assert sink.rows == 5
+    assert pq.read_table(sink_path).column("co2").to_pylist()[-1] == 404.0
+
+
+class _FakeClient:
+    address = "AA"
+
+    async def read_gatt_char(self, characteristic: object) -> bytearray:
+        return bytearray(b"\x01\x02")
+
+
+@pytest.mark.asyncio
+async def test_frames_are_recorded(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test recording the raw data read during updates."""
+    data = AirthingsBluetoothDeviceData(logger=_LOGGER)
+    recorder = FrameRecorder()
+    remove = data.add_frame_listener(recorder.add)
+
+    async def _establish_connection(
+        ble_device: BLEDevice, disconnect_future: asyncio.Future[bool]
+    ) -> _FakeClient:
+        return _FakeClient()
+
+    async def _release_connection(client: object, keep: bool) -> None:
+        pass
+
+    async def _get_device_characteristics(
+        client: BleakClient, device: AirthingsDevice
+    ) -> None:
+        pass
+
+    async def _get_service_characteristics(
+        client: BleakClient, device: AirthingsDevice
+    ) -> None:
+        await client.read_gatt_char(CHAR_UUID_WAVE_2_DATA)
+
+    monkeypatch.setattr(data, "_establish_connection", _establish_connection)
+    monkeypatch.setattr(data, "_release_connection", _release_connection)
+    monkeypatch.setattr(
+        data, "_get_device_characteristics", _get_device_characteristics
+    )
+    monkeypatch.setattr(
+        data, "_get_service_characteristics", _get_service_characteristics
+    )
+    ble_device = BLEDevice(address="AA", name=None, details=None)
+
+    await data.update_device(ble_device)
+    remove()
+    await data.update_device(ble_device)
+    assert len(recorder) == 1
+
+    pa = pytest.importorskip("pyarrow")
+    batch = recorder.to_record_batch()
+    assert len(recorder) == 0
+    assert batch.column("characteristic").to_pylist() == [str(CHAR_UUID_WAVE_2_DATA)]
+    assert batch.column("data").to_pylist() == [b"\x01\x02"]
+    assert batch.schema.field("data").type == pa.binary()
@@ -0,0 +1,112 @@
+import asyncio
+import logging
+
+import cbor2
+import pytest
+from airthings_ble.atom.frame import AtomFrameAssembler, CborItemScanner
+from airthings_ble.atom.request_path import AtomRequestPath
+from airthings_ble.command_decode import AtomCommandDecode, AtomNotificationReceiver
+
+_LOGGER = logging.getLogger(__name__)
+
+WAVE_ENHANCE_LATEST_VALUES = bytes.fromhex(
+    "1001000345a1b281a2006d32393939392f302f333130313202583ea9634e4f49"
+    + "182763544d501972f06348554d190d2f63434f321902dc63564f43190115634c5"
+    + "55801635052531a005f364663424154190b346354494d1876"
+)
+
+
+@pytest.mark.parametrize(
+    "value",
+    [
+        0,
+        -1000,
+        2**40,
+        1.5,
+        "text",
+        b"\x00" * 300,
+        [1, [2, [3, {}]], []],
+        {"TMP": 29424, "HUM": [1, 2]},
+        cbor2.CBORTag(1, 1700000000),
+        None,
+        True,
+    ],
+)
+def test_cbor_scanner_definite_items(value: object) -> None:
+    """Test that the scanner finds the end of an item, byte by byte."""
+    encoded = cbor2.dumps(value) + b"\xde\xad"
+    scanner = CborItemScanner()
+
+    for end in range(1, len(encoded) - 2):
+        assert not scanner.feed(encoded[:end])
+    assert scanner.feed(encoded[: len(encoded) - 2])
+    assert scanner.position == len(encoded) - 2
+
+
+def test_cbor_scanner_indefinite_items() -> None:
+    """Test indefinite length arrays, maps and strings."""
+    # [_ 1, {_ "a": (_ h'01', h'02')}]
+    encoded = bytes.fromhex("9f01bf6161" + "5f41014102ff" + "ffff")
+    assert cbor2.loads(encoded) == [1, {"a": b"\x01\x02"}]
+
+    scanner = CborItemScanner()
+    assert not scanner.feed(encoded[:-1])
+    assert scanner.feed(encoded)
+    assert scanner.position == len(encoded)
+
+
+def test_cbor_scanner_invalid_data() -> None:
+    """Test that invalid data is reported."""
+    with pytest.raises(ValueError):
+        CborItemScanner().feed(bytes.fromhex("1c"))
+    with pytest.raises(ValueError):
+        CborItemScanner().feed(bytes.fromhex("8201ff"))
+
+
+@pytest.mark.parametrize("fragment_size", [1, 7, 20, 244])
+def test_atom_frame_assembler(fragment_size: int) -> None:
+    """Test reassembling an Atom response from fragments."""
+    assembler = AtomFrameAssembler()
+    fragments = [
+        WAVE_ENHANCE_LATEST_VALUES[i : i + fragment_size]
+        for i in range(0, len(WAVE_ENHANCE_LATEST_VALUES), fragment_size)
+    ]
+
+    for fragment in fragments[:-1]:
+        assert not assembler.feed(fragment)
+        assert assembler.frame_length is None
+    assert assembler.feed(fragments[-1])
+    assert assembler.frame_length == len(WAVE_ENHANCE_LATEST_VALUES)
+    assert assembler.buffer == WAVE_ENHANCE_LATEST_VALUES
+
+
+def test_atom_frame_assembler_invalid_header() -> None:
+    """Test that a frame with an unknown header stops the assembly."""
+    assembler = AtomFrameAssembler()
+    assert not assembler.feed(bytes.fromhex("0000"))
+    assert assembler.feed(bytes.fromhex("000345a1b281"))
+    assert assembler.complete
+    assert assembler.frame_length is None
+
+
+@pytest.mark.asyncio
+async def test_atom_notification_receiver() -> None:
+    """Test that the receiver waits for the full Atom response."""
+    decoder = AtomCommandDecode(url=AtomRequestPath.LATEST_VALUES)
+    decoder.request.random_bytes = bytes.fromhex("a1b2")
+    receiver = decoder.make_data_receiver()
+    assert isinstance(receiver, AtomNotificationReceiver)
+
+    receiver(None, bytearray(WAVE_ENHANCE_LATEST_VALUES[:20]))
+    with pytest.raises(asyncio.TimeoutError):
+        await receiver.wait_for_message(0.01)
+
+    receiver = decoder.make_data_receiver()
+    for i in range(0, len(WAVE_ENHANCE_LATEST_VALUES), 20):
+        receiver(None, bytearray(WAVE_ENHANCE_LATEST_VALUES[i : i + 20]))
+    await receiver.wait_for_message(0.01)
+
+    data = decoder.decode_data(logger=_LOGGER, raw_data=receiver.message)
+    assert data is not None
+    assert data["TMP"] == 29424
+    assert data["NOI"] == 39
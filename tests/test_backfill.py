@@ -0,0 +1,222 @@
+import logging
+from typing import Iterable
+
+import pytest
+from airthings_ble.backfill import (
+    BackfillTask,
+    StoredFrame,
+    backfill,
+    decode_frames,
+    plan_backfill,
+)
+from airthings_ble.const import (
+    BATTERY,
+    CHAR_UUID_WAVE_PLUS_DATA,
+    CO2,
+    COMMAND_UUID_ATOM_NOTIFY,
+    COMMAND_UUID_WAVE_PLUS,
+    TEMPERATURE,
+)
+from airthings_ble.device_type import AirthingsDeviceType
+from airthings_ble.parser import AirthingsBluetoothDeviceData, AirthingsDevice
+
+WAVE_PLUS_DATA = bytes.fromhex("01380d800b002200bd094cc31d036c0000007d05")
+WAVE_PLUS_COMMAND = bytes.fromhex(
+    "6d00600c04000100008211ff00000000c04c20001f3560007006B80B0900"
+)
+ATOM_LATEST_VALUES = bytes.fromhex(
+    "1001000345a1b281a2006d32393939392f302f333130313202583ea9634e4f49"
+    + "182763544d501972f06348554d190d2f63434f321902dc63564f43190115634c5"
+    + "55801635052531a005f364663424154190b346354494d1876"
+)
+
+
+def _wave_plus_frames(address: str, timestamp: float) -> list[StoredFrame]:
+    data = str(CHAR_UUID_WAVE_PLUS_DATA)
+    command = str(COMMAND_UUID_WAVE_PLUS)
+    return [
+        StoredFrame(address, data, WAVE_PLUS_DATA, timestamp),
+        StoredFrame(address, command, WAVE_PLUS_COMMAND[:20], timestamp + 1),
+        StoredFrame(address, command, WAVE_PLUS_COMMAND[20:], timestamp + 1.1),
+    ]
+
+
+def _load_frames(address: str, start: float, end: float) -> Iterable[StoredFrame]:
+    return [
+        frame
+        for timestamp in range(0, 400, 100)
+        for frame in _wave_plus_frames(address, timestamp)
+        if start <= frame.timestamp < end
+    ]
+
+
+def _atom_frames(address: str, timestamp: float) -> list[StoredFrame]:
+    notify = str(COMMAND_UUID_ATOM_NOTIFY)
+    return [
+        StoredFrame(
+            address, notify, ATOM_LATEST_VALUES[x : x + 20], timestamp + x / 100
+        )
+        for x in range(0, len(ATOM_LATEST_VALUES), 20)
+    ]
+
+
+# Readings with frames on both sides of the window edge at 200
+EDGE_FRAMES = [
+    *_wave_plus_frames("A", 199.5),
+    *_atom_frames("B", 199.5),
+]
+
+
+def _load_edge_frames(address: str, start: float, end: float) -> Iterable[StoredFrame]:
+    return [
+        x for x in EDGE_FRAMES if x.address == address and start <= x.timestamp < end
+    ]
+
+
+def test_decode_frames() -> None:
+    """Test decoding stored frames into readings."""
+    notify = str(COMMAND_UUID_ATOM_NOTIFY)
+    frames = [
+        *_wave_plus_frames("A", 1000.0),
+        *_wave_plus_frames("A", 2000.0),
+        StoredFrame("A", str(CHAR_UUID_WAVE_PLUS_DATA), b"\x00", 2001.5),
+        *(
+            StoredFrame("B", notify, ATOM_LATEST_VALUES[x : x + 20], 1500.0 + x)
+            for x in range(0, len(ATOM_LATEST_VALUES), 20)
+        ),
+    ]
+
+    readings = decode_frames(
+        reversed(frames),
+        {"A": AirthingsDeviceType.WAVE_PLUS, "B": AirthingsDeviceType.WAVE_ENHANCE_EU},
+    )
+
+    assert [(x.address, x.read_time) for x in readings] == [
+        ("A", 1001.1),
+        ("B", 1580.0),
+        ("A", 2001.1),
+    ]
+    first = readings[0]
+    assert first.model == AirthingsDeviceType.WAVE_PLUS
+    assert first.sensors[CO2] == 797
+    assert first.sensors[BATTERY] == 100
+    assert first.sensor_timestamps[CO2] == 1000.0
+    assert first.sensor_timestamps[BATTERY] == 1001.1
+    assert readings[1].sensors[CO2] == 732
+    assert readings[1].sensors[TEMPERATURE] == pytest.approx(21.09)
+
+
+def test_plan_backfill() -> None:
+    """Test splitting devices into aligned windows."""
+    assert plan_backfill({"B": (150.0, 250.0), "A": (0.0, 99.0)}, window=100) == [
+        BackfillTask("A", 0, 100),
+        BackfillTask("B", 100, 200),
+        BackfillTask("B", 200, 300),
+    ]
+
+
+def test_backfill_merges_in_time_order() -> None:
+    """Test decoding in worker processes and merging the results."""
+    received: list[tuple[str, float]] = []
+
+    def _sink(device: AirthingsDevice, timestamp: float) -> None:
+        received.append((device.address, timestamp))
+
+    tasks = plan_backfill({"A": (0.0, 301.1), "B": (0.0, 301.1)}, window=200)
+    count = backfill(
+        _load_frames,
+        tasks,
+        _sink,
+        models={"A": AirthingsDeviceType.WAVE_PLUS},
+        workers=2,
+    )
+
+    assert count == 8
+    assert received == [
+        (address, timestamp + 1.1)
+        for timestamp in range(0, 400, 100)
+        for address in ("A", "B")
+    ]
+
+
+def test_decode_frames_drops_stale_fragments() -> None:
+    """Test that fragments of an earlier reading are not completed later."""
+    frames = [
+        # The second half of the command response was lost
+        *_wave_plus_frames("A", 0.0)[:2],
+        *_atom_frames("B", 0.0)[:2],
+        *_wave_plus_frames("A", 100.0),
+        *_atom_frames("B", 100.0),
+    ]
+
+    readings = decode_frames(
+        frames,
+        {"A": AirthingsDeviceType.WAVE_PLUS, "B": AirthingsDeviceType.WAVE_ENHANCE_EU},
+    )
+
+    assert [(x.address, BATTERY in x.sensors) for x in readings] == [
+        ("A", False),
+        ("B", True),
+        ("A", True),
+    ]
+    assert readings[1].sensors[CO2] == 732
+    assert readings[2].sensors[BATTERY] == 100
+
+
+def test_command_response_split_before_the_last_values() -> None:
+    """Test that a command response is only decoded once it is complete."""
+    command = str(COMMAND_UUID_WAVE_PLUS)
+    # The first fragment is as long as the values, without the two byte prefix
+    frames = [
+        StoredFrame("A", command, WAVE_PLUS_COMMAND[:28], 0.0),
+        StoredFrame("A", command, WAVE_PLUS_COMMAND[28:], 0.1),
+    ]
+
+    [reading] = decode_frames(frames, {"A": AirthingsDeviceType.WAVE_PLUS})
+
+    assert reading.sensors == {BATTERY: 100}
+    assert reading.sensor_timestamps == {BATTERY: 0.1}
+
+
+def test_decode_message() -> None:
+    """Test decoding complete messages with the parser."""
+    parser = AirthingsBluetoothDeviceData(logging.getLogger(__name__))
+    device = AirthingsDevice(model=AirthingsDeviceType.WAVE_PLUS)
+
+    assert parser.decode_message(
+        device, str(COMMAND_UUID_WAVE_PLUS), WAVE_PLUS_COMMAND
+    ) == {BATTERY: 100}
+    assert (
+        parser.decode_message(device, str(CHAR_UUID_WAVE_PLUS_DATA), WAVE_PLUS_DATA)[
+            CO2
+        ]
+        == 797
+    )
+    assert parser.decode_message(device, "unknown", b"\x00") == {}
+    atom = parser.decode_message(
+        device, str(COMMAND_UUID_ATOM_NOTIFY), ATOM_LATEST_VALUES
+    )
+    assert atom[CO2] == 732
+
+
+def test_backfill_across_window_edge() -> None:
+    """Test that a reading split by a window edge is decoded once, in full."""
+    received: list[AirthingsDevice] = []
+
+    tasks = plan_backfill({"A": (199.5, 200.6), "B": (199.5, 200.3)}, window=200)
+    count = backfill(
+        _load_edge_frames,
+        tasks,
+        lambda device, _: received.append(device),
+        models={
+            "A": AirthingsDeviceType.WAVE_PLUS,
+            "B": AirthingsDeviceType.WAVE_ENHANCE_EU,
+        },
+        workers=2,
+    )
+
+    assert count == 2
+    assert [x.address for x in received] == ["B", "A"]
+    assert received[0].sensors[CO2] == 732
+    assert received[1].sensors[CO2] == 797
+    assert received[1].sensors[BATTERY] == 100
@@ -0,0 +1,190 @@
+import asyncio
+from multiprocessing.connection import Connection
+from typing import Any
+
+import pytest
+from airthings_ble.collector import (
+    CollectedReading,
+    ShardedCollector,
+    ShardSpec,
+    _poll_shard,
+    decode_record,
+    encode_error,
+    encode_reading,
+    plan_shards,
+)
+from airthings_ble.const import MFCT_ID
+from airthings_ble.parser import AirthingsBluetoothDeviceData, AirthingsDevice
+from airthings_ble.scanner import AirthingsScanner
+from bleak.backends.device import BLEDevice
+from bleak.backends.scanner import AdvertisementData
+
+
+def _send_and_exit(
+    spec: ShardSpec, conn: Connection, interval: float, is_metric: bool
+) -> None:
+    for address in spec.addresses:
+        conn.send_bytes(
+            encode_reading(
+                AirthingsDevice(address=address, sensors={"co2": 500.0}), 10.0
+            )
+        )
+    conn.close()
+
+
+class _FakeConnection:
+    def __init__(self, expected: int) -> None:
+        self.records: list[CollectedReading] = []
+        self.expected = expected
+        self.received = asyncio.Event()
+
+    def send_bytes(self, data: bytes) -> None:
+        self.records.append(decode_record(data))
+        if len(self.records) >= self.expected:
+            self.received.set()
+
+
+def _advertisement(rssi: int) -> AdvertisementData:
+    return AdvertisementData(
+        local_name=None,
+        manufacturer_data={MFCT_ID: (2930123456).to_bytes(4, "little")},
+        service_data={},
+        service_uuids=[],
+        tx_power=None,
+        rssi=rssi,
+        platform_data=(),
+    )
+
+
+def test_record_round_trip() -> None:
+    """Test encoding and decoding readings and errors."""
+    device = AirthingsDevice(
+        address="AA:BB:CC:DD:EE:FF",
+        sensors={
+            "co2": 812.0,
+            "temperature": 21.5,
+            "radon_1day_level": "good",
+            "connectivity_mode": "BLE",
+            "voc": None,
+            "custom": 1,
+        },
+    )
+    reading = decode_record(encode_reading(device, 1700000000.5), shard=2)
+    assert reading == CollectedReading(
+        address="AA:BB:CC:DD:EE:FF",
+        timestamp=1700000000.5,
+        sensors={
+            "co2": 812.0,
+            "temperature": 21.5,
+            "radon_1day_level": "good",
+            "connectivity_mode": "BLE",
+            "voc": None,
+            "custom": 1.0,
+        },
+        shard=2,
+    )
+
+    error = decode_record(encode_error("A", 5.0, "TimeoutError: slow"))
+    assert error.error == "TimeoutError: slow"
+    assert error.sensors == {}
+
+    with pytest.raises(IndexError):
+        decode_record(encode_error("A", 5.0, "TimeoutError: slow")[:-3])
+
+    long = AirthingsDevice(address="A", sensors={"x" * 300: "y" * 1000})
+    assert decode_record(encode_reading(long, 5.0)).sensors == long.sensors
+
+
+def test_plan_shards() -> None:
+    """Test that devices are grouped per adapter and spread by address."""
+    devices: dict[str, str | None] = {
+        f"00:00:00:00:00:{x:02X}": None for x in range(20)
+    }
+    devices["AA"] = "hci1"
+    devices["BB"] = "hci1"
+    devices["CC"] = "hci0"
+    shards = plan_shards(devices, shards=3)
+
+    assert shards[0] == ShardSpec(index=0, addresses=("CC",), adapter="hci0")
+    assert shards[1] == ShardSpec(index=1, addresses=("AA", "BB"), adapter="hci1")
+    assert [x.index for x in shards] == list(range(len(shards)))
+    unassigned = [x for x in shards if x.adapter is None]
+    assert 1 <= len(unassigned) <= 3
+    assert sorted(a for x in unassigned for a in x.addresses) == sorted(
+        a for a, adapter in devices.items() if adapter is None
+    )
+    # The assignment only depends on the address
+    assert plan_shards(devices, shards=3) == shards
+
+
+@pytest.mark.asyncio
+async def test_collector_restarts_workers() -> None:
+    """Test that readings are received and exited workers are restarted."""
+    readings: list[CollectedReading] = []
+    received = asyncio.Event()
+
+    def _callback(reading: CollectedReading) -> None:
+        readings.append(reading)
+        if len(readings) >= 4:
+            received.set()
+
+    collector = ShardedCollector(
+        {"A": "hci0", "B": "hci1"},
+        _callback,
+        worker=_send_and_exit,
+        restart_delay=0.01,
+    )
+    collector.start()
+    try:
+        await asyncio.wait_for(received.wait(), 30)
+    finally:
+        await collector.stop()
+
+    assert {x.address for x in readings} == {"A", "B"}
+    assert {x.shard for x in readings if x.address == "A"} == {0}
+    assert readings[0].sensors == {"co2": 500.0}
+    assert collector.restarts >= 2
+
+
+@pytest.mark.asyncio
+async def test_worker_uses_one_scanner(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that a worker finds its devices and their RSSI with its scanner."""
+    scanners: list[dict[str, Any]] = []
+    updated: list[tuple[BLEDevice, AdvertisementData | None]] = []
+
+    async def _start(self: AirthingsScanner, **kwargs: Any) -> None:
+        scanners.append(kwargs)
+        self.observe(BLEDevice("aa:01", None, None), _advertisement(-80))
+        self.observe(BLEDevice("aa:02", None, None), _advertisement(-60))
+
+    async def _update_device(
+        self: AirthingsBluetoothDeviceData,
+        ble_device: BLEDevice,
+        advertisement_data: AdvertisementData | None = None,
+    ) -> AirthingsDevice:
+        updated.append((ble_device, advertisement_data))
+        return AirthingsDevice(address=ble_device.address, sensors={"co2": 500.0})
+
+    monkeypatch.setattr("airthings_ble.collector.DEFAULT_COLLECT_SCAN_TIMEOUT", 0.05)
+    monkeypatch.setattr(AirthingsScanner, "start", _start)
+    monkeypatch.setattr(AirthingsBluetoothDeviceData, "update_device", _update_device)
+    conn = _FakeConnection(expected=3)
+    spec = ShardSpec(index=0, addresses=("AA:01", "AA:02", "AA:03"), adapter="hci1")
+
+    task = asyncio.ensure_future(_poll_shard(spec, conn, 300, True))  # type: ignore[arg-type]
+    try:
+        await asyncio.wait_for(conn.received.wait(), 30)
+    finally:
+        task.cancel()
+
+    assert scanners == [{"adapter": "hci1"}]
+    # The strongest device is updated first
+    assert [(x.address, y and y.rssi) for x, y in updated] == [
+        ("aa:02", -60),
+        ("aa:01", -80),
+    ]
+    assert {(x.address, x.error) for x in conn.records} == {
+        ("aa:01", None),
+        ("aa:02", None),
+        ("AA:03", "Not found"),
+    }
@@ -0,0 +1,216 @@
+import asyncio
+from typing import Any, Callable
+
+import pytest
+from airthings_ble.adapters import AdapterBalancer, adapter_from_device
+from airthings_ble.connection_pool import ConnectionPool
+from bleak.backends.device import BLEDevice
+
+
+class _FakeClient:
+    def __init__(
+        self, address: str, disconnected_callback: Callable[[Any], None]
+    ) -> None:
+        self.address = address
+        self.is_connected = True
+        self.disconnected_callback = disconnected_callback
+
+    async def disconnect(self) -> None:
+        self.is_connected = False
+
+    def lose_connection(self) -> None:
+        self.is_connected = False
+        self.disconnected_callback(self)
+
+
+class _FakeConnector:
+    def __init__(self) -> None:
+        self.connects: list[str] = []
+        self.adapters: list[str | None] = []
+        self.clients: dict[str, _FakeClient] = {}
+
+    async def __call__(
+        self, ble_device: BLEDevice, disconnected_callback: Callable[[Any], None]
+    ) -> _FakeClient:
+        await asyncio.sleep(0)
+        self.connects.append(ble_device.address)
+        self.adapters.append(adapter_from_device(ble_device))
+        client = _FakeClient(ble_device.address, disconnected_callback)
+        self.clients[ble_device.address] = client
+        return client
+
+
+def _ble_device(address: str) -> BLEDevice:
+    return BLEDevice(address=address, name=None, details=None)
+
+
+def _no_callback(client: Any) -> None:
+    pass
+
+
+async def _poll(pool: ConnectionPool, address: str, keep: bool = True) -> Any:
+    client = await pool.acquire(_ble_device(address), _no_callback)
+    await pool.release(client, keep=keep)
+    return client
+
+
+@pytest.mark.asyncio
+async def test_connections_are_reused() -> None:
+    """Test that a pooled connection is reused."""
+    connector = _FakeConnector()
+    pool = ConnectionPool(max_connections=2, connector=connector)
+
+    first = await _poll(pool, "A")
+    second = await _poll(pool, "A")
+
+    assert first is second
+    assert first.is_connected
+    assert connector.connects == ["A"]
+    assert pool.stats.hits == 1
+    assert pool.stats.misses == 1
+    assert pool.stats.hit_rate == 0.5
+
+
+@pytest.mark.asyncio
+async def test_least_recently_used_is_evicted() -> None:
+    """Test that the least recently used connection makes room."""
+    connector = _FakeConnector()
+    pool = ConnectionPool(max_connections=2, connector=connector)
+
+    await _poll(pool, "A")
+    await _poll(pool, "B")
+    await _poll(pool, "A")
+    await _poll(pool, "C")
+
+    assert "A" in pool
+    assert "B" not in pool
+    assert "C" in pool
+    assert not connector.clients["B"].is_connected
+    assert pool.stats.evictions == 1
+
+    await pool.close()
+    assert len(pool) == 0
+    assert not connector.clients["A"].is_connected
+
+
+@pytest.mark.asyncio
+async def test_failed_update_is_not_kept() -> None:
+    """Test that a connection released after an error is closed."""
+    connector = _FakeConnector()
+    pool = ConnectionPool(max_connections=2, connector=connector)
+
+    client = await _poll(pool, "A", keep=False)
+
+    assert not client.is_connected
+    assert "A" not in pool
+
+
+@pytest.mark.asyncio
+async def test_disconnect_is_forwarded() -> None:
+    """Test that a lost connection is reported to the user and dropped."""
+    connector = _FakeConnector()
+    pool = ConnectionPool(max_connections=2, connector=connector)
+    disconnects: list[Any] = []
+
+    client = await pool.acquire(_ble_device("A"), disconnects.append)
+    client.lose_connection()
+    assert disconnects == [client]
+    await pool.release(client)
+    assert "A" not in pool
+
+    # Idle connections are dropped right away
+    client = await _poll(pool, "A")
+    client.lose_connection()
+    assert "A" not in pool
+    assert pool.stats.disconnects == 2
+
+
+@pytest.mark.asyncio
+async def test_waits_for_free_slot() -> None:
+    """Test that acquiring waits while all connections are in use."""
+    connector = _FakeConnector()
+    pool = ConnectionPool(max_connections=1, connector=connector)
+
+    client = await pool.acquire(_ble_device("A"), _no_callback)
+    waiting = asyncio.ensure_future(pool.acquire(_ble_device("B"), _no_callback))
+    await asyncio.sleep(0.01)
+    assert not waiting.done()
+
+    await pool.release(client)
+    other = await waiting
+    assert other.address == "B"
+    assert not client.is_connected
+
+
+@pytest.mark.asyncio
+async def test_failed_connect_frees_slot() -> None:
+    """Test that a failed connection attempt does not take a slot."""
+
+    async def _fail(ble_device: BLEDevice, callback: Any) -> Any:
+        raise TimeoutError
+
+    pool = ConnectionPool(max_connections=1, connector=_fail)
+    with pytest.raises(TimeoutError):
+        await pool.acquire(_ble_device("A"), _no_callback)
+    assert len(pool) == 0
+
+
+def _seen_by(adapter: str, address: str) -> BLEDevice:
+    return BLEDevice(
+        address=address,
+        name=None,
+        details={"path": f"/org/bluez/{adapter}/dev_{address.replace(':', '_')}"},
+    )
+
+
+@pytest.mark.asyncio
+async def test_pooled_connections_hold_adapter_slots() -> None:
+    """Test that idle pooled connections count against the adapter limit."""
+    connector = _FakeConnector()
+    pool = ConnectionPool(max_connections=5, connector=connector)
+    balancer = AdapterBalancer(max_connections=1)
+    balancer.observe(_seen_by("hci0", "A"), rssi=-60)
+    balancer.observe(_seen_by("hci0", "B"), rssi=-60)
+
+    client = await pool.acquire(_seen_by("hci0", "A"), _no_callback, balancer)
+    waiting = asyncio.ensure_future(
+        pool.acquire(_seen_by("hci0", "B"), _no_callback, balancer)
+    )
+    await asyncio.sleep(0.01)
+    assert not waiting.done()
+
+    await pool.release(client)
+    assert balancer.adapters["hci0"].in_flight == 1
+    other = await waiting
+    # The idle connection of A was closed to free the slot
+    assert not client.is_connected
+    assert "A" not in pool
+    assert balancer.adapters["hci0"].in_flight == 1
+
+    await pool.release(other)
+    await pool.close()
+    assert balancer.adapters["hci0"].in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_pooled_connection_moves_to_better_adapter() -> None:
+    """Test that a pool hit follows the adapter chosen by the balancer."""
+    connector = _FakeConnector()
+    pool = ConnectionPool(max_connections=2, connector=connector)
+    balancer = AdapterBalancer()
+    balancer.observe(_seen_by("hci0", "A"), rssi=-80)
+
+    first = await pool.acquire(_seen_by("hci0", "A"), _no_callback, balancer)
+    await pool.release(first)
+    second = await pool.acquire(_seen_by("hci0", "A"), _no_callback, balancer)
+    await pool.release(second)
+    assert first is second
+
+    balancer.observe(_seen_by("hci1", "A"), rssi=-50)
+    third = await pool.acquire(_seen_by("hci0", "A"), _no_callback, balancer)
+
+    assert connector.adapters == ["hci0", "hci1"]
+    assert third is not first
+    assert not first.is_connected
+    assert balancer.adapters["hci0"].in_flight == 0
+    assert balancer.adapters["hci1"].in_flight == 1
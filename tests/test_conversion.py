@@ -0,0 +1,70 @@
+import math
+
+import pytest
+from airthings_ble import conversion
+from airthings_ble.conversion import (
+    BATTERY_TWO_CELLS,
+    BQ_TO_PCI,
+    CENTIKELVIN_TO_CELSIUS,
+    PiecewiseLinear,
+    StepClassifier,
+)
+from airthings_ble.device_type import AirthingsDeviceType
+from airthings_ble.radon_level import DEFAULT_RADON_CLASSIFIER
+
+
+@pytest.fixture(params=["numpy", "python"])
+def backend(request: pytest.FixtureRequest, monkeypatch: pytest.MonkeyPatch) -> str:
+    """Run the test with and without NumPy."""
+    if request.param == "numpy":
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(conversion, "np", None)
+    return str(request.param)
+
+
+def test_piecewise_linear() -> None:
+    """Test interpolation and clamping."""
+    curve = PiecewiseLinear([(10, 100), (0, 0), (20, 100)])
+    assert curve(-5) == 0
+    assert curve(0) == 0
+    assert curve(2.5) == 25
+    assert curve(10) == 100
+    assert curve(15) == 100
+    assert curve(25) == 100
+
+    with pytest.raises(ValueError):
+        PiecewiseLinear([(0, 0)])
+
+
+def test_conversions_match_scalar_values(backend: str) -> None:
+    """Test that the sequence conversions give the same results as single values."""
+    voltages = [2.0, 2.1, 2.15, 2.45, 2.6, 2.75, 3.0, 3.3]
+    assert list(BATTERY_TWO_CELLS.apply(voltages)) == pytest.approx(
+        [BATTERY_TWO_CELLS(x) for x in voltages]
+    )
+    percentages = [
+        AirthingsDeviceType.WAVE_PLUS.battery_percentage(x) for x in voltages
+    ]
+    assert percentages == [0, 0, 2, 24, 53, 74, 100, 100]
+
+    raw_temperatures = [29424, 29655, 27315]
+    assert list(CENTIKELVIN_TO_CELSIUS.apply(raw_temperatures)) == [21.09, 23.4, 0.0]
+    assert list(BQ_TO_PCI.apply([0, 100, 200])) == pytest.approx([0, 2.7, 5.4])
+
+
+def test_step_classifier(backend: str) -> None:
+    """Test classification of single values and sequences."""
+    values = [-10, 0, 99.9, 100, 149, 150, 1000, math.nan]
+    expected = ["unknown", "good", "good", "fair", "fair", "poor", "poor", "unknown"]
+
+    assert [DEFAULT_RADON_CLASSIFIER(x) for x in values] == expected
+    assert list(DEFAULT_RADON_CLASSIFIER.apply(values)) == expected
+
+
+def test_step_classifier_invalid() -> None:
+    """Test invalid classifier definitions."""
+    with pytest.raises(ValueError):
+        StepClassifier(bounds=[0, 100], labels=["good"], below_label="unknown")
+    with pytest.raises(ValueError):
+        StepClassifier(bounds=[100, 0], labels=["good", "fair"], below_label="unknown")
@@ -0,0 +1,57 @@
+from airthings_ble.device_type import AirthingsDeviceType
+from airthings_ble.line_protocol import BatchEncoder
+from airthings_ble.parser import AirthingsDevice
+
+
+def _device() -> AirthingsDevice:
+    return AirthingsDevice(
+        address="AA:BB",
+        name="Living room, east",
+        model=AirthingsDeviceType.WAVE_PLUS,
+        sensors={
+            "co2": 800,
+            "temperature": 21.5,
+            "radon_1day_level": 'very "low"',
+            "voc": None,
+            "humidity": float("nan"),
+        },
+        sensor_timestamps={"co2": 1700000000.5, "temperature": 1700000001.25},
+    )
+
+
+def test_line_protocol() -> None:
+    """Test escaping and formatting readings as line protocol."""
+    encoder = BatchEncoder(tags={"site": "home office"})
+    assert encoder.line_protocol([_device(), AirthingsDevice(address="CC")]) == (
+        b"airthings,address=AA:BB,model=WAVE_PLUS,name=Living\\ room\\,\\ east,"
+        b"site=home\\ office co2=800.0,temperature=21.5,"
+        b'radon_1day_level="very \\"low\\"" 1700000001250000000\n'
+    )
+    first = encoder.line_protocol([_device()], timestamp=10)
+    assert first.endswith(b" 10000000000\n")
+    out = bytearray(b"existing\n")
+    encoder.write_line_protocol([_device()], out, timestamp=10)
+    assert out == b"existing\n" + first
+
+    # A newline would end the line
+    device = AirthingsDevice(address="DD", name="Hall\nway", sensors={"mode": "a\nb"})
+    assert encoder.line_protocol([device], timestamp=1) == (
+        b"airthings,address=DD,model=UNKNOWN,name=Hall\\nway,site=home\\ office"
+        b' mode="a\\nb" 1000000000\n'
+    )
+
+
+def test_openmetrics() -> None:
+    """Test formatting readings as OpenMetrics gauges."""
+    encoder = BatchEncoder(metric_prefix="air_")
+    other = AirthingsDevice(address="CC", sensors={"co2": 1000.0})
+    assert encoder.openmetrics([_device(), other], timestamp=5) == (
+        b"# TYPE air_co2 gauge\n"
+        b'air_co2{address="AA:BB",model="WAVE_PLUS",name="Living room, east"}'
+        b" 800.0 5\n"
+        b'air_co2{address="CC",model="UNKNOWN"} 1000.0 5\n'
+        b"# TYPE air_temperature gauge\n"
+        b'air_temperature{address="AA:BB",model="WAVE_PLUS",name="Living room, east"}'
+        b" 21.5 5\n"
+        b"# EOF\n"
+    )
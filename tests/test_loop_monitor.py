@@ -0,0 +1,76 @@
+import asyncio
+import logging
+import time
+
+import pytest
+from airthings_ble.command_decode import NotificationReceiver
+from airthings_ble.loop_monitor import (
+    PHASE_DECODE,
+    PHASE_NOTIFY,
+    LoopMonitor,
+    loop_phase,
+)
+from airthings_ble.metrics import MetricsRegistry
+
+
+async def _wait_for_tick(monitor: LoopMonitor, count: int) -> None:
+    while monitor.lag.count < count:
+        await asyncio.sleep(0.01)
+
+
+@pytest.mark.asyncio
+async def test_stall_attributed_to_phase(caplog: pytest.LogCaptureFixture) -> None:
+    """Test that a blocking phase is blamed for the stall it caused."""
+    registry = MetricsRegistry()
+    monitor = LoopMonitor(registry, interval=0.01, threshold=0.05)
+    monitor.start()
+    try:
+        await _wait_for_tick(monitor, 1)
+        with caplog.at_level(logging.WARNING), loop_phase(PHASE_DECODE):
+            time.sleep(0.2)
+        await _wait_for_tick(monitor, monitor.lag.count + 1)
+    finally:
+        await monitor.stop()
+
+    assert monitor.stalls.labels(PHASE_DECODE).value == 1
+    assert monitor.max_lag >= 0.15
+    assert monitor.phase_durations.labels(PHASE_DECODE).count == 1
+    assert "in decode" in caplog.text
+    assert 'airthings_event_loop_stalls_total{phase="decode"} 1' in registry.render()
+
+
+@pytest.mark.asyncio
+async def test_stall_outside_library() -> None:
+    """Test that stalls without a slow library phase count as other."""
+    monitor = LoopMonitor(interval=0.01, threshold=0.05)
+    monitor.start()
+    try:
+        await _wait_for_tick(monitor, 1)
+        with loop_phase(PHASE_NOTIFY):
+            pass
+        time.sleep(0.2)
+        await _wait_for_tick(monitor, monitor.lag.count + 1)
+    finally:
+        await monitor.stop()
+
+    assert monitor.stalls.labels("other").value == 1
+    assert monitor.stalls.labels(PHASE_NOTIFY).value == 0
+
+
+@pytest.mark.asyncio
+async def test_phases_without_monitor() -> None:
+    """Test that phases are not recorded unless a monitor runs."""
+    monitor = LoopMonitor(interval=0.01)
+    receiver = NotificationReceiver(2)
+    receiver(None, bytearray(b"\x01\x02"))
+    assert monitor.phase_durations.children == {}
+
+    monitor.start()
+    try:
+        with pytest.raises(RuntimeError):
+            LoopMonitor().start()
+        NotificationReceiver(2)(None, bytearray(b"\x01\x02"))
+    finally:
+        await monitor.stop()
+    assert monitor.phase_durations.labels(PHASE_NOTIFY).count == 1
+    assert not monitor.running
@@ -0,0 +1,134 @@
+import asyncio
+import logging
+import math
+
+import pytest
+from airthings_ble import AirthingsBluetoothDeviceData
+from airthings_ble.metrics import (
+    Histogram,
+    MetricsRegistry,
+    UpdateMetrics,
+    _format_value,
+    log_linear_buckets,
+    serve_metrics,
+)
+from airthings_ble.parser import AirthingsDevice, DisconnectedError
+from bleak.backends.device import BLEDevice
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def test_log_linear_buckets() -> None:
+    """Test that the bucket width grows with the value."""
+    assert log_linear_buckets(1, 4, 2) == (1.0, 1.5, 2.0, 3.0, 4.0)
+
+
+def test_histogram_quantiles() -> None:
+    """Test estimating quantiles from the buckets."""
+    histogram = Histogram(bounds=(1, 2, 4, 8))
+    assert math.isnan(histogram.quantile(0.5))
+    for value in (0.5, 1.5, 1.5, 3, 3, 3, 3, 3, 6, 20):
+        histogram.observe(value)
+
+    assert histogram.counts == [1, 2, 5, 1, 1]
+    assert histogram.count == 10
+    assert histogram.total == pytest.approx(44.5)
+    assert histogram.quantile(0.5) == pytest.approx(2.8)
+    assert histogram.quantile(0.9) == pytest.approx(8)
+    assert histogram.quantile(0.99) == 8
+
+
+def test_render_openmetrics() -> None:
+    """Test the OpenMetrics text format."""
+    registry = MetricsRegistry()
+    counter = registry.counter("requests", "Handled requests.", ("path",))
+    counter.labels('/a"b').inc()
+    counter.labels('/a"b').inc(2)
+    histogram = registry.histogram("latency_seconds", "Latency.", (), (0.5, 1))
+    histogram.labels().observe(0.7)
+
+    assert registry.render() == (
+        "# TYPE requests counter\n"
+        "# HELP requests Handled requests.\n"
+        'requests_total{path="/a\\"b"} 3\n'
+        "# TYPE latency_seconds histogram\n"
+        "# HELP latency_seconds Latency.\n"
+        'latency_seconds_bucket{le="0.5"} 0\n'
+        'latency_seconds_bucket{le="1"} 1\n'
+        'latency_seconds_bucket{le="+Inf"} 1\n'
+        "latency_seconds_count 1\n"
+        "latency_seconds_sum 0.7\n"
+        "# EOF\n"
+    )
+    assert registry.counter("requests", "Ignored.", ("path",)) is counter
+    with pytest.raises(ValueError):
+        registry.histogram("requests", "Not a histogram.")
+    with pytest.raises(ValueError):
+        counter.labels()
+
+
+def test_format_non_finite_values() -> None:
+    """Test that values that are not finite are rendered as OpenMetrics expects."""
+    assert _format_value(float("nan")) == "NaN"
+    assert _format_value(math.inf) == "+Inf"
+    assert _format_value(-math.inf) == "-Inf"
+    assert _format_value(3.0) == "3"
+    assert _format_value(0.25) == "0.25"
+
+
+@pytest.mark.asyncio
+async def test_serve_metrics() -> None:
+    """Test scraping the metrics over HTTP."""
+    registry = MetricsRegistry()
+    registry.counter("scrapes", "Scrapes.").labels().inc()
+    server = await serve_metrics(registry, port=0)
+    port = server.sockets[0].getsockname()[1]
+    try:
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"GET /metrics HTTP/1.1\r\nHost: localhost\r\n\r\n")
+        response = await reader.read()
+        writer.close()
+    finally:
+        server.close()
+        await server.wait_closed()
+
+    head, body = response.split(b"\r\n\r\n", 1)
+    assert head.startswith(b"HTTP/1.1 200 OK")
+    assert b"application/openmetrics-text" in head
+    assert body.decode() == registry.render()
+
+
+@pytest.mark.asyncio
+async def test_update_metrics(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that update_device records durations, retries and disconnects."""
+    metrics = UpdateMetrics()
+    data = AirthingsBluetoothDeviceData(logger=_LOGGER, max_attempts=2, metrics=metrics)
+    attempts = 0
+
+    async def _update_device(ble_device: BLEDevice) -> AirthingsDevice:
+        nonlocal attempts
+        attempts += 1
+        if attempts % 2:
+            raise DisconnectedError("Disconnected")
+        return AirthingsDevice(address=ble_device.address, sensors={"co2": 500.0})
+
+    monkeypatch.setattr(data, "_update_device", _update_device)
+    ble_device = BLEDevice(address="A", name=None, details=None)
+    await data.update_device(ble_device)
+
+    labels = ("UNKNOWN", "A")
+    assert metrics.disconnects.labels(*labels).value == 1
+    assert metrics.retries.labels(*labels).value == 1
+    assert metrics.updates.labels(*labels, "ok").value == 1
+    assert metrics.update_duration.labels(*labels).count == 1
+    quantiles = metrics.latency_quantiles(*labels)
+    assert set(quantiles) == {0.5, 0.95, 0.99}
+
+    data.set_max_attempts(1)
+    with pytest.raises(DisconnectedError):
+        await data.update_device(ble_device)
+    assert metrics.updates.labels(*labels, "error").value == 1
+    assert metrics.disconnects.labels(*labels).value == 2
+    assert 'airthings_updates_total{model="UNKNOWN",address="A",result="error"} 1' in (
+        metrics.registry.render()
+    )
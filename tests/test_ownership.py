@@ -0,0 +1,116 @@
+from pathlib import Path
+
+from airthings_ble.ownership import (
+    Lease,
+    OwnershipCoordinator,
+    SQLiteOwnershipBackend,
+)
+from bleak.backends.device import BLEDevice
+from bleak.backends.scanner import AdvertisementData
+
+
+def _gateways(
+    path: Path,
+) -> tuple[OwnershipCoordinator, OwnershipCoordinator, SQLiteOwnershipBackend]:
+    # Each gateway opens the database, like separate processes would
+    backend = SQLiteOwnershipBackend(str(path / "ownership.db"))
+    first = OwnershipCoordinator(
+        "first", SQLiteOwnershipBackend(backend.path), lease_ttl=100, rssi_max_age=60
+    )
+    second = OwnershipCoordinator(
+        "second", SQLiteOwnershipBackend(backend.path), lease_ttl=100, rssi_max_age=60
+    )
+    return first, second, backend
+
+
+def test_best_gateway_owns_device(tmp_path: Path) -> None:
+    """Test that only the gateway with the best link polls a device."""
+    first, second, backend = _gateways(tmp_path)
+    first.observe("A", -80, now=0)
+    second.observe("A", -60, now=0)
+
+    assert not first.owns("A", now=1)
+    assert second.owns("A", now=1)
+    assert not first.owns("A", now=2)
+    assert backend.lease("A", now=2) == Lease("A", "second", 101)
+    assert second.owned == frozenset({"A"})
+
+
+def test_hysteresis_keeps_owner(tmp_path: Path) -> None:
+    """Test that a slightly better link does not move the device."""
+    first, second, _ = _gateways(tmp_path)
+    first.observe("A", -70, now=0)
+    assert first.owns("A", now=0)
+
+    second.observe("A", -66, now=1)
+    assert not second.owns("A", now=1)
+    assert first.owns("A", now=2)
+
+    second.observe("A", -60, now=3)
+    assert second.owns("A", now=3)
+    assert not first.owns("A", now=4)
+
+
+def test_failover_when_owner_is_silent(tmp_path: Path) -> None:
+    """Test that another gateway takes over when the owner stops reporting."""
+    first, second, _ = _gateways(tmp_path)
+    first.observe("A", -50, now=0)
+    second.observe("A", -90, now=0)
+    assert first.owns("A", now=0)
+    assert not second.owns("A", now=10)
+
+    # The first gateway went silent, its observation is too old
+    second.observe("A", -90, now=70)
+    assert second.owns("A", now=70)
+    assert not first.owns("A", now=71)
+
+
+def test_release(tmp_path: Path) -> None:
+    """Test that released devices can be taken right away."""
+    first, second, backend = _gateways(tmp_path)
+    first.observe("A", -50, now=0)
+    first.observe("B", -50, now=0)
+    second.observe("A", -55, now=0)
+    assert first.owns("A", now=0)
+    assert first.owns("B", now=0)
+
+    first.release_all()
+    assert first.owned == frozenset()
+    assert backend.lease("B", now=1) is None
+    assert not second.owns("A", now=1)
+    second.observe("A", -55, now=1)
+    # The first gateway still has the better link, but gave up its lease
+    assert backend.acquire("A", "second", 200, now=1) == Lease("A", "second", 200)
+    assert second.owns("A", now=2)
+
+
+def test_acquire_is_exclusive() -> None:
+    """Test that a lease held by another gateway is not taken."""
+    backend = SQLiteOwnershipBackend(":memory:")
+    assert backend.acquire("A", "first", 10, now=0) == Lease("A", "first", 10)
+    assert backend.acquire("A", "second", 20, now=5) == Lease("A", "first", 10)
+    assert backend.acquire("A", "second", 20, now=5, replace="first") == Lease(
+        "A", "second", 20
+    )
+    assert backend.acquire("A", "first", 30, now=25) == Lease("A", "first", 30)
+    backend.close()
+
+
+def test_observe_advertisement() -> None:
+    """Test reporting from a scanner detection callback."""
+    backend = SQLiteOwnershipBackend(":memory:")
+    coordinator = OwnershipCoordinator("gw", backend)
+    coordinator.observe_advertisement(
+        BLEDevice(address="A", name=None, details=None),
+        AdvertisementData(
+            local_name=None,
+            manufacturer_data={},
+            service_data={},
+            service_uuids=[],
+            tx_power=None,
+            rssi=-42,
+            platform_data=(),
+        ),
+    )
+    assert backend.observations("A", since=0) == {"gw": -42}
+    assert coordinator.owns("A")
@@ -1,4 +1,9 @@
-from airthings_ble.radon_level import get_radon_level
+import pytest
+from airthings_ble.radon_level import (
+    AirthingsRadonLevel,
+    get_radon_level,
+    radon_classifier,
+)
 
 
 def test_radon_level() -> None:
@@ -14,3 +19,28 @@ def test_radon_level() -> None:
     assert get_radon_level(1000) == "poor"
 
     assert get_radon_level(-10) == "unknown"
+
+
+def test_custom_radon_levels() -> None:
+    """Test radon levels with custom thresholds."""
+    classifier = radon_classifier(
+        [
+            AirthingsRadonLevel(None, 50, "low"),
+            AirthingsRadonLevel(50, 300, "elevated"),
+            AirthingsRadonLevel(300, 1000, "high"),
+        ]
+    )
+
+    assert classifier(-10) == "low"
+    assert classifier(49) == "low"
+    assert classifier(50) == "elevated"
+    assert classifier(300) == "high"
+    assert classifier(1000) == "unknown"
+
+    with pytest.raises(ValueError):
+        radon_classifier(
+            [
+                AirthingsRadonLevel(0, 50, "low"),
+                AirthingsRadonLevel(60, None, "high"),
+            ]
+        )
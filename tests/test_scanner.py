@@ -0,0 +1,106 @@
+import pytest
+from airthings_ble.const import MFCT_ID
+from airthings_ble.device_type import AirthingsDeviceType
+from airthings_ble.scanner import AirthingsScanner, is_airthings_advertisement
+from bleak.backends.device import BLEDevice
+from bleak.backends.scanner import AdvertisementData
+
+
+def _advertisement(
+    rssi: int,
+    serial_number: int | None = None,
+    service_uuids: list[str] | None = None,
+) -> AdvertisementData:
+    manufacturer_data = (
+        {} if serial_number is None else {MFCT_ID: serial_number.to_bytes(4, "little")}
+    )
+    return AdvertisementData(
+        local_name=None,
+        manufacturer_data=manufacturer_data,
+        service_data={},
+        service_uuids=service_uuids or [],
+        tx_power=None,
+        rssi=rssi,
+        platform_data=(),
+    )
+
+
+def _ble_device(address: str) -> BLEDevice:
+    return BLEDevice(address=address, name=None, details=None)
+
+
+def test_is_airthings_advertisement() -> None:
+    """Test filtering by manufacturer ID and service UUID."""
+    assert is_airthings_advertisement(_advertisement(-60, 2930123456))
+    assert is_airthings_advertisement(
+        _advertisement(-60, service_uuids=["b42e1c08-ade7-11e4-89d3-123b93f75cba"])
+    )
+    assert not is_airthings_advertisement(
+        _advertisement(-60, service_uuids=["0000fe9f-0000-1000-8000-00805f9b34fb"])
+    )
+
+
+def test_devices_are_identified_and_smoothed() -> None:
+    """Test deduplicating advertisements and smoothing the RSSI."""
+    scanner = AirthingsScanner(rssi_alpha=0.5, rssi_max_age=60)
+    scanner.observe(_ble_device("X"), _advertisement(-40), now=0)
+    # The model is not in every advertisement
+    scanner.observe(
+        _ble_device("A"),
+        _advertisement(-80, service_uuids=["b42e1c08-ade7-11e4-89d3-123b93f75cba"]),
+        now=0,
+    )
+    scanner.observe(_ble_device("A"), _advertisement(-60, 2930123456), now=1)
+    scanner.observe(_ble_device("A"), _advertisement(-60), now=2)
+
+    assert len(scanner) == 1 and "X" not in scanner
+    device = scanner.get("A")
+    assert device is not None
+    assert device.model == AirthingsDeviceType.WAVE_PLUS
+    assert device.identifier == "2930123456"
+    assert device.rssi == pytest.approx(-65)
+    assert (device.last_rssi, device.advertisements) == (-60, 3)
+    assert device.age(now=12) == 10
+
+    # The average starts again after a gap
+    scanner.observe(_ble_device("A"), _advertisement(-90), now=100)
+    assert device.rssi == -90
+
+
+def test_query_by_model_and_age() -> None:
+    """Test querying recent devices of a model, strongest first."""
+    scanner = AirthingsScanner()
+    for address, serial_number, rssi, now in (
+        ("A", 2930000001, -80, 100),
+        ("B", 2930000002, -50, 100),
+        ("C", 2930000003, -40, 10),
+        ("D", 2920000004, -30, 100),
+    ):
+        scanner.observe(_ble_device(address), _advertisement(rssi, serial_number), now)
+
+    assert [
+        x.address
+        for x in scanner.devices(AirthingsDeviceType.WAVE_PLUS, max_age=60, now=110)
+    ] == ["B", "A"]
+    assert [x.address for x in scanner.devices()] == ["D", "C", "B", "A"]
+
+    assert [x.address for x in scanner.prune(max_age=60, now=110)] == ["C"]
+    assert [x.address for x in scanner.devices(AirthingsDeviceType.WAVE_PLUS)] == [
+        "B",
+        "A",
+    ]
+    assert scanner.devices(AirthingsDeviceType.WAVE_RADON) == []
+
+
+def test_listeners_get_airthings_devices() -> None:
+    """Test that listeners are only called for Airthings advertisements."""
+    scanner = AirthingsScanner()
+    seen: list[tuple[str, int]] = []
+    remove = scanner.add_listener(lambda x: seen.append((x.address, x.last_rssi)))
+
+    scanner.observe(_ble_device("A"), _advertisement(-60, 2930123456))
+    scanner.observe(_ble_device("B"), _advertisement(-50))
+    remove()
+    scanner.observe(_ble_device("A"), _advertisement(-55, 2930123456))
+
+    assert seen == [("A", -60)]
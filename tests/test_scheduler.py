@@ -0,0 +1,127 @@
+import logging
+from datetime import datetime
+
+import pytest
+from airthings_ble import AirthingsBluetoothDeviceData
+from airthings_ble.parser import AirthingsDevice
+from airthings_ble.scheduler import MeasurementScheduler
+from bleak.backends.device import BLEDevice
+
+_LOGGER = logging.getLogger(__name__)
+
+ADDRESS = "AA:BB:CC:DD:EE:FF"
+
+
+def _device(value: float, device_time: datetime | None = None) -> AirthingsDevice:
+    return AirthingsDevice(
+        address=ADDRESS, sensors={"co2": value}, device_time=device_time
+    )
+
+
+def _sample(now: float, period: float = 300, phase: float = 100) -> float:
+    """Value of a device that samples every `period` seconds at `phase`."""
+    return float((now - phase) // period)
+
+
+def test_unknown_device_is_polled() -> None:
+    """Test that nothing is skipped before the cycle is known."""
+    scheduler = MeasurementScheduler()
+    assert scheduler.should_poll(ADDRESS, now=0)
+    scheduler.observe(_device(1), timestamp=0)
+    assert scheduler.next_poll(ADDRESS, now=10) is None
+    assert scheduler.should_poll(ADDRESS, now=10)
+
+
+def test_period_and_phase_are_learned() -> None:
+    """Test that polls converge to just after each sample."""
+    scheduler = MeasurementScheduler(default_period=120, margin=5)
+
+    # Poll every minute until the cycle has been learned
+    for now in range(1000, 4000, 60):
+        scheduler.observe(_device(_sample(now)), timestamp=now)
+
+    cycle = scheduler.cycles[ADDRESS]
+    assert cycle.period == pytest.approx(300)
+    assert cycle.sample_before is not None and cycle.sample_after is not None
+    assert cycle.sample_before - cycle.sample_after <= 60
+
+    # Only poll when the scheduler expects a new sample
+    polls = 0
+    changes = 0
+    now = 4000
+    while now < 10000:
+        if scheduler.should_poll(ADDRESS, now=now):
+            previous = scheduler.cycles[ADDRESS].fingerprint
+            scheduler.observe(_device(_sample(now)), timestamp=now)
+            polls += 1
+            changes += scheduler.cycles[ADDRESS].fingerprint != previous
+        now += 1
+
+    assert changes == 20
+    assert polls <= 22
+    # Each sample is picked up shortly after it was taken
+    next_poll = scheduler.next_poll(ADDRESS, now=now)
+    assert next_poll is not None
+    assert 0 < (next_poll - 100) % 300 <= 70
+
+
+def test_late_sample_is_retried() -> None:
+    """Test that an unchanged value leads to a retry soon after."""
+    scheduler = MeasurementScheduler(default_period=300, margin=5)
+    scheduler.observe(_device(1), timestamp=0)
+    scheduler.observe(_device(2), timestamp=10)
+    assert scheduler.next_poll(ADDRESS) == 315
+
+    scheduler.observe(_device(2), timestamp=315)
+    assert scheduler.next_poll(ADDRESS) == 345
+
+
+def test_device_clock_alignment() -> None:
+    """Test that the device clock gives the phase before any change."""
+    scheduler = MeasurementScheduler(default_period=300, margin=10)
+    now = datetime(2024, 1, 1, 12, 2).timestamp()
+    # The device clock is one minute ahead of the host
+    scheduler.observe(_device(1, datetime(2024, 1, 1, 12, 3)), timestamp=now)
+    next_poll = scheduler.next_poll(ADDRESS, now=now)
+    assert next_poll == datetime(2024, 1, 1, 12, 4, 10).timestamp()
+
+
+def test_max_poll_interval() -> None:
+    """Test that polls are not skipped for longer than the maximum interval."""
+    scheduler = MeasurementScheduler(default_period=3600, max_poll_interval=600)
+    scheduler.observe(_device(1), timestamp=0)
+    scheduler.observe(_device(2), timestamp=10)
+    assert scheduler.next_poll(ADDRESS) == 610
+
+
+@pytest.mark.asyncio
+async def test_skipped_poll_returns_last_reading(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Test that update_device does not connect until a sample is expected."""
+    scheduler = MeasurementScheduler()
+    data = AirthingsBluetoothDeviceData(logger=_LOGGER, scheduler=scheduler)
+    values = iter([1.0, 2.0, 3.0])
+    calls: list[str] = []
+
+    async def _update_device(ble_device: BLEDevice) -> AirthingsDevice:
+        calls.append(ble_device.address)
+        return _device(next(values))
+
+    monkeypatch.setattr(data, "_update_device", _update_device)
+    ble_device = BLEDevice(address=ADDRESS, name=None, details=None)
+
+    await data.update_device(ble_device)
+    device = await data.update_device(ble_device)
+    assert len(calls) == 2
+    assert device.sensors == {"co2": 2.0}
+
+    # A new sample was seen, so the next one is not expected for a while
+    device = await data.update_device(ble_device)
+    assert len(calls) == 2
+    assert device.sensors == {"co2": 2.0}
+
+    monkeypatch.setattr(scheduler, "should_poll", lambda *args: True)
+    device = await data.update_device(ble_device)
+    assert len(calls) == 3
+    assert device.sensors == {"co2": 3.0}
@@ -0,0 +1,96 @@
+import multiprocessing
+
+import pytest
+from airthings_ble.parser import AirthingsDevice
+from airthings_ble.shared_table import SharedReading, SharedReadingsTable
+
+
+def _read_in_other_process(name: str, address: str) -> SharedReading | None:
+    table = SharedReadingsTable.attach(name)
+    try:
+        return table.read(address)
+    finally:
+        table.close()
+
+
+def test_write_and_read() -> None:
+    """Test that a reader sees the latest values of each device."""
+    table = SharedReadingsTable.create(sensors=("co2", "temperature"), rows=2)
+    reader = SharedReadingsTable.attach(table.name)
+    try:
+        assert reader.read("A") is None
+        assert reader.sensors == ("co2", "temperature")
+
+        table.write(
+            AirthingsDevice(
+                address="A", sensors={"co2": 800, "connectivity_mode": "BLE"}
+            ),
+            timestamp=10.0,
+        )
+        table.write(
+            AirthingsDevice(address="B", sensors={"temperature": 21.5}),
+            timestamp=11.0,
+        )
+        table.write(
+            AirthingsDevice(address="A", sensors={"co2": 900.0, "temperature": 20}),
+            timestamp=12.0,
+        )
+
+        assert reader.read("A") == SharedReading(
+            address="A", timestamp=12.0, sensors={"co2": 900.0, "temperature": 20.0}
+        )
+        assert "B" in reader
+        assert [x.address for x in reader] == ["A", "B"]
+
+        with pytest.raises(ValueError):
+            table.write(AirthingsDevice(address="C"))
+        with pytest.raises(RuntimeError):
+            reader.write(AirthingsDevice(address="A"))
+    finally:
+        reader.close()
+        table.close()
+
+
+def test_new_row_is_not_read_before_its_first_write() -> None:
+    """Test that a row being added is not read as zero values."""
+    table = SharedReadingsTable.create(sensors=("co2",), rows=2)
+    reader = SharedReadingsTable.attach(table.name)
+    try:
+        table._add_row("A")
+        with pytest.raises(TimeoutError):
+            reader.read("A")
+
+        table.write(AirthingsDevice(address="A"), timestamp=10.0)
+        assert reader.read("A") == SharedReading(
+            address="A", timestamp=10.0, sensors={}
+        )
+    finally:
+        reader.close()
+        table.close()
+
+
+def test_read_from_other_process() -> None:
+    """Test reading the table from another process."""
+    table = SharedReadingsTable.create()
+    try:
+        table.write(AirthingsDevice(address="A", sensors={"co2": 650.0}), 5.0)
+        with multiprocessing.get_context("spawn").Pool(1) as pool:
+            reading = pool.apply(_read_in_other_process, (table.name, "A"))
+        assert reading == SharedReading(
+            address="A", timestamp=5.0, sensors={"co2": 650.0}
+        )
+    finally:
+        table.close()
+
+
+def test_attach_rejects_other_memory() -> None:
+    """Test that unrelated shared memory is not used as a table."""
+    from multiprocessing import shared_memory
+
+    shm = shared_memory.SharedMemory(create=True, size=64)
+    try:
+        with pytest.raises(ValueError):
+            SharedReadingsTable.attach(shm.name)
+    finally:
+        shm.close()
+        shm.unlink()
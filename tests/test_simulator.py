@@ -0,0 +1,97 @@
+import logging
+from typing import Any
+
+import pytest
+from airthings_ble import AirthingsBluetoothDeviceData
+from airthings_ble.admission import ConnectionAdmission
+from airthings_ble.connection_pool import ConnectionPool
+from airthings_ble.const import BATTERY, CO2, RADON_1DAY_AVG, TEMPERATURE, VOC
+from airthings_ble.device_type import AirthingsDeviceType
+from airthings_ble.simulator import (
+    FleetSimulator,
+    SimulatedDevice,
+    run_simulation,
+    simulated_fleet,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    ("model", "expected"),
+    [
+        (AirthingsDeviceType.WAVE_PLUS, {CO2: 600.0, TEMPERATURE: 21.0}),
+        (AirthingsDeviceType.WAVE_MINI, {VOC: 100.0, TEMPERATURE: 21.0}),
+        (AirthingsDeviceType.WAVE_ENHANCE_EU, {CO2: 600, TEMPERATURE: 21.0}),
+        (AirthingsDeviceType.CORENTIUM_HOME_2, {RADON_1DAY_AVG: 50.0}),
+    ],
+)
+async def test_update_simulated_device(
+    model: AirthingsDeviceType, expected: dict[str, float]
+) -> None:
+    """Test that each model is read like a real device, with fragmentation."""
+    device = SimulatedDevice(
+        address="A5:17:00:00:00:01",
+        model=model,
+        serial_number=f"{model.value}000001",
+        connect_latency=0.1,
+        # No drift, so the values can be checked
+        drifting=False,
+    )
+    simulator = FleetSimulator([device], time_scale=0.01, seed=1)
+    data = AirthingsBluetoothDeviceData(
+        _LOGGER, connection_pool=ConnectionPool(connector=simulator.connect)
+    )
+
+    result = await data.update_device(device.ble_device, device.advertisement)
+
+    assert result.model == model
+    assert result.identifier == device.serial_number
+    for sensor, value in expected.items():
+        assert result.sensors[sensor] == pytest.approx(value, abs=0.01)
+    assert result.sensors[BATTERY] is not None
+    assert result.airtime is not None and result.airtime.notifications >= 2
+
+
+@pytest.mark.asyncio
+async def test_run_simulation() -> None:
+    """Test polling a mixed fleet with failures, drops and admission."""
+    devices = simulated_fleet(30, seed=3)
+    simulator = FleetSimulator(devices, time_scale=0.005, seed=3)
+    weak = sum(x.rssi < -90 for x in devices)
+
+    report = await run_simulation(
+        simulator,
+        cycles=2,
+        max_connections=5,
+        admission=ConnectionAdmission(min_rssi=-90),
+    )
+
+    assert report.devices == 30
+    # Weak devices are tried once, and deferred in the second cycle
+    assert report.deferred >= weak
+    assert report.updates + report.failures + report.deferred == 60
+    assert report.updates > 30
+    assert len(report.latencies) == report.updates
+    assert report.latency(0.5) <= report.latency(0.99)
+    assert report.peak_memory is not None and report.peak_memory > 0
+    assert report.throughput > 0
+    assert "devices, 2 cycles" in report.summary()
+
+
+@pytest.mark.asyncio
+async def test_unexpected_errors_are_failures(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Test that an error raised by the library is counted as a failure."""
+
+    async def _update_device(*args: Any) -> None:
+        raise ValueError("Bug")
+
+    monkeypatch.setattr(AirthingsBluetoothDeviceData, "update_device", _update_device)
+    simulator = FleetSimulator(simulated_fleet(3, seed=1), time_scale=0.005)
+
+    report = await run_simulation(simulator, trace_memory=False)
+
+    assert (report.updates, report.failures) == (0, 3)
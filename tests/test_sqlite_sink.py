@@ -0,0 +1,143 @@
+import sqlite3
+from pathlib import Path
+
+import pytest
+from airthings_ble.aggregator import Aggregate
+from airthings_ble.parser import AirthingsDevice
+from airthings_ble.sqlite_sink import SCHEMA_WIDE, Reading, SQLiteSink
+
+
+def _device(address: str, co2: float, **sensors: str | float | None) -> AirthingsDevice:
+    return AirthingsDevice(address=address, sensors={"co2": co2, **sensors})
+
+
+def test_narrow_schema_batches(tmp_path: Path) -> None:
+    """Test that rows are written in batches and can be queried."""
+    path = str(tmp_path / "readings.db")
+    sink = SQLiteSink(path, batch_size=5, flush_interval=3600)
+    sink.add(_device("A", 800, temperature=21.5, radon_1day_level="good"), 100)
+    sink.add(_device("B", 900, voc=None), 100)
+    assert sink.pending == 3
+    reader = SQLiteSink(path)
+    assert list(reader.iter_readings()) == []
+
+    sink.add(_device("A", 820, temperature=21.0), 400)
+    sink.add(_device("A", 840, temperature=20.5), 700)
+    assert sink.pending == 2
+    assert list(reader.iter_readings("A", "co2")) == [
+        Reading("A", 100, "co2", 800),
+        Reading("A", 400, "co2", 820),
+    ]
+    assert {x.sensor for x in reader.iter_readings("A", start=400, end=401)} == {
+        "co2",
+        "temperature",
+    }
+
+    sink.close()
+    assert [x.value for x in reader.iter_readings("A", "co2", start=200)] == [820, 840]
+    assert [x.address for x in reader.iter_readings(sensor="co2", end=101)] == [
+        "A",
+        "B",
+    ]
+    reader.close()
+
+
+def test_downsample(tmp_path: Path) -> None:
+    """Test aggregating the stored values in time buckets."""
+    sink = SQLiteSink(str(tmp_path / "readings.db"), batch_size=1)
+    for timestamp, co2 in ((0, 400), (30.5, 600), (60, 1000), (150, 700)):
+        sink.add(_device("A", co2), timestamp)
+
+    assert sink.downsample("A", "co2", 60) == [
+        (0, Aggregate(400, 600, 500, 2)),
+        (60, Aggregate(1000, 1000, 1000, 1)),
+        (120, Aggregate(700, 700, 700, 1)),
+    ]
+    assert sink.downsample("A", "co2", 60, start=60, end=120) == [
+        (60, Aggregate(1000, 1000, 1000, 1)),
+    ]
+    sink.close()
+
+
+def test_wide_schema(tmp_path: Path) -> None:
+    """Test a row per reading with a column per sensor."""
+    path = str(tmp_path / "readings.db")
+    sink = SQLiteSink(path, schema=SCHEMA_WIDE, sensors=("co2", "humidity"))
+    tables = sqlite3.connect(path).execute(
+        "SELECT name FROM sqlite_master WHERE type IN ('table', 'index')"
+        " AND name NOT LIKE 'sqlite_%'"
+    )
+    assert sorted(x for (x,) in tables) == [
+        "devices",
+        "readings_wide",
+        "readings_wide_ts",
+    ]
+    sink.add(_device("A", 800, humidity=40), 10)
+    sink.add(_device("A", 810), 20)
+    sink.add(AirthingsDevice(address="A", sensors={"temperature": 20}), 30)
+    assert sink.pending == 2
+    sink.flush()
+
+    assert list(sink.iter_readings("A", "humidity")) == [
+        Reading("A", 10, "humidity", 40)
+    ]
+    assert sink.downsample("A", "co2", 100) == [(0, Aggregate(800, 810, 805, 2))]
+    with pytest.raises(ValueError):
+        list(sink.iter_readings("A"))
+    sink.close()
+
+    # Columns are added when more sensors are stored later
+    sink = SQLiteSink(path, schema=SCHEMA_WIDE, sensors=("co2", "voc"))
+    sink.add(_device("A", 820, voc=100), 40)
+    sink.close()
+    with pytest.raises(ValueError):
+        SQLiteSink(path, schema=SCHEMA_WIDE, sensors=('co2"; DROP',))
+
+
+def test_locked_database_keeps_rows(tmp_path: Path) -> None:
+    """Test that rows are kept when the database stays locked."""
+    path = str(tmp_path / "readings.db")
+    sink = SQLiteSink(path, batch_size=100, timeout=0)
+    sink.add(_device("A", 800), 10)
+    other = sqlite3.connect(path, isolation_level=None)
+    other.execute("BEGIN IMMEDIATE")
+
+    with pytest.raises(sqlite3.OperationalError):
+        sink.flush()
+    assert sink.pending == 1
+
+    other.execute("ROLLBACK")
+    other.close()
+    sink.flush()
+    assert sink.pending == 0
+    assert list(sink.iter_readings("A", "co2")) == [Reading("A", 10, "co2", 800)]
+    sink.close()
+
+
+def test_failed_commit_keeps_rows(tmp_path: Path) -> None:
+    """Test that a failed commit is rolled back, with the new ids."""
+    path = str(tmp_path / "readings.db")
+    sink = SQLiteSink(path, batch_size=100)
+    sink.add(_device("A", 800), 10)
+    # A deferred foreign key makes the COMMIT itself fail
+    sink._connection.executescript("""
+        PRAGMA foreign_keys = ON;
+        CREATE TABLE parents (id INTEGER PRIMARY KEY);
+        CREATE TABLE orphans (
+            parent INTEGER REFERENCES parents (id) DEFERRABLE INITIALLY DEFERRED
+        );
+        CREATE TRIGGER fail_commit AFTER INSERT ON readings
+        BEGIN INSERT INTO orphans VALUES (1); END;
+        """)
+
+    with pytest.raises(sqlite3.IntegrityError):
+        sink.flush()
+    assert sink.pending == 1
+    reader = sqlite3.connect(path)
+    assert reader.execute("SELECT count(*) FROM devices").fetchone() == (0,)
+    assert reader.execute("SELECT count(*) FROM sensors").fetchone() == (0,)
+
+    sink._connection.execute("DROP TRIGGER fail_commit")
+    sink.flush()
+    assert list(sink.iter_readings("A", "co2")) == [Reading("A", 10, "co2", 800)]
+    sink.close()
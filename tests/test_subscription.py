@@ -0,0 +1,225 @@
+import asyncio
+import logging
+import struct
+from typing import Any, Callable
+
+import cbor2
+import pytest
+from airthings_ble import AirthingsBluetoothDeviceData, AirthingsDeviceType
+from airthings_ble.const import (
+    CHAR_UUID_WAVE_2_DATA,
+    COMMAND_UUID_ATOM,
+    COMMAND_UUID_ATOM_NOTIFY,
+    COMMAND_UUID_WAVE_2,
+)
+from airthings_ble.parser import AirthingsDevice
+from airthings_ble.subscription import AtomFrames, SizedFrames
+from bleak.backends.device import BLEDevice
+
+_LOGGER = logging.getLogger(__name__)
+
+WAVE_2_DATA = bytes.fromhex("013860f009001100a709ffffffffffff0000ffff")
+
+
+class _FakeCharacteristic:
+    def __init__(self, uuid: object, properties: list[str]) -> None:
+        self.uuid = str(uuid)
+        self.properties = properties
+
+
+class _FakeService:
+    def __init__(self, characteristics: list[_FakeCharacteristic]) -> None:
+        self.characteristics = characteristics
+
+    def get_characteristic(self, uuid: object) -> _FakeCharacteristic | None:
+        return next((x for x in self.characteristics if x.uuid == str(uuid)), None)
+
+
+class _FakeClient:
+    address = "AA:BB:CC:DD:EE:FF"
+
+    def __init__(self, services: list[_FakeService]) -> None:
+        self.services = services
+        self.handlers: dict[str, Callable[[Any, bytearray], None]] = {}
+        self.writes: list[tuple[str, bytes]] = []
+        self.stopped: list[str] = []
+
+    async def start_notify(
+        self,
+        characteristic: _FakeCharacteristic,
+        callback: Callable[[Any, bytearray], None],
+    ) -> None:
+        self.handlers[characteristic.uuid] = callback
+
+    async def stop_notify(self, characteristic: _FakeCharacteristic) -> None:
+        self.stopped.append(characteristic.uuid)
+
+    async def write_gatt_char(
+        self, characteristic: _FakeCharacteristic, data: bytearray
+    ) -> None:
+        self.writes.append((characteristic.uuid, bytes(data)))
+
+    def notify(self, uuid: object, data: bytes) -> None:
+        self.handlers[str(uuid)](None, bytearray(data))
+
+
+async def _subscribe(
+    monkeypatch: pytest.MonkeyPatch,
+    client: _FakeClient,
+    model: AirthingsDeviceType,
+    updates: list[dict[str, Any]],
+) -> tuple[AirthingsBluetoothDeviceData, Any, list[bool]]:
+    data = AirthingsBluetoothDeviceData(logger=_LOGGER)
+    released: list[bool] = []
+
+    async def _establish_connection(
+        ble_device: BLEDevice, disconnect_future: asyncio.Future[bool]
+    ) -> _FakeClient:
+        return client
+
+    async def _release_connection(client: object, keep: bool) -> None:
+        released.append(keep)
+
+    async def _get_device_characteristics(
+        client: object, device: AirthingsDevice
+    ) -> None:
+        device.model = model
+
+    async def _get_service_characteristics(client: object, device: object) -> None:
+        pass
+
+    monkeypatch.setattr(data, "_establish_connection", _establish_connection)
+    monkeypatch.setattr(data, "_release_connection", _release_connection)
+    monkeypatch.setattr(
+        data, "_get_device_characteristics", _get_device_characteristics
+    )
+    monkeypatch.setattr(
+        data, "_get_service_characteristics", _get_service_characteristics
+    )
+
+    subscription = await data.subscribe(
+        BLEDevice(address=client.address, name=None, details=None),
+        lambda device: updates.append(dict(device.sensors)),
+    )
+    return data, subscription, released
+
+
+def test_sized_frames() -> None:
+    """Test joining fragments of a known size."""
+    frames = SizedFrames(4)
+    assert frames.feed(b"\x01\x02") is None
+    assert frames.feed(b"\x03\x04") == b"\x01\x02\x03\x04"
+    assert frames.feed(b"\x05") is None
+
+
+def test_atom_frames() -> None:
+    """Test that a new Atom frame starts after a complete one."""
+    response = bytes.fromhex("1001000345A1B2") + cbor2.dumps([{0: "x", 2: 1}])
+    frames = AtomFrames()
+    assert frames.feed(response[:5]) is None
+    assert frames.feed(response[5:]) == response
+    assert frames.feed(response) == response
+
+
+@pytest.mark.asyncio
+async def test_wave_notifications(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that sensor and command notifications update the device."""
+    client = _FakeClient(
+        [
+            _FakeService(
+                [
+                    _FakeCharacteristic(CHAR_UUID_WAVE_2_DATA, ["read", "notify"]),
+                    _FakeCharacteristic(COMMAND_UUID_WAVE_2, ["write", "indicate"]),
+                ]
+            )
+        ]
+    )
+    updates: list[dict[str, Any]] = []
+    data, subscription, released = await _subscribe(
+        monkeypatch, client, AirthingsDeviceType.WAVE_RADON, updates
+    )
+    # The initial reading is passed to the callback
+    assert updates == [{}]
+
+    client.notify(CHAR_UUID_WAVE_2_DATA, WAVE_2_DATA)
+    assert updates[-1]["radon_1day_avg"] == 9
+    assert updates[-1]["radon_1day_level"] == "good"
+    assert "radon_1day_avg" in subscription.device.sensor_timestamps
+
+    # The battery level is only sent in response to a command
+    await subscription.refresh()
+    assert client.writes == [(str(COMMAND_UUID_WAVE_2), b"\x6d")]
+    response = b"\x6d\x00" + struct.pack("<L2BH2B9H", *([0] * 13), 3000, 0)
+    client.notify(COMMAND_UUID_WAVE_2, response[:10])
+    assert len(updates) == 2
+    client.notify(COMMAND_UUID_WAVE_2, response[10:])
+    assert len(updates) == 3
+    assert updates[-1]["battery"] == 100
+    assert updates[-1]["radon_1day_avg"] == 9
+
+    await subscription.unsubscribe()
+    assert sorted(client.stopped) == sorted(
+        [str(CHAR_UUID_WAVE_2_DATA), str(COMMAND_UUID_WAVE_2)]
+    )
+    assert released == [True]
+    assert not subscription.is_connected
+    airtime = data.airtime[client.address]
+    assert (airtime.connections, airtime.writes, airtime.notifications) == (1, 1, 3)
+    assert airtime.bytes_notified == len(WAVE_2_DATA) + len(response)
+
+
+@pytest.mark.asyncio
+async def test_atom_notifications(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that Atom responses to a refresh update the device."""
+    client = _FakeClient(
+        [
+            _FakeService(
+                [
+                    _FakeCharacteristic(COMMAND_UUID_ATOM, ["write"]),
+                    _FakeCharacteristic(COMMAND_UUID_ATOM_NOTIFY, ["notify"]),
+                ]
+            )
+        ]
+    )
+    updates: list[dict[str, Any]] = []
+    _, subscription, _ = await _subscribe(
+        monkeypatch, client, AirthingsDeviceType.WAVE_ENHANCE_EU, updates
+    )
+
+    # A refresh before the response sends the same request again
+    await subscription.refresh()
+    await subscription.refresh()
+    [(uuid, request), (_, repeated)] = client.writes
+    assert uuid == str(COMMAND_UUID_ATOM)
+    assert repeated == request
+    response = (
+        bytes.fromhex("1001000345")
+        + request[2:4]
+        + cbor2.dumps([{0: "29999/0/31012", 2: {"CO2": 732.0}}])
+    )
+    for i in range(0, len(response), 20):
+        client.notify(COMMAND_UUID_ATOM_NOTIFY, response[i : i + 20])
+
+    assert updates[-1] == {"co2": 732.0}
+    await subscription.refresh()
+    assert client.writes[-1][1] != request
+
+
+@pytest.mark.asyncio
+async def test_callback_errors_are_logged(
+    monkeypatch: pytest.MonkeyPatch, caplog: pytest.LogCaptureFixture
+) -> None:
+    """Test that an error in the callback does not reach the Bluetooth stack."""
+    client = _FakeClient(
+        [_FakeService([_FakeCharacteristic(CHAR_UUID_WAVE_2_DATA, ["read", "notify"])])]
+    )
+    updates: list[dict[str, Any]] = []
+    _, subscription, _ = await _subscribe(
+        monkeypatch, client, AirthingsDeviceType.WAVE_RADON, updates
+    )
+    subscription._callback = lambda device: 1 / 0
+
+    client.notify(CHAR_UUID_WAVE_2_DATA, WAVE_2_DATA)
+
+    assert subscription.device.sensors["radon_1day_avg"] == 9
+    assert "Error in subscription callback" in caplog.text
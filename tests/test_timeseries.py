@@ -0,0 +1,106 @@
+import math
+import random
+import struct
+
+import pytest
+from airthings_ble.aggregator import Aggregate
+from airthings_ble.parser import AirthingsDevice
+from airthings_ble.timeseries import (
+    BitReader,
+    BitWriter,
+    CompressedSeries,
+    DeviceHistory,
+)
+
+
+def test_bits_round_trip() -> None:
+    """Test writing and reading bits of various lengths."""
+    writer = BitWriter()
+    fields = [(1, 1), (0b101, 3), (0xABCDEF, 24), ((1 << 64) - 1, 64), (0, 5)]
+    for value, bits in fields:
+        writer.write(value, bits)
+    reader = BitReader(writer.getvalue())
+    assert [reader.read(bits) for _, bits in fields] == [x for x, _ in fields]
+
+
+def test_series_round_trip() -> None:
+    """Test that irregular samples decode to the same values."""
+    rng = random.Random(42)
+    series = CompressedSeries(block_size=50, retention=None)
+    expected: list[tuple[int, float]] = []
+    timestamp = 1_700_000_000
+    value = 20.0
+    for i in range(400):
+        timestamp += rng.choice([60, 60, 60, 61, 59, 300, 5000, 100000])
+        if i % 7:
+            value = round(value + rng.uniform(-0.5, 0.5), 2)
+        sample = rng.choice([value, value, math.inf, -0.0, 1e-300])
+        series.append(timestamp, sample)
+        expected.append((timestamp, sample))
+
+    decoded = list(series.samples())
+    assert len(series) == len(decoded) == 400
+    assert [t for t, _ in decoded] == [t for t, _ in expected]
+    assert [struct.pack(">d", v) for _, v in decoded] == [
+        struct.pack(">d", v) for _, v in expected
+    ]
+
+    start, end = expected[100][0], expected[250][0]
+    assert list(series.samples(start, end)) == expected[100:250]
+
+
+def test_slow_series_compress_well() -> None:
+    """Test the size of a week of radon averages sampled every minute."""
+    series = CompressedSeries(retention=None)
+    for minute in range(7 * 24 * 60):
+        series.append(1_700_000_000 + minute * 60, float(40 + (minute // 60) % 5))
+    # 16 bytes per sample as two doubles
+    assert series.nbytes * 10 < len(series) * 16
+
+
+def test_retention_drops_old_blocks() -> None:
+    """Test that blocks older than the retention are dropped."""
+    series = CompressedSeries(block_size=10, retention=100)
+    for second in range(0, 1000, 5):
+        series.append(second, 1.0)
+    first_timestamp, _ = next(series.samples())
+    assert 800 <= first_timestamp <= 900
+    with pytest.raises(ValueError):
+        series.append(0, 1.0)
+
+
+def test_downsample() -> None:
+    """Test aggregating samples in buckets."""
+    series = CompressedSeries()
+    for second, value in ((0, 1.0), (30, 3.0), (60, 5.0), (150, 7.0)):
+        series.append(second, value)
+    assert series.downsample(60) == [
+        (0, Aggregate(1.0, 3.0, 2.0, 2)),
+        (60, Aggregate(5.0, 5.0, 5.0, 1)),
+        (120, Aggregate(7.0, 7.0, 7.0, 1)),
+    ]
+    assert series.downsample(60, start=60, end=120) == [
+        (60, Aggregate(5.0, 5.0, 5.0, 1))
+    ]
+
+
+def test_device_history() -> None:
+    """Test keeping the numeric sensors of readings."""
+    history = DeviceHistory()
+    for minute in range(3):
+        history.add(
+            AirthingsDevice(
+                address="A",
+                sensors={"humidity": 40.0 + minute, "radon_1day_level": "good"},
+            ),
+            timestamp=minute * 60,
+        )
+    assert list(history.samples("A", "humidity")) == [
+        (0, 40.0),
+        (60, 41.0),
+        (120, 42.0),
+    ]
+    assert history.series("A", "radon_1day_level") is None
+    assert history.nbytes > 0
+    history.remove("A")
+    assert list(history.samples("A", "humidity")) == []
@@ -0,0 +1,334 @@
+import asyncio
+import logging
+
+import pytest
+from airthings_ble import (
+    AirthingsBluetoothDeviceData,
+    AirthingsDeviceType,
+    UnsupportedDeviceError,
+)
+from airthings_ble.advertisement import parse_advertisement
+from airthings_ble.const import (
+    CHAR_UUID_DATETIME,
+    CHAR_UUID_DEVICE_NAME,
+    CHAR_UUID_FIRMWARE_REV,
+    CHAR_UUID_HARDWARE_REV,
+    CHAR_UUID_MANUFACTURER_NAME,
+    CHAR_UUID_SERIAL_NUMBER_STRING,
+    CHAR_UUID_WAVE_2_DATA,
+    MFCT_ID,
+)
+from airthings_ble.parser import AirthingsDevice, _store_sensors
+from bleak import BleakError
+from bleak.backends.device import BLEDevice
+from bleak.backends.scanner import AdvertisementData
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def _ble_device(address: str = "AA:BB:CC:DD:EE:FF") -> BLEDevice:
+    return BLEDevice(address=address, name=None, details=None)
+
+
+def _patch_update(
+    monkeypatch: pytest.MonkeyPatch,
+    data: AirthingsBluetoothDeviceData,
+    calls: list[str],
+    delay: float = 0.01,
+    error: Exception | None = None,
+) -> None:
+    async def _update_device(ble_device: BLEDevice) -> AirthingsDevice:
+        calls.append(ble_device.address)
+        await asyncio.sleep(delay)
+        if error is not None:
+            raise error
+        return AirthingsDevice(address=ble_device.address, sensors={"co2": 500.0})
+
+    monkeypatch.setattr(data, "_update_device", _update_device)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_updates_are_coalesced(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Test that concurrent updates for the same address share one update."""
+    data = AirthingsBluetoothDeviceData(logger=_LOGGER)
+    calls: list[str] = []
+    _patch_update(monkeypatch, data, calls)
+
+    results = await asyncio.gather(
+        data.update_device(_ble_device()),
+        data.update_device(_ble_device()),
+        data.update_device(_ble_device("11:22:33:44:55:66")),
+    )
+
+    assert calls == ["AA:BB:CC:DD:EE:FF", "11:22:33:44:55:66"]
+    assert results[0].sensors == results[1].sensors == {"co2": 500.0}
+    # Every caller gets its own copy of the result
+    assert results[0] is not results[1]
+    assert results[0].sensors is not results[1].sensors
+
+
+@pytest.mark.asyncio
+async def test_coalesced_update_error_is_shared(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Test that all waiting callers get the error of the shared update."""
+    data = AirthingsBluetoothDeviceData(logger=_LOGGER)
+    calls: list[str] = []
+    _patch_update(monkeypatch, data, calls, error=BleakError("boom"))
+
+    results = await asyncio.gather(
+        data.update_device(_ble_device()),
+        data.update_device(_ble_device()),
+        return_exceptions=True,
+    )
+
+    assert len(calls) == 1
+    assert all(isinstance(result, BleakError) for result in results)
+
+    # A new update is started once the failed one is done
+    with pytest.raises(BleakError):
+        await data.update_device(_ble_device())
+    assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_cancelled_caller_does_not_cancel_shared_update(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Test that cancelling one caller keeps the update alive for others."""
+    data = AirthingsBluetoothDeviceData(logger=_LOGGER)
+    calls: list[str] = []
+    _patch_update(monkeypatch, data, calls, delay=0.05)
+
+    first = asyncio.ensure_future(data.update_device(_ble_device()))
+    second = asyncio.ensure_future(data.update_device(_ble_device()))
+    await asyncio.sleep(0)
+    first.cancel()
+
+    device = await second
+    assert device.sensors == {"co2": 500.0}
+    assert len(calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_cache_ttl(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that fresh readings are served from the cache."""
+    data = AirthingsBluetoothDeviceData(logger=_LOGGER)
+    calls: list[str] = []
+    _patch_update(monkeypatch, data, calls, delay=0)
+
+    # Caching is disabled by default
+    await data.update_device(_ble_device())
+    await data.update_device(_ble_device())
+    assert len(calls) == 2
+
+    data.set_cache_ttl(60)
+    first = await data.update_device(_ble_device())
+    first.sensors["co2"] = 0.0
+    second = await data.update_device(_ble_device())
+    assert len(calls) == 3
+    assert second.sensors == {"co2": 500.0}
+
+    data.set_cache_ttl(0)
+    await data.update_device(_ble_device())
+    assert len(calls) == 4
+
+
+@pytest.mark.asyncio
+async def test_unsupported_model_is_rejected_before_connecting(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Test that an unsupported advertised model never connects."""
+    data = AirthingsBluetoothDeviceData(logger=_LOGGER)
+    calls: list[str] = []
+    _patch_update(monkeypatch, data, calls)
+
+    advertisement_data = AdvertisementData(
+        local_name=None,
+        manufacturer_data={MFCT_ID: (2960012345).to_bytes(4, "little")},
+        service_data={},
+        service_uuids=[],
+        tx_power=None,
+        rssi=-60,
+        platform_data=(),
+    )
+    with pytest.raises(UnsupportedDeviceError):
+        await data.update_device(_ble_device(), advertisement_data)
+    assert calls == []
+
+
+class _FakeDeviceInfoClient:
+    address = "AA:BB:CC:DD:EE:FF"
+
+    def __init__(self, values: dict[str, bytes | None] | None = None) -> None:
+        self.reads: list[str] = []
+        # Values of the characteristics, None for a failing read
+        self.values = values or {}
+
+    async def read_gatt_char(self, uuid: object) -> bytearray:
+        self.reads.append(str(uuid))
+        if (value := self.values.get(str(uuid), b"value")) is None:
+            raise BleakError("Read failed")
+        return bytearray(value)
+
+
+@pytest.mark.asyncio
+async def test_advertised_model_skips_model_read() -> None:
+    """Test that the advertised model is used, and the device info is read."""
+    data = AirthingsBluetoothDeviceData(logger=_LOGGER)
+    data._apply_advertisement(
+        parse_advertisement(None, {MFCT_ID: (2930123456).to_bytes(4, "little")})
+    )
+    client = _FakeDeviceInfoClient(
+        {
+            str(CHAR_UUID_SERIAL_NUMBER_STRING): None,
+            str(CHAR_UUID_DEVICE_NAME): b"Airthings Wave+",
+        }
+    )
+    device = AirthingsDevice()
+
+    await data._get_device_characteristics(client, device)
+
+    assert client.reads == [
+        str(CHAR_UUID_MANUFACTURER_NAME),
+        str(CHAR_UUID_SERIAL_NUMBER_STRING),
+        str(CHAR_UUID_DEVICE_NAME),
+        str(CHAR_UUID_FIRMWARE_REV),
+        str(CHAR_UUID_HARDWARE_REV),
+    ]
+    assert device.model == AirthingsDeviceType.WAVE_PLUS
+    # The advertised serial number is kept when the read fails
+    assert device.identifier == "2930123456"
+    assert device.name == "Airthings Wave+"
+
+
+@pytest.mark.asyncio
+async def test_device_info_replaces_advertisement() -> None:
+    """Test that the values read from the device replace the advertised ones."""
+    data = AirthingsBluetoothDeviceData(logger=_LOGGER)
+    data._apply_advertisement(parse_advertisement("AT#123456-2900Radon"))
+    client = _FakeDeviceInfoClient(
+        {str(CHAR_UUID_DEVICE_NAME): b"AT#123456-2900Radon Bedroom"}
+    )
+    device = AirthingsDevice()
+
+    await data._get_device_characteristics(client, device)
+
+    assert str(CHAR_UUID_DEVICE_NAME) in client.reads
+    assert device.model == AirthingsDeviceType.WAVE_GEN_1
+    assert device.name == "AT#123456-2900Radon Bedroom"
+
+
+def _patch_session(
+    monkeypatch: pytest.MonkeyPatch,
+    data: AirthingsBluetoothDeviceData,
+    values: dict[str, str | float | None],
+) -> list[bool]:
+    """Patch a session that reads `values` and then stalls."""
+    released: list[bool] = []
+
+    async def _establish_connection(
+        ble_device: BLEDevice, disconnect_future: asyncio.Future[bool]
+    ) -> _FakeDeviceInfoClient:
+        return _FakeDeviceInfoClient()
+
+    async def _release_connection(client: object, keep: bool) -> None:
+        released.append(keep)
+
+    async def _get_device_characteristics(client: object, device: object) -> None:
+        pass
+
+    async def _get_service_characteristics(
+        client: object, device: AirthingsDevice
+    ) -> None:
+        _store_sensors(device, device.sensors, values)
+        await asyncio.sleep(10)
+
+    monkeypatch.setattr(data, "_establish_connection", _establish_connection)
+    monkeypatch.setattr(data, "_release_connection", _release_connection)
+    monkeypatch.setattr(
+        data, "_get_device_characteristics", _get_device_characteristics
+    )
+    monkeypatch.setattr(
+        data, "_get_service_characteristics", _get_service_characteristics
+    )
+    return released
+
+
+@pytest.mark.asyncio
+async def test_deadline_returns_partial_data(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that values read before the deadline are returned."""
+    data = AirthingsBluetoothDeviceData(
+        logger=_LOGGER, update_deadline=0.01, cache_ttl=60
+    )
+    released = _patch_session(monkeypatch, data, {"co2": 500.0})
+
+    device = await data.update_device(_ble_device())
+
+    assert device.partial
+    assert device.sensors == {"co2": 500.0}
+    assert set(device.sensor_timestamps) == {"co2"}
+    # The connection state is unknown, so it is not kept
+    assert released == [False]
+    # Partial readings are not cached
+    await data.update_device(_ble_device())
+    assert released == [False, False]
+
+
+@pytest.mark.asyncio
+async def test_deadline_without_data_fails(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that an update that read nothing still fails."""
+    data = AirthingsBluetoothDeviceData(logger=_LOGGER, update_deadline=0.01)
+    _patch_session(monkeypatch, data, {})
+
+    with pytest.raises(TimeoutError):
+        await data.update_device(_ble_device())
+
+
+class _FakeCharacteristic:
+    def __init__(self, uuid: object) -> None:
+        self.uuid = str(uuid)
+
+
+class _FakeService:
+    def __init__(self, uuids: list[object]) -> None:
+        self.characteristics = [_FakeCharacteristic(x) for x in uuids]
+
+
+class _FakeSensorClient:
+    def __init__(self, values: dict[str, bytes]) -> None:
+        self.values = values
+        self.reads: list[str] = []
+
+    async def read_gatt_char(self, characteristic: _FakeCharacteristic) -> bytes:
+        self.reads.append(characteristic.uuid)
+        return self.values[characteristic.uuid]
+
+
+@pytest.mark.asyncio
+async def test_sensor_values_are_read_before_device_clock() -> None:
+    """Test that the sensor characteristics are read first."""
+    data = AirthingsBluetoothDeviceData(logger=_LOGGER)
+    client = _FakeSensorClient(
+        {
+            str(CHAR_UUID_DATETIME): bytes.fromhex("e8070c1f0c0000"),
+            str(CHAR_UUID_WAVE_2_DATA): bytes.fromhex(
+                "013860f009001100a709ffffffffffff0000ffff"
+            ),
+        }
+    )
+    device = AirthingsDevice()
+
+    await data._wave_sensor_data(
+        client,
+        device,
+        device.sensors,
+        _FakeService([CHAR_UUID_DATETIME, CHAR_UUID_WAVE_2_DATA]),
+    )
+
+    assert client.reads == [str(CHAR_UUID_WAVE_2_DATA), str(CHAR_UUID_DATETIME)]
+    assert device.sensors["radon_1day_avg"] == 9
+    assert device.sensor_timestamps.keys() == device.sensors.keys()
+    assert device.device_time is not None